@@ -1,21 +1,37 @@
 
+from backend.core.versioning import next_version
 
 
 class Component:
     _id_counter = 0
+    _id_partition = (0, 1)  # (offset, step), each worker of a cluster takes the ids equal to its offset mod step
 
     def __init__(self, **attributes):
         self.attributes = attributes
+        self.version = next_version()
+
+    def touch(self):
+        """Marks the component state as changed"""
+        from backend.core.rendercache import render_cache
+        self.version = next_version()
+        render_cache.invalidate(getattr(self, "id", None))
 
     @classmethod
     def list(cls):
         from backend.core.component_registry import COMPONENT_REGISTRY
         return [(key, value.desc()) for key, value in COMPONENT_REGISTRY.items()]
 
+    @classmethod
+    def partition_ids(cls, offset, step):
+        """Makes this process hand out only the ids equal to offset modulo step"""
+        cls._id_partition = (offset, step)
+
     @classmethod
     def _generate_id(cls):
         """Generates a unique ID for each component."""
+        offset, step = cls._id_partition
         cls._id_counter += 1
+        cls._id_counter += (offset - cls._id_counter) % step
         return cls._id_counter
 
     @classmethod
@@ -1,4 +1,6 @@
 from .tab import Tab
+from .versioning import next_version
+from .rendercache import render_cache
 
 
 class Dash:
@@ -6,6 +8,9 @@ class Dash:
         self._id = obj_id  # Set by Repo
         self.name = name
         self._tabs = {}
+        self.version = next_version()  # bumped when tabs are added or removed
+        self._index = {}  # component id -> (tab, row, col, component), maintained by the tabs
+        self.lsn = 0  # last operation log record applied to this dashboard
 
     def desc(self):
         return f"Dashboard {self.name}"
@@ -15,17 +20,24 @@ class Dash:
         return self._tabs[tab_name]
 
     def __setitem__(self, tab_name, tab):
+        if tab_name in self._tabs:
+            self._tabs[tab_name].drop_index()
+        tab.bind_index(self._index)
         self._tabs[tab_name] = tab
+        self.version = next_version()
 
     def __delitem__(self, tab_name):
+        self._tabs[tab_name].drop_index()
         del self._tabs[tab_name]
+        self.version = next_version()
 
     # Tab management
     def create(self, name):  # if given name in tabs raises the error else creates it
         if name in self._tabs:
             raise ValueError(f"Tab {name} already exists")
-        tab = Tab(name)
+        tab = Tab(name, self._index)
         self._tabs[name] = tab
+        self.version = next_version()
         return tab
 
     def get_tabs(self):
@@ -34,6 +46,69 @@ class Dash:
     def get_id(self):
         return self._id
 
+    def locate(self, comp_id):
+        """(tab, row, col, component) of a placed component, None if it is not on the dashboard"""
+        return self._index.get(comp_id)
+
+    def find_component(self, comp_id):
+        entry = self._index.get(comp_id)
+        return entry[3] if entry is not None else None
+
+    def components(self):
+        for tab in self._tabs.values():
+            for row in tab.get_rows():
+                for comp in row:
+                    if comp:
+                        yield comp
+
+    def current_version(self):
+        """Highest version of the dashboard, its tabs and its components"""
+        version = self.version
+        for tab in self._tabs.values():
+            version = max(version, tab.version)
+        for comp in self.components():
+            version = max(version, getattr(comp, "version", 0))
+        return version
+
+    def delta(self, since=0):
+        """Changes after the given version: tab list, layout of changed tabs and changed components"""
+        delta = {"id": self._id, "version": self.current_version()}
+        if self.version > since:
+            delta["name"] = self.name
+            delta["tab_names"] = list(self._tabs)
+        tabs = {name: [[comp.id if comp else None for comp in row] for row in tab.get_rows()]
+                for name, tab in self._tabs.items() if tab.version > since}
+        components = {comp.id: comp for comp in self.components() if getattr(comp, "version", 0) > since}
+        if tabs:
+            delta["tabs"] = tabs
+        if components:
+            delta["components"] = components
+        return delta
+
+    def apply_delta(self, delta):
+        """Applies the result of delta() to a local copy of the dashboard"""
+        if "name" in delta:
+            self.name = delta["name"]
+            for name, tab in self._tabs.items():
+                if name not in delta["tab_names"]:
+                    tab.drop_index()
+            self._tabs = {name: self._tabs.get(name) or Tab(name, self._index) for name in delta["tab_names"]}
+        changed = delta.get("components", {})
+        for comp_id in changed:
+            render_cache.invalidate(comp_id)
+        if "tabs" in delta:
+            known = {comp_id: entry[3] for comp_id, entry in self._index.items()}  # before any tab is reset
+            known.update(changed)
+            for name, rows in delta["tabs"].items():
+                self._tabs[name].set_rows([[known.get(comp_id) if comp_id is not None else None for comp_id in row]
+                                           for row in rows])
+        for comp_id, comp in changed.items():  # unchanged layouts still hold the old objects
+            entry = self._index.get(comp_id)
+            if entry is not None and entry[3] is not comp:
+                tab, row, col, _ = entry
+                tab.get_rows()[row][col] = comp
+                self._index[comp_id] = (tab, row, col, comp)
+
     def serialize(self):
         return {
             "id": self._id,
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class RenderCache:
+    """Size-bounded LRU cache of component views keyed by (component id, version, user)"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys = {}  # component id -> cached keys, for invalidation
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def render(self, component, user=None):
+        """Returns component.view(user), reusing the last render while the component is unchanged"""
+        if not getattr(component, "cache_view", True):  # view depends on more than the component state
+            return component.view(user)
+        key = (component.id, getattr(component, "version", 0), user)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        html = component.view(user)
+        with self._lock:
+            self._entries[key] = html
+            self._keys.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+        return html
+
+    def _forget(self, key):
+        keys = self._keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[key[0]]
+
+    def invalidate(self, component_id):
+        """Drops every cached render of a component"""
+        with self._lock:
+            for key in self._keys.pop(component_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+render_cache = RenderCache()
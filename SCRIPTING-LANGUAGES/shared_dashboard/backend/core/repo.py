@@ -1,3 +1,4 @@
+import time
 from .component import Component
 from .dash import Dash
 
@@ -16,19 +17,75 @@ class Repo:
         self._attached = {}
         self._next_id = 1
         self.components = Component  # Interface to Component class
+        self._stubs = {}  # id -> name of stored dashboards not loaded yet
+        self._loader = None  # dash id -> Dash, set by the server
+        self._idle_since = {}  # id -> time.monotonic() when the last user left
 
-    def create(self, **kwargs):
-        obj_id = str(self._next_id)
-        self._next_id += 1
+    def set_loader(self, loader):
+        self._loader = loader
+
+    def add_stub(self, obj_id, name):
+        """Registers a stored dashboard without loading it"""
+        obj_id = str(obj_id)
+        self._stubs[obj_id] = name
+        if obj_id.isdigit():
+            self._next_id = max(self._next_id, int(obj_id) + 1)
+
+    def is_stub(self, obj_id):
+        return str(obj_id) in self._stubs
+
+    def hydrate(self, obj_id):
+        """Loads a stub dashboard through the loader, returns the Dash or None"""
+        obj_id = str(obj_id)
+        if obj_id in self._objects:
+            return self._objects[obj_id]
+        if obj_id not in self._stubs or self._loader is None:
+            return None
+        dash = self._loader(obj_id)
+        if dash is not None:
+            self._objects[obj_id] = dash
+            self._idle_since[obj_id] = time.monotonic()
+            del self._stubs[obj_id]
+        return dash
+
+    def evict(self, obj_id):
+        """Turns an unattached dashboard back into a stub, returns the evicted Dash"""
+        obj_id = str(obj_id)
+        if self._attached.get(obj_id) or obj_id not in self._objects:
+            return None
+        dash = self._objects.pop(obj_id)
+        self._stubs[obj_id] = dash.name
+        self._attached.pop(obj_id, None)
+        self._idle_since.pop(obj_id, None)
+        return dash
+
+    def idle(self, seconds):
+        """Ids of loaded dashboards nobody has been attached to for the given time"""
+        now = time.monotonic()
+        return [obj_id for obj_id in self._objects
+                if not self._attached.get(obj_id) and now - self._idle_since.get(obj_id, now) >= seconds]
+
+    def create(self, obj_id=None, **kwargs):
+        """Creates a dashboard, under obj_id when a cluster router picked it"""
+        if obj_id is None:
+            obj_id = self._next_id
+        obj_id = str(obj_id)
+        if obj_id in self._objects or obj_id in self._stubs:
+            raise ValueError(f"Dashboard {obj_id} already exists")
+        if obj_id.isdigit():
+            self._next_id = max(self._next_id, int(obj_id) + 1)
         dash = Dash(obj_id, **kwargs)
         self._objects[obj_id] = dash
+        self._idle_since[obj_id] = time.monotonic()
         return obj_id
 
     def get_objects(self):
         return self._objects
 
     def list(self):
-        return [(obj_id, obj.desc()) for obj_id, obj in self._objects.items()]
+        items = [(obj_id, obj.desc()) for obj_id, obj in self._objects.items()]
+        items += [(obj_id, f"Dashboard {name}") for obj_id, name in self._stubs.items()]
+        return sorted(items, key=lambda item: (len(item[0]), item[0]))  # numeric order for numeric ids
 
     def listattached(self, user):
         return [(obj_id, obj.desc())
@@ -36,6 +93,9 @@ class Repo:
                 if user in self._attached.get(obj_id, set())]
 
     def attach(self, obj_id, user):
+        obj_id = str(obj_id)
+        if obj_id in self._stubs:
+            self.hydrate(obj_id)
         if str(obj_id) not in self._objects.keys():  # checks the object is created before if not raises an error
             return "Unknown object id"
         if obj_id not in self._attached:  # checks if it is attached before if not attaches
@@ -44,16 +104,21 @@ class Repo:
         return self._objects[str(obj_id)]  # return the object
 
     def detach(self, obj_id, user):
-        print(obj_id)
+        obj_id = str(obj_id)
         if obj_id in self._attached.keys() and user in self._attached[obj_id]:  # if attached by someone and user is the one
             # who attaches it then an detach
             self._attached[obj_id].remove(user)
+            if not self._attached[obj_id]:
+                self._idle_since[obj_id] = time.monotonic()
 
     def delete(self, obj_id): # if attached then raises the error else deletes the object
-        if obj_id in self._attached:
+        obj_id = str(obj_id)
+        if self._attached.get(obj_id):
             raise ValueError("Cannot delete attached object")
         if obj_id in self._objects:
             del self._objects[obj_id]
+        self._stubs.pop(obj_id, None)
+        self._idle_since.pop(obj_id, None)
 
 
 repo = Repo()
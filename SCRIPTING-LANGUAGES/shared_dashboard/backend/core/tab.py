@@ -1,35 +1,72 @@
+from .versioning import next_version
+
+
 class Tab:
 
-    def __init__(self, name):
+    def __init__(self, name, index=None):
         self.name = name
         self._rows = []
+        self.version = next_version()  # bumped on every layout change
+        # component id -> (tab, row, col, component), shared by all tabs of a Dash
+        self._index = index if index is not None else {}
+
+    def bind_index(self, index):
+        """Indexes this tab in the index of the dashboard it is added to"""
+        self._index = index
+        self._index_rows()
+
+    def drop_index(self):
+        for comp_id in [comp_id for comp_id, entry in self._index.items() if entry[0] is self]:
+            del self._index[comp_id]
+
+    def _index_rows(self, start=0):
+        for r in range(start, len(self._rows)):
+            for c, comp in enumerate(self._rows[r]):
+                if comp:
+                    self._index[comp.id] = (self, r, c, comp)
 
     def newrow(self, row=-1):
+        self.version = next_version()
         if row == -1:
             self._rows.append([])
         else:
             self._rows.insert(row + 1, [])
+            self._index_rows(row + 2)  # the rows below moved down
 
     def place(self, component, row, col=-1):
         while len(self._rows) <= row:
             self.newrow()
+        self.version = next_version()
+        previous = self._index.get(component.id)
+        if previous is not None:  # a component has one place, placing it again moves it
+            previous[0]._clear(previous[1], previous[2])
         # Place component
         if col == -1:
             self._rows[row].append(component)
+            col = len(self._rows[row]) - 1
         else:
             # Ensure column exists
             while len(self._rows[row]) <= col:
                 self._rows[row].append(None)  # makes the padding with None
+            self._clear(row, col)
             self._rows[row][col] = component  # insert mü olmali override mı etmeli
+        self._index[component.id] = (self, row, col, component)
+        component.version = self.version  # so a delta carries components placed after they were created
+
+    def _clear(self, row, col):
+        comp = self._rows[row][col]
+        if comp:
+            entry = self._index.get(comp.id)
+            if entry is not None and entry[0] is self and entry[1:3] == (row, col):
+                del self._index[comp.id]
+            self._rows[row][col] = None
+            self.version = next_version()
 
     def get_location(self, comp_id):
-        for ind1, row in enumerate(self._rows):
-            for ind2, comp in enumerate(row):
-                if not comp:
-                    continue
-                if comp.id == comp_id:
-                    return ind1, ind2
-        return -1, -1
+        entry = self._index.get(comp_id)
+        if entry is None or entry[0] is not self:
+            return -1, -1
+        return entry[1], entry[2]
 
     def __getitem__(self, pos):
         row, col = pos
@@ -37,16 +74,24 @@ class Tab:
 
     def __delitem__(self, pos):
         row, col = pos
-        self._rows[row][col] = None
+        self._clear(row, col)
+        self.version = next_version()
 
     def remove(self, component):
-        for row in self._rows:
-            if component in row:
-                row[row.index(component)] = None
+        self.version = next_version()
+        row, col = self.get_location(component.id)
+        if row != -1:
+            self._clear(row, col)
 
     def get_rows(self):
         return self._rows
 
+    def set_rows(self, rows):
+        self.drop_index()
+        self._rows = rows
+        self._index_rows()
+        self.version = next_version()
+
     def view(self):
         result = [f"Tab: {self.name}"]  # a simple view function to return currently used items
         for i, row in enumerate(self._rows):
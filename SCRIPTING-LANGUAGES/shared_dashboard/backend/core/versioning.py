@@ -0,0 +1,10 @@
+import itertools
+import uuid
+
+EPOCH = uuid.uuid4().hex  # changes on every server start, versions are only comparable within one epoch
+_clock = itertools.count(1)
+
+
+def next_version():
+    """Returns a process-wide, strictly increasing version stamp"""
+    return next(_clock)
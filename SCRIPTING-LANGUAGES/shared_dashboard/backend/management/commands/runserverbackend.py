@@ -9,10 +9,14 @@ class Command(BaseCommand):
         parser.add_argument(
             "--port", type=int, default=None, help="Port to listen on"
         )
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Threads for blocking component work"
+        )
 
     def handle(self, *args, **options):
         port = options.get("port")
-        server = DashboardServer(port=port, db_path="/Users/ahmetyigitturhan/Documents/script_web_dashboard/db.sqlite3")
+        server = DashboardServer(port=port, db_path="/Users/ahmetyigitturhan/Documents/script_web_dashboard/db.sqlite3",
+                                 max_workers=options.get("workers"))
 
         try:
             server.start()
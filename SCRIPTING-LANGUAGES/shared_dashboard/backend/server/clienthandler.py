@@ -1,47 +1,60 @@
+import copy
 import json
 import pickle
 import asyncio
 import websockets
-from typing import Optional, List, Tuple, Any
+from typing import Optional, Dict, Any
 import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from backend.core.repo import repo
+from backend.core.versioning import EPOCH
+from backend.server.protocol import parse_request, tag_response
+from backend.server.transfer import transfers
+from backend.widgets.dbpool import engine as query_engine
+from backend.widgets.dbwrite import writer as db_writer
+from backend.widgets.httpcache import http_cache
+from backend.widgets.sampler import sampler
+
+# (method, action) pairs that do not change the connection state and may run concurrently
+PIPELINED_COMMANDS = {
+    ("list", None),
+    ("stats", None),
+    ("dash", "list"),
+    ("component", "list"),
+    ("component", "trigger"),
+    ("component", "transfer"),
+}
 
 
 class WebSocketClientHandler:
     """Handles individual WebSocket client connections"""
 
-    def __init__(self, websocket, notification_manager, timer_thread, persistence, lock):
+    def __init__(self, websocket, notification_manager, scheduler, persistence, locks, executor, oplog=None):
         self.websocket = websocket
         self.notification_manager = notification_manager
-        self.timer_thread = timer_thread
+        self.scheduler = scheduler
+        self.executor = executor  # ComponentExecutor for blocking trigger work
         self.persistence = persistence
+        self.oplog = oplog  # OperationLog the mutations are written to before they are acknowledged
         self._user = None
-        self._components: List[Tuple[int, Any]] = []
+        self._created: Dict[int, Any] = {}  # components created here, found by id even before being placed
         self._attached_dash = None
         self._param_store = {}
         self._running = True
-        self.lock = lock
+        self.locks = locks  # LockManager: one lock per dashboard plus repo_lock
 
-    async def handle_notification(self, component, message):
+    async def handle_notification(self, event):
         try:
-            notification = {
-                "type": "notification",
-                "user": str(self._user),
-                "dashboard_id": str(self._attached_dash.get_id()),
-                "component": component.name,
-                "message": message
-            }
-            await self.websocket.send(json.dumps(notification))
+            await self.websocket.send(json.dumps(dict(event, user=str(self._user))))
         except Exception as e:
             print(f"Error sending notification: {e}")
 
-    async def handle_command(self, command_data: str) -> str:
+    async def handle_command(self, command_data) -> str:
         """Process a command from the client"""
         try:
-            command = json.loads(command_data)
+            command = json.loads(command_data) if isinstance(command_data, str) else command_data
             cmd, args = command['method'], command['data']
             print(cmd, args)
 
@@ -53,43 +66,90 @@ class WebSocketClientHandler:
                 return json.dumps({"status": "success", "message": f"Username set to {self._user}"})
 
             elif cmd == "list":
-                async with self.lock:
+                async with self.locks.repo_lock:
                     res = repo.list()
                 return json.dumps({"status": "success", "data": res})
 
+            elif cmd == "batch":
+                # run several commands in order and answer them in one message
+                responses = []
+                for sub_command in args['commands']:
+                    if sub_command.get('method') == "batch":
+                        responses.append(json.dumps({"status": "error", "message": "Nested batch"}))
+                    else:
+                        responses.append(await self.handle_command(sub_command))
+                return '{"status": "success", "data": [' + ', '.join(responses) + ']}'
+
+            elif cmd == "stats":
+                return json.dumps({"status": "success", "data": {"executor": self.executor.stats(),
+                                                                  "scheduler": self.scheduler.stats(),
+                                                                  "notifications": self.notification_manager.stats(),
+                                                                  "queries": query_engine.stats(),
+                                                                  "writes": db_writer.stats(),
+                                                                  "transfers": transfers.stats.as_dict(),
+                                                                  "http": http_cache.stats(),
+                                                                  "sampler": sampler.stats(),
+                                                                  "oplog": self.oplog.stats() if self.oplog else None}})
+
             elif cmd == "attach":
-                if self._attached_dash:
-                    return json.dumps({"status": "success", "data": pickle.dumps(self._attached_dash).decode('latin1')})
+                if self._attached_dash and str(self._attached_dash.get_id()) != str(args['id']):
+                    return json.dumps({"status": "error",
+                                       "message": f"Already attached to dashboard {self._attached_dash.get_id()}"})
                 try:
-                    async with self.lock:
-                        self._attached_dash = repo.attach(args['id'], self._user)
-                        await self.append_comps()
-                        await self.notification_manager.register(args['id'], self._user, self.handle_notification)
+                    if not self._attached_dash:
+                        error = await self.attach(args['id'])
+                        if error:
+                            return json.dumps({"status": "error", "message": error})
+                    if not args.get('snapshot', True):  # caller only wants the attachment, e.g. a pooled session
+                        return json.dumps({"status": "success", "data": {"id": self._attached_dash.get_id()}})
                     return json.dumps({"status": "success", "data": pickle.dumps(self._attached_dash).decode('latin1')})
                 except ValueError as e:
                     return json.dumps({"status": "error", "message": str(e)})
 
+            elif cmd == "sync":
+                if self._attached_dash and str(self._attached_dash.get_id()) != str(args['id']):
+                    return json.dumps({"status": "error",
+                                       "message": f"Already attached to dashboard {self._attached_dash.get_id()}"})
+                try:
+                    if not self._attached_dash:
+                        error = await self.attach(args['id'])
+                        if error:
+                            return json.dumps({"status": "error", "message": error})
+                    # versions from a previous server run mean nothing, send everything again
+                    since = int(args.get('since', 0)) if args.get('epoch') == EPOCH else 0
+                    async with self._dash_lock():
+                        delta = self._attached_dash.delta(since)
+                        if "components" in delta:
+                            delta["components"] = pickle.dumps(delta["components"]).decode('latin1')
+                    delta["epoch"] = EPOCH
+                    return json.dumps({"status": "success", "data": delta})
+                except ValueError as e:
+                    return json.dumps({"status": "error", "message": str(e)})
+
             elif cmd == "detach":
                 try:
                     if not self._attached_dash:
                         return json.dumps({"status": "error", "message": "Not attached to any dashboard"})
                     dash_id = self._attached_dash.get_id()
-                    async with self.lock:
+                    async with self.locks.repo_lock:
                         repo.detach(dash_id, self._user)
-                        for _, comp in self._components:
-                            self.timer_thread.remove_timer(comp)
+                    async with self.locks.dashboard(dash_id):
+                        self.scheduler.unwatch(self._attached_dash)
                         await self.notification_manager.unregister(dash_id, self._user)
                         self._attached_dash = None
                     return json.dumps({"status": "success", "message": f"Detached from dashboard {dash_id}"})
                 except Exception as e:
                     print(f"Exception at detach: {str(e)}")
-                    self.lock.release()
                     return json.dumps({"status": "error", "message": str(e)})
 
             elif cmd == "create":
                 try:
-                    async with self.lock:
+                    async with self.locks.repo_lock:
                         dash_id = repo.create(**args)
+                        self.persistence.mark_dirty(repo.get_objects()[dash_id])
+                        durable = self._log(repo.get_objects()[dash_id], {
+                            "op": "create", "args": {key: val for key, val in args.items() if key != "obj_id"}})
+                    await self._commit(durable)
                     return json.dumps({"status": "success", "message": f"Created dashboard {dash_id}"})
                 except Exception as e:
                     return json.dumps({"status": "error", "message": f"Error creating dashboard: {str(e)}"})
@@ -97,12 +157,16 @@ class WebSocketClientHandler:
             elif cmd == "dash":
                 try:
                     if args['action'] == 'create tab':
-                        async with self.lock:
+                        async with self._dash_lock():
                             tab = self._attached_dash.create(args['name'])
+                            self.persistence.mark_dirty(self._attached_dash)
+                            durable = self._log(self._attached_dash, {"op": "tab", "name": args['name']})
+                            await self.notification_manager.component_changed(self._attached_dash.get_id(), layout=True)
+                        await self._commit(durable)
 
                         return json.dumps({"status": "success", "data": tab.serialize()})
                     if args['action'] == "list":
-                        async with self.lock:
+                        async with self.locks.repo_lock:
                             res = repo.list()
                         return json.dumps({"status": "success", "data": {"dashboards": res}})
                 except Exception as e:
@@ -113,9 +177,19 @@ class WebSocketClientHandler:
                 try:
                     if args['action'] == "place":
                         row, col, component_id = int(args['row']), int(args['col']), int(args['comp_id'])
-                        async with self.lock:
+                        async with self._dash_lock():
                             comp = await self.find_component(component_id)
+                            record = {"op": "place", "tab": args['tab_name'], "row": row, "col": col,
+                                      "component": comp.id}
+                            if self._attached_dash.find_component(comp.id) is None:
+                                # a checkpoint may have dropped its create record, no snapshot holds it yet
+                                record["state"] = comp
                             self._attached_dash[args['tab_name']].place(comp, row, col)
+                            self.persistence.mark_dirty(self._attached_dash)
+                            durable = self._log(self._attached_dash, record)
+                            await self.notification_manager.component_changed(
+                                self._attached_dash.get_id(), comp, layout=True)
+                        await self._commit(durable)
                         return json.dumps({
                             "status": "success",
                             "message": f"Component {component_id} placed on {row}, {col} on {args['tab_name']}"
@@ -127,7 +201,7 @@ class WebSocketClientHandler:
                 if not self._attached_dash:
                     return json.dumps({"status": "error", "message": "Not attached to any dashboard"})
                 try:
-                    async with self.lock:
+                    async with self._dash_lock():
                         await self.save_dashboard(self._attached_dash)
                     return json.dumps({"status": "success", "message": "Dashboard saved successfully"})
                 except Exception as e:
@@ -137,21 +211,38 @@ class WebSocketClientHandler:
                 try:
                     action = args['action']
                     if action == "create":
-                        async with self.lock:
+                        if not self._attached_dash:
+                            return json.dumps({"status": "error", "message": "Not attached to any dashboard"})
+                        async with self.locks.repo_lock:  # component ids come from a process-wide counter
                             component = repo.components.create(args['type'])
+                        async with self._dash_lock():
                             for key, val in args['env'].items():
                                 component.env[key] = val
-                            self._components.append((component.id, component))
-                            if component.name != "URLGetter" or component.name != "MessageRotate":
-                                self.timer_thread.add_timer(component)
+                            self._created[component.id] = component
+                            if 'tab_name' in args:  # create and place in one round trip
+                                self._attached_dash[args['tab_name']].place(
+                                    component, int(args.get('row', 0)), int(args.get('col', -1)))
+                                self.persistence.mark_dirty(self._attached_dash)
+                            self.scheduler.add_component(self._attached_dash, component)
+                            record = {"op": "component", "component": component.id, "type": args['type'],
+                                      "env": dict(args['env'])}
+                            if 'tab_name' in args:
+                                record.update(tab=args['tab_name'], row=int(args.get('row', 0)),
+                                              col=int(args.get('col', -1)))
+                            durable = self._log(self._attached_dash, record)
                             try:
                                 notify_message = str(self._user) + " created " + component.name +" !"
-                                await self.notification_manager.notify(self._attached_dash.get_id(), component, notify_message)
+                                await self.notification_manager.notify(self._attached_dash.get_id(), component,
+                                                                       notify_message, actor=self._user)
                             except:
                                 pass
+                            if 'tab_name' in args:
+                                await self.notification_manager.component_changed(
+                                    self._attached_dash.get_id(), component, layout=True)
+                        await self._commit(durable)
                         return json.dumps({"status": "success", "data": {"id": component.id}})
                     elif action == "register":
-                        async with self.lock:
+                        async with self.locks.repo_lock:
                             repo.components.register(args['type'], eval(args['type']))
                         return json.dumps({
                             "status": "success",
@@ -159,14 +250,39 @@ class WebSocketClientHandler:
                         })
                     elif action == "trigger":
                         comp_id, event, params = int(args['id']), args['event'], args['params']
-                        async with self.lock:
+                        logged_params = copy.deepcopy(params)  # widgets may consume their params, e.g. Chat
+                        async with self._dash_lock():
                             component = await self.find_component(comp_id)
-                            result = component.trigger(event, params)
+                            result = await self.executor.trigger(component, event, params)
+                            if event in getattr(component, "read_events", ()):
+                                return json.dumps({"status": "success", "data": {"result": result}})
+                            self.persistence.mark_dirty(self._attached_dash)
+                            durable = None
+                            if event != "refresh" and event not in getattr(component, "external_events", ()):
+                                # values the widget set itself, e.g. the Chat ts, replace what the client sent
+                                for key in getattr(component, "stamped_params", ()):
+                                    if key in params:
+                                        logged_params[key] = params[key]
+                                durable = self._log(self._attached_dash, {"op": "trigger", "component": comp_id,
+                                                                          "event": event, "params": logged_params})
                             notify_message = str(self._user) + " made changes on " + component.name + " !"
-                            await self.notification_manager.notify(self._attached_dash.get_id(), component, notify_message)
+                            await self.notification_manager.notify(self._attached_dash.get_id(), component,
+                                                                   notify_message, actor=self._user)
+                            await self.notification_manager.component_changed(self._attached_dash.get_id(), component)
+                        await self._commit(durable)
                         return json.dumps({"status": "success", "data": {"result": result}})
+                    elif action == "transfer":
+                        # ticket for streaming a FileShare file over the transfer port
+                        component = await self.find_component(int(args['id']))
+                        if component is None or component.name != "FileShare":
+                            return json.dumps({"status": "error", "message": "Not a FileShare component"})
+                        ticket, offset = transfers.issue(args['direction'], component.resolve(args['filename']),
+                                                         self._attached_dash.get_id(), component, self._user,
+                                                         restart=bool(args.get('restart', False)))
+                        return json.dumps({"status": "success",
+                                           "data": {"ticket": ticket, "offset": offset, "port": transfers.port}})
                     elif action == "list":
-                        async with self.lock:
+                        async with self.locks.repo_lock:
                             res = repo.components.list()
                         return json.dumps({"status": "success", "data": {"components": res}})
 
@@ -179,6 +295,37 @@ class WebSocketClientHandler:
         except Exception as e:
             return json.dumps({"status": "error", "message": f"Error processing command: {str(e)}"})
 
+    async def attach(self, dash_id):
+        """Attaches the connection to a dashboard, returns an error message on failure"""
+        if repo.is_stub(dash_id):
+            async with self.locks.dashboard(dash_id):  # one connection loads it, the others wait
+                if repo.is_stub(dash_id):
+                    await asyncio.to_thread(repo.hydrate, dash_id)
+        async with self.locks.repo_lock:
+            dash = repo.attach(dash_id, self._user)
+        if isinstance(dash, str):
+            return dash
+        async with self.locks.dashboard(dash.get_id()):
+            self._attached_dash = dash
+            self.scheduler.watch(dash)
+            await self.notification_manager.register(dash.get_id(), self._user, self.handle_notification)
+        return None
+
+    def _log(self, dash, record):
+        """Appends a mutation of dash to the operation log, returns what _commit waits on"""
+        if self.oplog is None:
+            return None
+        return self.oplog.append(dash, dict(record, dash=dash.get_id()))
+
+    async def _commit(self, durable):
+        """Waits until a logged mutation is durable, outside the dashboard lock so commits group up"""
+        if durable is not None:
+            await durable
+
+    def _dash_lock(self):
+        """Lock of the currently attached dashboard"""
+        return self.locks.dashboard(self._attached_dash.get_id())
+
     async def save_dashboard(self, dash):
         """Async wrapper for dashboard saving"""
         try:
@@ -188,36 +335,47 @@ class WebSocketClientHandler:
             raise
 
     async def find_component(self, comp_id: int):
-        """Find component by ID"""
-        for c_id, comp in self._components:
-            if c_id == comp_id:
-                return comp
-        return None
+        """Find component by ID, through the index the dashboard shares with every connection"""
+        if self._attached_dash:
+            component = self._attached_dash.find_component(comp_id)
+            if component is not None:
+                return component
+        return self._created.get(comp_id)
 
-    async def append_comps(self):
-        """Append components from attached dashboard"""
-        if len(self._components) != 0:
-            return
-        for tab in self._attached_dash.get_tabs().values():
-            for rows in tab.get_rows():
-                for cmp in rows:
-                    if not cmp:
-                        continue
-                    self._components.append((cmp.id, cmp))
-                    self.timer_thread.add_timer(cmp)
+    def pipelined(self, command):
+        """True if the command can run concurrently with the other in-flight commands of this connection"""
+        method, args = command.get('method'), command.get('data') or {}
+        if method == "sync":
+            return self._attached_dash is not None  # a first sync attaches
+        return (method, args.get('action') if method in ("dash", "component") else None) in PIPELINED_COMMANDS
+
+    async def respond(self, command, request_id):
+        """Runs a command and sends its reply, returns False if the connection is gone"""
+        response = tag_response(await self.handle_command(command), request_id)
+        try:
+            await self.websocket.send(response)
+        except websockets.exceptions.ConnectionClosed:
+            return False
+        return True
 
     async def run(self):
         """Main WebSocket handler loop"""
+        inflight = set()
         try:
             while self._running:
                 try:
                     message = await self.websocket.recv()
                     if not message:
                         continue
-                    response = await self.handle_command(message)
-                    try:
-                        await self.websocket.send(response)
-                    except websockets.exceptions.ConnectionClosed:
+                    request_id, command = parse_request(message)
+                    if command is not None and self.pipelined(command):
+                        task = asyncio.create_task(self.respond(command, request_id))
+                        inflight.add(task)
+                        task.add_done_callback(inflight.discard)
+                        continue
+                    if inflight:  # state changing commands wait for everything sent before them
+                        await asyncio.gather(*inflight, return_exceptions=True)
+                    if not await self.respond(command if command is not None else message, request_id):
                         break
 
                 except websockets.exceptions.ConnectionClosedOK:
@@ -238,12 +396,14 @@ class WebSocketClientHandler:
                         break
 
         finally:
+            for task in inflight:
+                task.cancel()
             if self._attached_dash:
                 try:
-                    async with self.lock:
+                    async with self.locks.repo_lock:
                         repo.detach(self._attached_dash.get_id(), self._user)
+                    async with self._dash_lock():
                         await self.notification_manager.unregister(self._attached_dash.get_id(), self._user)
-                        for _, comp in self._components:
-                            self.timer_thread.remove_timer(comp)
+                        self.scheduler.unwatch(self._attached_dash)
                 except Exception as e:
                     print(f"Error during cleanup: {e}")
\ No newline at end of file
@@ -0,0 +1,134 @@
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of dashboard ids onto workers.
+
+    Every worker owns replicas points of the ring, a dashboard belongs to the first point after its
+    hash. Adding or removing a worker only moves the dashboards of the points it gains or loses.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        points = sorted((_hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [key for key, _ in points]
+        self._nodes = [node for _, node in points]
+        self.nodes = list(nodes)
+
+    def owner(self, key):
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[index]
+
+
+def socket_path(socket_dir, index):
+    return os.path.join(socket_dir, f"worker-{index}.sock")
+
+
+def run_worker(index, count, socket_dir, options):
+    """Entry point of a worker process: a DashboardServer owning its share of the dashboards"""
+    from backend.server.server import DashboardServer
+    from backend.widgets.dbwrite import writer
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt  # DashboardServer.start saves everything on the way out
+
+    signal.signal(signal.SIGTERM, terminate)
+    writer.configure(batch_size=options["write_batch"], flush_interval=options["write_interval"])
+    server = DashboardServer(None, db_path=options["db_path"], max_workers=options["max_workers"],
+                             type_limits=options["type_limits"], evict_after=options["evict_after"],
+                             transfer_port=options["transfer_port"] + index,
+                             socket_path=socket_path(socket_dir, index), shard=(index, count),
+                             oplog_dir=options["oplog_dir"] and os.path.join(options["oplog_dir"], f"worker-{index}"),
+                             compact_interval=options["compact_interval"])
+    server.start()
+
+
+class Supervisor:
+    """Starts the worker processes and restarts the ones that die.
+
+    A worker crashing in a loop is restarted with a growing delay, capped at max_backoff seconds,
+    the delay goes back to zero once a worker stayed up for stable seconds.
+    """
+
+    def __init__(self, count, socket_dir, options, max_backoff=30.0, stable=60.0):
+        self.count = count
+        self.socket_dir = socket_dir
+        self.options = options
+        self.max_backoff = max_backoff
+        self.stable = stable
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")  # no inherited loop, locks or sockets
+        self._processes = {}  # index -> Process
+        self._started = {}  # index -> time.monotonic() of the last start
+        self._backoff = {}  # index -> seconds to wait before the next restart
+        self._running = False
+
+    def _spawn(self, index):
+        path = socket_path(self.socket_dir, index)
+        if os.path.exists(path):
+            os.unlink(path)  # left behind by a crashed worker
+        process = self._context.Process(target=run_worker, name=f"dashboard-worker-{index}",
+                                        args=(index, self.count, self.socket_dir, self.options), daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+
+    def start(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self._running = True
+        for index in range(self.count):
+            self._spawn(index)
+
+    async def watch(self):
+        """Restarts dead workers until stop()"""
+        while self._running:
+            await asyncio.sleep(1)
+            for index, process in list(self._processes.items()):
+                if process.is_alive() or not self._running:
+                    continue
+                print(f"Worker {index} exited with code {process.exitcode}, restarting")
+                if time.monotonic() - self._started[index] > self.stable:
+                    self._backoff[index] = 0
+                await asyncio.sleep(self._backoff.get(index, 0))
+                self._backoff[index] = min(self.max_backoff, max(1.0, 2 * self._backoff.get(index, 0)))
+                self._spawn(index)
+                self.restarts += 1
+
+    def stop(self, timeout=10):
+        """Asks every worker to save and exit, kills the ones still running after timeout"""
+        self._running = False
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+
+    def stats(self):
+        return {"workers": self.count, "alive": sum(p.is_alive() for p in self._processes.values()),
+                "restarts": self.restarts}
+
+
+def run_cluster(port, count, options, socket_dir=None):
+    """Serves port through a router in front of count supervised worker processes"""
+    from backend.server.router import Router
+    socket_dir = socket_dir or os.path.join(tempfile.gettempdir(), f"dashboard-{port}")
+    supervisor = Supervisor(count, socket_dir, options)
+    try:
+        asyncio.run(Router(port, count, socket_dir, supervisor).serve())
+    except KeyboardInterrupt:
+        print("\nShutting down cluster...")
+    finally:
+        supervisor.stop()
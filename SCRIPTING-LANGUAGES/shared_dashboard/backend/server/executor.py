@@ -0,0 +1,132 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+DEFAULT_TYPE_LIMITS = {
+    "DBQuery": 4,
+    "DBUpdate": 8,  # writes are serialised by the per-database WriteQueue, triggers mostly wait on it
+    "FileShare": 2,
+    "FileWatch": 2,
+    "URLGetter": 4,
+}
+
+
+class _TypeStats:
+    def __init__(self):
+        self.queued = 0  # waiting for a concurrency slot of this component type
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def as_dict(self):
+        done = self.completed + self.failed
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": self.wait_total / done * 1000 if done else 0.0,
+            "avg_run_ms": self.run_total / done * 1000 if done else 0.0,
+            "max_run_ms": self.run_max * 1000,
+        }
+
+
+class ComponentExecutor:
+    """Runs blocking component work (trigger/refresh) on a bounded thread pool"""
+
+    def __init__(self, max_workers=8, type_limits=None, default_limit=4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="component")
+        self.max_workers = max_workers
+        self.type_limits = dict(DEFAULT_TYPE_LIMITS)
+        self.type_limits.update(type_limits or {})
+        self.default_limit = default_limit
+        self._semaphores = {}
+        self._stats = {}
+        self._stats_lock = Lock()  # stats are updated from worker threads too
+        self._loop = None
+
+    def bind(self, loop):
+        """Remembers the server loop so other threads can submit work"""
+        self._loop = loop
+
+    def _semaphore(self, type_name):
+        sem = self._semaphores.get(type_name)
+        if sem is None:
+            limit = min(self.type_limits.get(type_name, self.default_limit), self.max_workers)
+            sem = self._semaphores[type_name] = asyncio.Semaphore(limit)
+        return sem
+
+    def _type_stats(self, type_name):
+        stats = self._stats.get(type_name)
+        if stats is None:
+            stats = self._stats[type_name] = _TypeStats()
+        return stats
+
+    async def run(self, component, func, *args):
+        """Runs func(*args) in the pool, limited by the concurrency cap of the component type"""
+        type_name = component.type()
+        stats = self._type_stats(type_name)
+        queued_at = time.perf_counter()
+        with self._stats_lock:
+            stats.queued += 1
+        async with self._semaphore(type_name):
+            started = time.perf_counter()
+            with self._stats_lock:
+                stats.queued -= 1
+                stats.running += 1
+                stats.wait_total += started - queued_at
+            failed = False
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._stats_lock:
+                    stats.running -= 1
+                    stats.run_total += elapsed
+                    stats.run_max = max(stats.run_max, elapsed)
+                    if failed:
+                        stats.failed += 1
+                    else:
+                        stats.completed += 1
+
+    async def trigger(self, component, event, params):
+        try:
+            return await self.run(component, component.trigger, event, params)
+        finally:
+            if event not in getattr(component, "read_events", ()):
+                component.touch()
+
+    async def refresh(self, component):
+        """Runs component.refresh, a refresh returning False left the state as it was"""
+        changed = None
+        try:
+            changed = await self.run(component, component.refresh)
+            return changed
+        finally:
+            if changed is not False:
+                component.touch()
+
+    def submit_refresh(self, component):
+        """Thread-safe refresh submission for callers outside the event loop"""
+        if self._loop is None or self._loop.is_closed():
+            component.refresh()
+            component.touch()
+            return None
+        return asyncio.run_coroutine_threadsafe(self.refresh(component), self._loop)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_workers": self.max_workers,
+                "types": {name: stats.as_dict() for name, stats in self._stats.items()},
+            }
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,27 @@
+import asyncio
+
+
+class LockManager:
+    """Hands out one asyncio lock per dashboard and a separate lock for Repo bookkeeping"""
+
+    def __init__(self):
+        self._locks = {}
+        self.repo_lock = asyncio.Lock()  # short critical sections on the Repo singleton only
+
+    def dashboard(self, dash_id):
+        """Returns the lock guarding the given dashboard, creating it on first use"""
+        key = str(dash_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def discard(self, dash_id):
+        """Forgets the lock of a deleted dashboard if nobody is holding it"""
+        key = str(dash_id)
+        lock = self._locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
@@ -1,31 +1,166 @@
 import asyncio
+import time
+from collections import deque
+
+
+class _DeliveryStats:
+    def __init__(self):
+        self.delivered = 0
+        self.dropped = 0  # notifications pushed out of a full queue
+        self.coalesced = 0  # updates merged into one already queued
+        self.timeouts = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def as_dict(self):
+        return {
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "failed": self.failed,
+            "avg_latency_ms": self.latency_total / self.delivered * 1000 if self.delivered else 0.0,
+            "max_latency_ms": self.latency_max * 1000,
+        }
+
+
+def merge_update(queued, event):
+    """Folds an update event into a queued one.
+
+    A component keeps its "live" state only while every merged change of it came with one, a single
+    change without it means browsers have to fetch the component.
+    """
+    components = queued.setdefault("components", {})
+    live = queued.setdefault("live", {})
+    event_live = event.get("live", {})
+    for component_id, version in event.get("components", {}).items():
+        if component_id in event_live and (component_id not in components or component_id in live):
+            live[component_id] = event_live[component_id]
+        else:
+            live.pop(component_id, None)
+        components[component_id] = version
+    queued["layout"] = queued.get("layout", False) or event.get("layout", False)
+
+
+class _Recipient:
+    """Bounded send queue of one connection, drained by its own sender task"""
+
+    def __init__(self, callback, stats, queue_size, timeout):
+        self.callback = callback
+        self.stats = stats
+        self.timeout = timeout
+        self._queue = deque()  # [queued_at, event]
+        self._queue_size = queue_size
+        self._pending_update = None  # the queued update entry later updates merge into
+        self._ready = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._sender())
+
+    def put(self, event):
+        now = time.perf_counter()
+        if event.get("type") == "update" and self._pending_update is not None:
+            merge_update(self._pending_update[1], event)
+            self.stats.coalesced += 1
+            return
+        if len(self._queue) >= self._queue_size:
+            for entry in self._queue:
+                if entry is not self._pending_update:  # the oldest notification, state updates are kept
+                    self._queue.remove(entry)
+                    break
+            self.stats.dropped += 1
+        entry = [now, dict(event)]
+        self._queue.append(entry)
+        if event.get("type") == "update":
+            self._pending_update = entry
+        self._ready.set()
+
+    async def _sender(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self._queue:
+                entry = self._queue.popleft()
+                if entry is self._pending_update:
+                    self._pending_update = None
+                queued_at, event = entry
+                try:
+                    await asyncio.wait_for(self.callback(event), self.timeout)
+                except asyncio.TimeoutError:
+                    self.stats.timeouts += 1
+                    continue
+                except Exception as e:
+                    self.stats.failed += 1
+                    print(f"Error in notification callback: {e}")
+                    continue
+                latency = time.perf_counter() - queued_at
+                self.stats.delivered += 1
+                self.stats.latency_total += latency
+                self.stats.latency_max = max(self.stats.latency_max, latency)
+
+    def close(self):
+        self._task.cancel()
 
 
 class NotificationManager:
-    """Manages notifications for all clients"""
+    """Manages notifications for all clients.
 
-    def __init__(self):
+    publish() only enqueues: every connection has a bounded queue and a sender task, so a slow
+    websocket delays nobody but itself. Updates waiting in a queue are merged, and when a queue is
+    full its oldest notification is dropped.
+    """
+
+    def __init__(self, queue_size=64, send_timeout=5.0):
         self._observers = {}
         self._lock = asyncio.Lock()
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self._stats = _DeliveryStats()
 
     async def register(self, dash_id, user, callback):
         async with self._lock:
             if dash_id not in self._observers:
                 self._observers[dash_id] = {}
-            self._observers[dash_id][user] = callback
+            previous = self._observers[dash_id].get(user)
+            if previous is not None:
+                previous.close()
+            self._observers[dash_id][user] = _Recipient(callback, self._stats, self.queue_size, self.send_timeout)
 
     async def unregister(self, dash_id, user):
         async with self._lock:
             if dash_id in self._observers and user in self._observers[dash_id]:
-                del self._observers[dash_id][user]
+                self._observers[dash_id].pop(user).close()
                 if not self._observers[dash_id]:
                     del self._observers[dash_id]
 
-    async def notify(self, dash_id, component, message):
-        async with self._lock:
-            if dash_id in self._observers.keys():
-                for callback in self._observers[dash_id].values():
-                    try:
-                        await callback(component, message)
-                    except Exception as e:
-                        print(f"Error in notification callback: {e}")
+    async def notify(self, dash_id, component, message, actor=None):
+        await self.publish(dash_id, {
+            "type": "notification",
+            "dashboard_id": str(dash_id),
+            "component": component.name,
+            "actor": actor,
+            "message": message
+        })
+
+    async def publish(self, dash_id, event):
+        """Queues an event dict for every connection attached to the dashboard"""
+        for recipient in list(self._observers.get(dash_id, {}).values()):
+            recipient.put(event)
+
+    async def component_changed(self, dash_id, *components, layout=False):
+        """Tells the attached connections which components have new state.
+
+        Components with a live_state() send it along, browsers apply it without fetching them.
+        """
+        await self.publish(dash_id, {
+            "type": "update",
+            "dashboard_id": str(dash_id),
+            "components": {str(component.id): component.version for component in components},
+            "live": {str(component.id): component.live_state() for component in components
+                     if hasattr(component, "live_state")},
+            "layout": layout
+        })
+
+    def stats(self):
+        return dict(self._stats.as_dict(),
+                    recipients=sum(len(observers) for observers in self._observers.values()),
+                    queued=sum(len(r._queue) for observers in self._observers.values() for r in observers.values()))
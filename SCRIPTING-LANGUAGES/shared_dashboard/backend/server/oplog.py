@@ -0,0 +1,259 @@
+import asyncio
+import os
+import pickle
+import struct
+import zlib
+from threading import Condition, Thread
+from backend.server import snapshot
+
+_FRAME = struct.Struct("<II")  # payload length, crc32 of the payload
+_fsync = getattr(os, "fdatasync", os.fsync)
+
+
+def _encode(record):
+    try:
+        payload = snapshot.dumps(record)
+    except snapshot.SnapshotError:
+        payload = pickle.dumps(record)  # exotic trigger params, same fallback as the dashboard blobs
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _decode(payload):
+    return snapshot.loads(payload) if snapshot.is_snapshot(payload) else pickle.loads(payload)
+
+
+def _resolve(future, result, error=None):
+    if future.done():
+        return
+    if error is None:
+        future.set_result(result)
+    else:
+        future.set_exception(error)
+
+
+def _notify(loop, future, result, error=None):
+    """Resolves a future of another thread's loop, unless that loop is already gone"""
+    try:
+        loop.call_soon_threadsafe(_resolve, future, result, error)
+    except RuntimeError:
+        pass
+
+
+class OperationLog:
+    """Append-only log of dashboard mutations, written ahead of the snapshots in the database.
+
+    Records get increasing log sequence numbers (lsn) and are written by one thread: everything
+    appended while it writes goes out in the next write, so one fdatasync commits a whole group.
+    The log is a list of segment files named by their first lsn. A checkpoint rolls to a new segment,
+    snapshots the dashboards the old ones touched and drops them.
+    """
+
+    def __init__(self, directory, start_lsn=0):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pending = {}  # dash id -> Dash with records no snapshot covers yet
+        self._segments = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith(".log"))
+        self._lsn = max(start_lsn, self._scan())  # last assigned
+        self._cond = Condition()
+        self._buffer = bytearray()
+        self._waiters = []  # (loop, future) resolved once the buffer holding their record is durable
+        self._rolls = []  # (loop, future, lsn, buffer length) of requested segment rolls
+        self._fd = self._open_segment(self._lsn + 1)
+        self.commits = 0  # writes, each followed by one fdatasync
+        self.records = 0
+        self._running = True
+        self._thread = Thread(target=self._run, name="oplog-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def lsn(self):
+        return self._lsn
+
+    def _path(self, first_lsn):
+        return os.path.join(self.directory, f"{first_lsn:020d}.log")
+
+    def _open_segment(self, first_lsn):
+        if first_lsn not in self._segments:
+            self._segments.append(first_lsn)
+        return os.open(self._path(first_lsn), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _scan(self):
+        """Last lsn in the log, cutting off a record torn by a crash"""
+        last = 0
+        for record in self.records_after(0, repair=True):
+            last = record["lsn"]
+        return last
+
+    def records_after(self, lsn, repair=False):
+        """Records with a greater lsn than the given one, in log order"""
+        for first in list(self._segments):
+            path = self._path(first)
+            with open(path, "rb") as segment:
+                data = segment.read()
+            position = 0
+            while position < len(data):
+                if position + _FRAME.size > len(data):
+                    break
+                length, crc = _FRAME.unpack_from(data, position)
+                payload = data[position + _FRAME.size:position + _FRAME.size + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                position += _FRAME.size + length
+                record = _decode(payload)
+                if record["lsn"] > lsn:
+                    yield record
+            if position < len(data):
+                print(f"Operation log {path} ends with a torn record at byte {position}")
+                if repair:
+                    os.truncate(path, position)
+                return  # nothing after a torn record was acknowledged
+
+    def append(self, dash, record):
+        """Logs a mutation of dash that was just applied, returns a future resolved once it is durable.
+
+        Called under the dashboard lock, so the log order is the order the mutations were applied in.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            self._lsn += 1
+            record = dict(record, lsn=self._lsn)
+            self._buffer += _encode(record)
+            self._waiters.append((loop, future))
+            self._cond.notify()
+        dash.lsn = record["lsn"]
+        self.pending[dash.get_id()] = dash
+        return future
+
+    async def roll(self):
+        """Starts a new segment, returns the last lsn of the closed ones once they are durable"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            self._rolls.append((loop, future, self._lsn, len(self._buffer)))
+            self._cond.notify()
+        return await future
+
+    def take_pending(self):
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def drop_through(self, lsn):
+        """Deletes the closed segments holding only records up to lsn"""
+        with self._cond:
+            active = self._segments[-1] if self._fd is not None else None
+            for first, following in list(zip(self._segments, self._segments[1:] + [self._lsn + 1])):
+                if first != active and following - 1 <= lsn:
+                    os.unlink(self._path(first))
+                    self._segments.remove(first)
+
+    def size(self):
+        return sum(os.path.getsize(self._path(first)) for first in self._segments)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._buffer and not self._rolls:
+                    self._cond.wait()
+                if not self._running and not self._buffer and not self._rolls:
+                    return
+                data, self._buffer = self._buffer, bytearray()
+                waiters, self._waiters = self._waiters, []
+                rolls, self._rolls = self._rolls, []
+            # records appended after the last roll request belong to the new segment
+            cut = rolls[-1][3] if rolls else len(data)
+            error = self._write(data[:cut])
+            if rolls:
+                with self._cond:
+                    os.close(self._fd)
+                    self._fd = self._open_segment(rolls[-1][2] + 1)
+                error = self._write(data[cut:]) or error
+            self.commits += 1
+            self.records += len(waiters)
+            for loop, future in waiters:
+                _notify(loop, future, None, error)
+            for loop, future, lsn, _ in rolls:
+                _notify(loop, future, lsn, error)
+
+    def _write(self, data):
+        """Writes and syncs data to the active segment, returns the error if it failed"""
+        if not data:
+            return None
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+            _fsync(self._fd)
+        except OSError as e:
+            print(f"Error writing the operation log: {e}")
+            return e
+        return None
+
+    def close(self):
+        """Writes what is buffered and stops the writer"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+        with self._cond:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def stats(self):
+        return {"lsn": self._lsn, "commits": self.commits, "records": self.records,
+                "segments": len(self._segments), "pending": len(self.pending)}
+
+
+def replay(repo, records, checkpoints):
+    """Applies the records no snapshot covers to the repo, returns the dashboards they changed"""
+    created = {}  # component id -> component created but not placed yet
+    changed = {}
+    for record in records:
+        dash_id = record["dash"]
+        if record["lsn"] <= checkpoints.get(dash_id, 0):
+            continue
+        try:
+            dash = _apply(repo, record, created)
+        except Exception as e:
+            print(f"Error replaying operation {record['lsn']} ({record['op']}): {e}")
+            continue
+        if dash is not None:
+            dash.lsn = record["lsn"]
+            changed[dash_id] = dash
+    return changed
+
+
+def _apply(repo, record, created):
+    op, dash_id = record["op"], record["dash"]
+    if op == "create":
+        if not repo.is_stub(dash_id) and dash_id not in repo.get_objects():
+            repo.create(obj_id=dash_id, **record["args"])
+        return repo.hydrate(dash_id) if repo.is_stub(dash_id) else repo.get_objects()[dash_id]
+    dash = repo.hydrate(dash_id) if repo.is_stub(dash_id) else repo.get_objects().get(dash_id)
+    if dash is None:
+        return None
+    if op == "tab":
+        if record["name"] not in dash.get_tabs():
+            dash.create(record["name"])
+    elif op == "component":
+        component = repo.components.create(record["type"])
+        component.id = record["component"]
+        repo.components._id_counter = max(repo.components._id_counter, component.id)
+        component.env.update(record["env"])
+        created[component.id] = component
+        if "tab" in record:
+            dash[record["tab"]].place(component, record["row"], record["col"])
+    elif op == "place":
+        component = dash.find_component(record["component"]) or created.get(record["component"])
+        if component is None:  # created before the last checkpoint, the record carries its state
+            component = record["state"]
+            repo.components._id_counter = max(repo.components._id_counter, component.id)
+        dash[record["tab"]].place(component, record["row"], record["col"])
+    elif op == "trigger":
+        component = dash.find_component(record["component"]) or created.get(record["component"])
+        if component is None:  # unplaced and created before the last checkpoint, a later place has its state
+            return None
+        component.replay(record["event"], record["params"])
+        component.touch()
+    return dash
@@ -1,5 +1,11 @@
 import sqlite3
 import pickle
+from threading import Event, Lock, RLock, Thread
+from backend.server import snapshot
+from backend.widgets.chatstore import ChatArchive
+
+# large component fields -> attribute holding them; stored in component_fields and loaded on first access
+LARGE_FIELDS = {"messages": "_history"}
 
 
 def _serialize_tab(tab):
@@ -10,13 +16,108 @@ def _serialize_tab(tab):
     }
 
 
+UPSERT_DASHBOARD = """
+    INSERT OR REPLACE INTO dashboards (id, name, data)
+    VALUES (?, ?, ?)
+"""
+UPSERT_COMPONENT = """
+    INSERT INTO components (id, tab_name, dashboard_id, row, col, type, data)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (dashboard_id, id) DO UPDATE SET
+        tab_name = excluded.tab_name, row = excluded.row, col = excluded.col,
+        type = excluded.type, data = excluded.data
+"""
+UPSERT_FIELD = """
+    INSERT OR REPLACE INTO component_fields (dashboard_id, component_id, field, data)
+    VALUES (?, ?, ?, ?)
+"""
+DELETE_COMPONENT = "DELETE FROM components WHERE dashboard_id = ? AND id = ?"
+DELETE_FIELDS = "DELETE FROM component_fields WHERE dashboard_id = ? AND component_id = ?"
+INSERT_CHAT_MESSAGE = """
+    INSERT OR REPLACE INTO chat_messages (dashboard_id, component_id, seq, ts, user, text)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+DELETE_CHAT_MESSAGES = "DELETE FROM chat_messages WHERE dashboard_id = ? AND component_id = ?"
+UPSERT_CHECKPOINT = "INSERT OR REPLACE INTO oplog_checkpoints (dashboard_id, lsn) VALUES (?, ?)"
+
+
+class _SavedState:
+    """What the database holds for one dashboard, in terms of versions"""
+
+    def __init__(self):
+        self.layout = None  # (dash version, {tab name: tab version})
+        self.components = {}  # component id -> (version, tab name, row, col)
+        self.lsn = 0  # last operation log record the stored state includes
+
+
+def _layout(dash):
+    return dash.version, {name: tab.version for name, tab in dash.get_tabs().items()}
+
+
+def _placements(dash):
+    """component id -> (component, tab name, row, col) for every placed component"""
+    placements = {}
+    for tab in dash.get_tabs().values():
+        for r, row in enumerate(tab.get_rows()):
+            for c, component in enumerate(row):
+                if component is not None:
+                    placements[component.id] = (component, tab.name, r, c)
+    return placements
+
+
+def _component_state(component):
+    return {
+        'env': component.env,
+        'param': component.param,
+        'attributes': {
+            'name': component.name,
+            'title': component.title,
+            'height': component.height,
+            'width': component.width,
+            'refresh_interval': component.refresh_interval
+        }
+    }
+
+
 class DashboardPersistence:
-    def __init__(self, db_path="dashboards.db"):
+    def __init__(self, db_path="dashboards.db", fmt="snapshot"):
         self.db_path = db_path
+        self.fmt = fmt  # "snapshot" or the legacy "pickle" layout
+        self._conn = None
+        self._db_lock = RLock()  # the connection is shared by the loop thread, to_thread workers and the flusher
+        self._saved = {}  # dash id -> _SavedState
+        self._flusher = None
         self._init_db()
 
+    def _connection(self):
+        """Long-lived connection in WAL mode, opened on first use"""
+        if self._conn is None:
+            # cluster workers share the file, wait for another process' write instead of failing
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _dumps(self, value):
+        if self.fmt == "snapshot":
+            try:
+                return snapshot.dumps(value)
+            except snapshot.SnapshotError:
+                pass  # exotic env values, fall back to pickle for this blob
+        return pickle.dumps(value)
+
+    @staticmethod
+    def _loads(blob):
+        return snapshot.loads(blob) if snapshot.is_snapshot(blob) else pickle.loads(blob)
+
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._db_lock, self._connection() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS dashboards (
                     id TEXT PRIMARY KEY,
@@ -39,56 +140,173 @@ class DashboardPersistence:
                 )
             """)
 
-    def save_dashboard(self, dash):
-        with sqlite3.connect(self.db_path) as conn:
-            # Serialize dashboard data
-            dash_data = pickle.dumps({
-                'name': dash.name,
-                '_tabs': {name: _serialize_tab(tab)
-                          for name, tab in dash.get_tabs().items()}
-            })
-
-            # Save dashboard
             conn.execute("""
-                INSERT OR REPLACE INTO dashboards (id, name, data)
-                VALUES (?, ?, ?)
-            """, (dash.get_id(), dash.name, dash_data))
-
-            # Save components
-            for tab in dash.get_tabs().values():
-                conn.execute("""
-                    DELETE FROM components
-                    WHERE dashboard_id = ? AND tab_name = ?
-            """, (dash.get_id(), tab.name))
-                for row in tab.get_rows():
-                    for component in row:
-                        if component is not None:
-                            comp_data = pickle.dumps({
-                                'env': component.env,
-                                'param': component.param,
-                                'attributes': {
-                                    'name': component.name,
-                                    'title': component.title,
-                                    'height': component.height,
-                                    'width': component.width,
-                                    'refresh_interval': component.refresh_interval
-                                },
-                                'messages': component.messages if hasattr(component, 'messages') else []
-                            })
-
-                            try:
-                                r, c = tab.get_location(component.id)
-                                conn.execute("""
-                                    INSERT INTO components 
-                                    (id, tab_name, dashboard_id, row, col, type, data)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                                """, (component.id, tab.name, dash.get_id(), r, c,
-                                      component.type(), comp_data))
-                            except:
-                                continue
+                CREATE TABLE IF NOT EXISTS component_fields (
+                    dashboard_id TEXT,
+                    component_id INTEGER,
+                    field TEXT,
+                    data BLOB,
+                    PRIMARY KEY (dashboard_id, component_id, field)
+                )
+            """)
+
+            # chat messages pushed out of the in-memory ring buffer
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    dashboard_id TEXT,
+                    component_id INTEGER,
+                    seq INTEGER,
+                    ts REAL,
+                    user TEXT,
+                    text TEXT,
+                    PRIMARY KEY (dashboard_id, component_id, seq)
+                )
+            """)
+
+            # operation log position each stored dashboard includes, replay starts after it
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS oplog_checkpoints (
+                    dashboard_id TEXT PRIMARY KEY,
+                    lsn INTEGER
+                )
+            """)
+
+            # older databases may hold duplicate rows from full rewrites, keep the newest one
+            conn.execute("""
+                DELETE FROM components WHERE rowid NOT IN (
+                    SELECT MAX(rowid) FROM components GROUP BY dashboard_id, id
+                )
+            """)
+            conn.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS components_dashboard_component
+                ON components (dashboard_id, id)
+            """)
+
+    def list_dashboard_ids(self):
+        with self._db_lock:
+            return [dash_id for (dash_id,) in self._connection().execute("SELECT id FROM dashboards")]
+
+    def list_dashboards(self):
+        """(id, name) of every stored dashboard, without loading its components"""
+        with self._db_lock:
+            rows = self._connection().execute("SELECT id, data FROM dashboards").fetchall()
+        return [(dash_id, self._loads(data)['name']) for dash_id, data in rows]
+
+    def max_component_id(self):
+        with self._db_lock:
+            row = self._connection().execute("SELECT MAX(id) FROM components").fetchone()
+        return row[0] or 0
+
+    def checkpoints(self):
+        """dash id -> last operation log record its stored state includes"""
+        with self._db_lock:
+            return dict(self._connection().execute("SELECT dashboard_id, lsn FROM oplog_checkpoints"))
+
+    def forget(self, dash_id):
+        """Drops the saved state kept for an evicted dashboard"""
+        with self._db_lock:
+            self._saved.pop(dash_id, None)
+
+    def save_dashboard(self, dash):
+        """Writes only what changed since the last save of this dashboard, in one transaction"""
+        dash_id = dash.get_id()
+        with self._db_lock:
+            saved = self._saved.setdefault(dash_id, _SavedState())
+            lsn = dash.lsn  # read before the state, like the versions below
+            layout = _layout(dash)
+            placements = _placements(dash)
+            conn = self._connection()
+            written = {}
+            with conn:
+                if layout != saved.layout:
+                    dash_data = self._dumps({
+                        'name': dash.name,
+                        '_tabs': {name: _serialize_tab(tab)
+                                  for name, tab in dash.get_tabs().items()}
+                    })
+                    conn.execute(UPSERT_DASHBOARD, (dash_id, dash.name, dash_data))
+
+                rows, fields, spilled = [], [], []
+                for comp_id, (component, tab_name, r, c) in placements.items():
+                    spilled.extend(self._spilled_messages(dash_id, component))
+                    # read the version before the state, a concurrent change then shows up next time
+                    key = (component.version, tab_name, r, c)
+                    written[comp_id] = key
+                    if saved.components.get(comp_id) == key:
+                        continue
+                    state = _component_state(component)
+                    if self.fmt == "snapshot":
+                        fields.extend(self._large_fields(dash_id, component))
+                    else:
+                        state['messages'] = component.messages if hasattr(component, 'messages') else []
+                    rows.append((comp_id, tab_name, dash_id, r, c, component.type(), self._dumps(state)))
+
+                removed = [(dash_id, comp_id) for comp_id in saved.components if comp_id not in placements]
+                if rows:
+                    conn.executemany(UPSERT_COMPONENT, rows)
+                if fields:
+                    conn.executemany(UPSERT_FIELD, fields)
+                if spilled:
+                    conn.executemany(INSERT_CHAT_MESSAGE, spilled)
+                if removed:
+                    conn.executemany(DELETE_COMPONENT, removed)
+                    conn.executemany(DELETE_FIELDS, removed)
+                    conn.executemany(DELETE_CHAT_MESSAGES, removed)
+                if lsn != saved.lsn:
+                    conn.execute(UPSERT_CHECKPOINT, (dash_id, lsn))
+
+            saved.layout = layout
+            saved.components = written
+            saved.lsn = lsn
+
+    def _mark_clean(self, dash):
+        """Records a freshly loaded dashboard as identical to the database"""
+        saved = self._saved.setdefault(dash.get_id(), _SavedState())
+        saved.layout = _layout(dash)
+        saved.components = {comp_id: (component.version, tab_name, r, c)
+                            for comp_id, (component, tab_name, r, c) in _placements(dash).items()}
+        saved.lsn = dash.lsn
+
+    def _large_fields(self, dash_id, component):
+        for field, attr in LARGE_FIELDS.items():
+            value = getattr(component, attr, None)
+            if value is None or isinstance(value, snapshot.LazyField):
+                continue  # never loaded since the last save, so it is unchanged
+            if hasattr(value, "to_state"):
+                value = value.to_state()
+            yield dash_id, component.id, field, self._dumps(value)
+
+    def _spilled_messages(self, dash_id, component):
+        """Rows for the chat messages that left the in-memory history since the last save"""
+        history = getattr(component, "_history", None)
+        if history is None or not hasattr(history, "take_spilled"):
+            return []
+        if history.archive is None:
+            history.archive = ChatArchive(self.db_path, dash_id, component.id)
+        return [(dash_id, component.id, seq, ts, user, text) for seq, ts, user, text in history.take_spilled()]
+
+    # Batched autosave
+    def start_autosave(self, interval=5.0):
+        if self._flusher is None:
+            self._flusher = AutoSaveFlusher(self, interval)
+            self._flusher.start()
+
+    def mark_dirty(self, dash):
+        """Queues a dashboard for the next autosave batch"""
+        if self._flusher is not None:
+            self._flusher.mark_dirty(dash)
+
+    def stop_autosave(self):
+        if self._flusher is not None:
+            self._flusher.stop()
+            self._flusher = None
 
     def load_dashboard(self, dash_id):
-        with sqlite3.connect(self.db_path) as conn:
+        """Builds the stored dashboard under its own id, without registering it in the repo"""
+        from backend.core.component import Component
+        from backend.core.dash import Dash
+        with self._db_lock:
+            conn = self._connection()
             cursor = conn.execute(
                 "SELECT data FROM dashboards WHERE id = ?",
                 (dash_id,)
@@ -97,41 +315,89 @@ class DashboardPersistence:
             if not row:
                 return None
 
-            dash_data = pickle.loads(row[0])
-            from backend.core.repo import repo
-            dash = repo.create(name=dash_data['name'])
+            dash_data = self._loads(row[0])
+            dash = Dash(dash_id, dash_data['name'])
+            checkpoint = conn.execute("SELECT lsn FROM oplog_checkpoints WHERE dashboard_id = ?",
+                                      (dash_id,)).fetchone()
+            dash.lsn = checkpoint[0] if checkpoint else 0
 
             cursor = conn.execute(
                 "SELECT id, tab_name, type, data, row, col FROM components WHERE dashboard_id = ?",
                 (dash_id,)
             )
-            components = []
-            for id, tab_name, comp_type, comp_data, cr, cc in cursor.fetchall():
-                comp_data = pickle.loads(comp_data)
-                component = repo.components.create(comp_type)
+            rows = cursor.fetchall()
+            # only the keys here, the blobs stay in the database until a component needs them
+            large_fields = set(conn.execute(
+                "SELECT component_id, field FROM component_fields WHERE dashboard_id = ?",
+                (dash_id,)
+            ).fetchall())
+
+            components = {}  # tab name -> [(component, row, col)]
+            for id, tab_name, comp_type, comp_data, cr, cc in rows:
+                comp_data = self._loads(comp_data)
+                component = Component.create(comp_type)
                 component.id = id
                 component.env.update(comp_data['env'])
                 component.param.update(comp_data['param'])
-                if 'messages' in comp_data.keys():
+                if 'messages' in comp_data.keys():  # pickle layout keeps the history inline
                     component.messages = comp_data['messages']
+                for field, attr in LARGE_FIELDS.items():
+                    if (id, field) in large_fields and hasattr(component, attr):
+                        setattr(component, attr, snapshot.LazyField(self.db_path, dash_id, id, field, []))
                 for key, value in comp_data['attributes'].items():
                     setattr(component, key, value)
 
-                components.append((component, tab_name, cr, cc))
-                repo.components._id_counter += 1
+                components.setdefault(tab_name, []).append((component, cr, cc))
 
-            dash = repo.get_objects()[dash]
             for tab_name, tab_data in dash_data['_tabs'].items():
                 tab = dash.create(tab_name)
-                self._deserialize_tab(tab, components)
+                self._deserialize_tab(tab, components.get(tab_name, ()))
 
+            self._mark_clean(dash)
             return dash
 
     @classmethod
     def _deserialize_tab(cls, tab, components):
-        for comp, tn, r, c in components:
-            if tn == tab.name:
-                tab.place(comp, r, c)
+        for comp, r, c in components:
+            tab.place(comp, r, c)
+
+
+class AutoSaveFlusher(Thread):
+    """Background thread writing the dashboards marked dirty in batches"""
+
+    def __init__(self, persistence, interval=5.0):
+        super().__init__(daemon=True)
+        self.persistence = persistence
+        self.interval = interval
+        self._dirty = {}
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._running = True
+
+    def mark_dirty(self, dash):
+        with self._lock:
+            self._dirty[dash.get_id()] = dash
+
+    def flush(self):
+        with self._lock:
+            pending, self._dirty = self._dirty, {}
+        for dash_id, dash in pending.items():
+            try:
+                self.persistence.save_dashboard(dash)
+            except Exception as e:
+                print(f"Error autosaving dashboard {dash_id}: {e}")
+
+    def run(self):
+        while self._running:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        self.join(timeout=self.interval)
+        self.flush()
 
 
 class AutoSaveDashboard:
@@ -145,9 +411,9 @@ class AutoSaveDashboard:
             result = func(repo_instance, dash_id, user)
             if dash_id in repo_instance._attached and \
                     not repo_instance._attached[dash_id]:
-                # Last user detached, save dashboard
+                # Last user detached, queue the dashboard for the next autosave batch
                 if dash_id in repo_instance._objects:
-                    self.persistence.save_dashboard(
+                    self.persistence.mark_dirty(
                         repo_instance._objects[dash_id]
                     )
             return result
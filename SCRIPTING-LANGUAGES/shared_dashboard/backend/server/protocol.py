@@ -7,6 +7,25 @@ class ProtocolError(Exception):
     pass
 
 
+def parse_request(message):
+    """Decodes a command, returns (request id or None, command dict or None if it is not valid JSON)"""
+    try:
+        command = json.loads(message)
+    except (TypeError, ValueError):
+        return None, None
+    if not isinstance(command, dict):
+        return None, None
+    return command.get('id'), command
+
+
+def tag_response(response, request_id):
+    """Copies the request id into a JSON object response so clients can match replies out of order"""
+    if request_id is None:
+        return response
+    # responses are always JSON objects, splice the id in instead of re-encoding a large payload
+    return '{"id": ' + json.dumps(request_id) + ', ' + response[1:]
+
+
 class Protocol:
     """Protocol handler for dashboard server communication"""
 
@@ -0,0 +1,275 @@
+import asyncio
+import itertools
+import json
+import websockets
+
+from backend.server.cluster import HashRing, socket_path
+from backend.server.protocol import parse_request, tag_response
+
+_ROUTER_ID = '{"id": "router-'  # replies to the router's own requests start with this
+
+
+def _strip_id(reply):
+    """Removes the router request id spliced in by tag_response"""
+    return '{' + reply[reply.index(', ', len(_ROUTER_ID)) + 2:]
+
+
+def _succeeded(reply):
+    return reply.startswith('{"status": "success"')
+
+
+class _Upstream:
+    """The connection of one client to one worker.
+
+    Replies to requests of the router are handed back to it, everything else the worker sends (command
+    replies and the notifications of the dashboard) is relayed to the client as is.
+    """
+
+    def __init__(self, websocket, client, on_close):
+        self.websocket = websocket
+        self._client = client
+        self._on_close = on_close
+        self._pending = {}  # router request id -> future of the raw reply
+        self._ids = itertools.count(1)
+        self._task = asyncio.create_task(self._relay())
+
+    async def call(self, command):
+        """Sends a command under a router request id, returns the raw reply"""
+        request_id = f"router-{next(self._ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self.websocket.send(json.dumps(dict(command, id=request_id)))
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def forward(self, message):
+        await self.websocket.send(message)
+
+    async def _relay(self):
+        try:
+            async for message in self.websocket:
+                if isinstance(message, str) and message.startswith(_ROUTER_ID):
+                    future = self._pending.get(message[8:message.index('"', len(_ROUTER_ID))])
+                    if future is not None and not future.done():
+                        future.set_result(message)
+                    continue
+                await self._client.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Worker connection closed"))
+            self._on_close(self)
+
+    async def close(self):
+        await self.websocket.close()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class RouterConnection:
+    """One client of the router, its commands go to the worker owning the dashboard they are about.
+
+    Dashboard-less commands (list, stats, create) are answered by the router from all workers, the
+    others go to the worker of the attached dashboard over an upstream opened on first use.
+    """
+
+    def __init__(self, router, websocket):
+        self.router = router
+        self.websocket = websocket
+        self._user = None  # data of the USER command, replayed on every new upstream
+        self._upstreams = {}  # worker -> _Upstream
+        self._opening = asyncio.Lock()
+        self._attached = None  # (dashboard id, worker) of the last successful attach
+        self._closing = False
+
+    async def upstream(self, worker):
+        async with self._opening:
+            upstream = self._upstreams.get(worker)
+            if upstream is None:
+                websocket = await self.router.connect(worker)
+                upstream = _Upstream(websocket, self.websocket, self._upstream_closed)
+                self._upstreams[worker] = upstream
+                if self._user is not None:
+                    await upstream.call({"method": "USER", "data": self._user})
+            return upstream
+
+    def _upstream_closed(self, upstream):
+        """A worker went away: the client reconnects and attaches again, reaching its restarted owner"""
+        if not self._closing:
+            self._closing = True
+            asyncio.create_task(self.websocket.close(1012, "Dashboard worker restarted"))
+
+    async def _call(self, worker, command):
+        upstream = await self.upstream(worker)
+        return _strip_id(await upstream.call(command))
+
+    def _route(self, command):
+        """Worker owning the dashboard the command names, or the one of the attached dashboard"""
+        commands = [command]
+        if command.get("method") == "batch":
+            commands = [sub for sub in (command.get("data") or {}).get("commands", []) if isinstance(sub, dict)]
+        for sub in commands:
+            data = sub.get("data") or {}
+            if sub.get("method") in ("attach", "sync") and "id" in data:
+                return self.router.ring.owner(str(data["id"]))
+        return self._attached[1] if self._attached else self.router.ring.nodes[0]
+
+    async def _fan_out(self, command):
+        """Sends the command to every worker, returns the decoded replies or an error reply"""
+        replies = await asyncio.gather(*(self._call(worker, command) for worker in self.router.ring.nodes))
+        for reply in replies:
+            if not _succeeded(reply):
+                return None, reply
+        return [json.loads(reply) for reply in replies], None
+
+    async def _list(self, command, key=None):
+        replies, error = await self._fan_out(command)
+        if error:
+            return error
+        items = []
+        for reply in replies:
+            items += reply["data"][key] if key else reply["data"]
+        items.sort(key=lambda item: (len(item[0]), item[0]))
+        return json.dumps({"status": "success", "data": {key: items} if key else items})
+
+    async def _stats(self, command):
+        replies, error = await self._fan_out(command)
+        if error:
+            return error
+        return json.dumps({"status": "success", "data": {"router": self.router.stats(),
+                                                         "workers": [reply["data"] for reply in replies]}})
+
+    async def _create(self, command):
+        """Picks the id of the new dashboard so the worker it hashes to creates it"""
+        async with self.router.create_lock:
+            if self.router.next_dash_id is None:  # first create since the router started
+                replies, error = await self._fan_out({"method": "list", "data": {}})
+                if error:
+                    return error
+                ids = [int(dash_id) for reply in replies for dash_id, _ in reply["data"] if dash_id.isdigit()]
+                self.router.next_dash_id = max(ids, default=0) + 1
+            dash_id = str(self.router.next_dash_id)
+            self.router.next_dash_id += 1
+        data = dict(command.get("data") or {}, obj_id=dash_id)
+        return await self._call(self.router.ring.owner(dash_id), dict(command, data=data))
+
+    async def _attach(self, command):
+        dash_id = str((command.get("data") or {}).get("id"))
+        if self._attached and self._attached[0] != dash_id:
+            return json.dumps({"status": "error", "message": f"Already attached to dashboard {self._attached[0]}"})
+        worker = self.router.ring.owner(dash_id)
+        reply = await self._call(worker, command)
+        if _succeeded(reply):
+            self._attached = (dash_id, worker)
+        return reply
+
+    async def _detach(self, command):
+        reply = await self._call(self._route(command), command)
+        if _succeeded(reply):
+            self._attached = None
+        return reply
+
+    async def handle(self, message):
+        request_id, command = parse_request(message)
+        if command is None:
+            await (await self.upstream(self._route({}))).forward(message)  # the worker answers the error
+            return
+        method, data = command.get("method"), command.get("data") or {}
+        action = data.get("action") if method in ("dash", "component") else None
+        if method == "USER":
+            self._user = data
+            for upstream in list(self._upstreams.values()):
+                await upstream.call(command)
+            reply = json.dumps({"status": "success", "message": f"Username set to {data.get('username')}"})
+        elif method == "list":
+            reply = await self._list(command)
+        elif method == "dash" and action == "list":
+            reply = await self._list(command, "dashboards")
+        elif method == "stats":
+            reply = await self._stats(command)
+        elif method == "create":
+            reply = await self._create(command)
+        elif method == "component" and action == "register":
+            replies, error = await self._fan_out(command)
+            reply = error or json.dumps(replies[0])
+        elif method in ("attach", "sync") and "id" in data:
+            reply = await self._attach(command)
+        elif method == "detach":
+            reply = await self._detach(command)
+        else:
+            self.router.forwarded += 1
+            await (await self.upstream(self._route(command))).forward(message)
+            return
+        await self.websocket.send(tag_response(reply, request_id))
+
+    async def run(self):
+        try:
+            async for message in self.websocket:
+                try:
+                    await self.handle(message)
+                except ConnectionError as e:
+                    print(f"Error routing client message: {e}")
+                    await self.websocket.send(json.dumps({"status": "error", "message": str(e)}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self._closing = True
+            for upstream in list(self._upstreams.values()):
+                await upstream.close()  # the workers detach the user
+
+
+class Router:
+    """Public endpoint of a cluster: accepts the clients and routes them to the worker processes.
+
+    Dashboards are partitioned over the workers by consistent hashing of their id, the workers listen
+    on unix sockets in socket_dir and are kept alive by the supervisor.
+    """
+
+    def __init__(self, port, count, socket_dir, supervisor=None, connect_timeout=10.0):
+        self.port = port
+        self.ring = HashRing(range(count))
+        self.socket_dir = socket_dir
+        self.supervisor = supervisor
+        self.connect_timeout = connect_timeout  # how long a worker may take to (re)start
+        self.next_dash_id = None  # set from the stored dashboards on the first create
+        self.create_lock = asyncio.Lock()
+        self.connections = 0
+        self.forwarded = 0
+
+    async def connect(self, worker):
+        """Opens a connection to a worker, waiting for it while it starts"""
+        deadline = asyncio.get_running_loop().time() + self.connect_timeout
+        while True:
+            try:
+                return await websockets.unix_connect(socket_path(self.socket_dir, worker),
+                                                     max_size=None, ping_interval=None)
+            except (OSError, websockets.exceptions.InvalidHandshake) as e:
+                if asyncio.get_running_loop().time() > deadline:
+                    raise ConnectionError(f"Worker {worker} is not answering: {e}")
+                await asyncio.sleep(0.1)
+
+    async def handle_client(self, websocket):
+        self.connections += 1
+        try:
+            await RouterConnection(self, websocket).run()
+        except Exception as e:
+            print(f"Error handling client: {e}")
+        finally:
+            self.connections -= 1
+
+    async def serve(self):
+        async with websockets.serve(self.handle_client, "0.0.0.0", self.port):
+            if self.supervisor is not None:  # only once the port is ours, a second cluster must not replace the sockets
+                self.supervisor.start()
+                asyncio.get_running_loop().create_task(self.supervisor.watch())
+            print(f"Router listening on port {self.port} for {len(self.ring.nodes)} workers")
+            await asyncio.Future()  # run forever
+
+    def stats(self):
+        stats = {"connections": self.connections, "forwarded": self.forwarded}
+        if self.supervisor is not None:
+            stats.update(self.supervisor.stats())
+        return stats
@@ -0,0 +1,214 @@
+import asyncio
+import heapq
+import itertools
+import random
+
+
+class TimerHandle:
+    """A scheduled refresh; cancel() is O(1), the heap entry is dropped when it reaches the top"""
+
+    __slots__ = ("component", "interval", "due", "cancelled")
+
+    def __init__(self, component, interval, due):
+        self.component = component
+        self.interval = interval
+        self.due = due
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _TimerStats:
+    def __init__(self):
+        self.fired = 0
+        self.late_total = 0.0
+        self.late_max = 0.0
+        self.overruns = 0  # ticks missed because the previous refresh was still running
+        self.failed = 0
+
+    def as_dict(self):
+        return {
+            "fired": self.fired,
+            "avg_late_ms": self.late_total / self.fired * 1000 if self.fired else 0.0,
+            "max_late_ms": self.late_max * 1000,
+            "overruns": self.overruns,
+            "failed": self.failed,
+        }
+
+
+class Scheduler:
+    """Refresh timers for all components, running on the server event loop.
+
+    Timers due within coalesce seconds of each other fire in the same wakeup. The first run of a
+    timer is delayed by a random fraction (jitter) of its interval so components created together
+    do not refresh in lockstep. Refreshes go to the ComponentExecutor; a component whose previous
+    refresh is still running skips the tick instead of queueing another one.
+
+    Connections subscribe to whole dashboards with watch/unwatch. A dashboard's components are
+    scheduled once when its first watcher arrives and cancelled when the last one leaves, however
+    many connections watch it in between. on_refresh(dash_id, component), if set, is awaited after
+    each successful refresh of a dashboard component that did not return False (nothing changed).
+    """
+
+    def __init__(self, executor=None, jitter=0.1, coalesce=0.01):
+        self.executor = executor
+        self.jitter = jitter
+        self.coalesce = coalesce
+        self._heap = []  # (due, seq, handle)
+        self._seq = itertools.count()  # tie breaker, components are not comparable
+        self._handles = {}  # component id -> live TimerHandle
+        self._running_refresh = set()  # component ids with a refresh in flight
+        self._stats = {}
+        self._watchers = {}  # dash id -> number of watching connections
+        self._dash_components = {}  # dash id -> {component id: component} scheduled for that dashboard
+        self._owners = {}  # component id -> dash id it is scheduled for
+        self.on_refresh = None
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        """Starts the scheduler task on the running loop"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def add_timer(self, component):
+        """Schedules periodic refreshes of a component, returns its handle (None if it does not refresh)"""
+        handle = self._handles.get(component.id)
+        if handle is not None:
+            return handle
+        interval = component.refresh_interval
+        if not interval or interval <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        handle = TimerHandle(component, interval, loop.time() + interval * (1 + random.uniform(0, self.jitter)))
+        self._handles[component.id] = handle
+        self._push(handle)
+        return handle
+
+    def remove_timer(self, component):
+        handle = self._handles.pop(component.id, None)
+        if handle is not None:
+            handle.cancel()
+            if len(self._heap) > 64 and len(self._heap) > 2 * len(self._handles):
+                self._compact()
+
+    def watch(self, dash):
+        """Adds a watcher to a dashboard, the first one starts the refresh of its components"""
+        dash_id = str(dash.get_id())
+        self._watchers[dash_id] = self._watchers.get(dash_id, 0) + 1
+        if self._watchers[dash_id] == 1:
+            for component in dash.components():
+                self.add_component(dash, component)
+
+    def unwatch(self, dash):
+        """Removes a watcher, the last one stops the refresh of the dashboard's components"""
+        dash_id = str(dash.get_id())
+        count = self._watchers.get(dash_id, 0) - 1
+        if count > 0:
+            self._watchers[dash_id] = count
+            return
+        self._watchers.pop(dash_id, None)
+        for component in self._dash_components.pop(dash_id, {}).values():
+            self._owners.pop(component.id, None)
+            self.remove_timer(component)
+
+    def add_component(self, dash, component):
+        """Schedules a component of a watched dashboard, e.g. one created after the first watcher"""
+        dash_id = str(dash.get_id())
+        if not self._watchers.get(dash_id):
+            return None
+        self._dash_components.setdefault(dash_id, {})[component.id] = component
+        self._owners[component.id] = dash_id
+        return self.add_timer(component)
+
+    def watchers(self, dash):
+        return self._watchers.get(str(dash.get_id()), 0)
+
+    def _push(self, handle):
+        heapq.heappush(self._heap, (handle.due, next(self._seq), handle))
+        if self._wakeup is not None and self._heap[0][2] is handle:
+            self._wakeup.set()  # new earliest timer, shorten the current wait
+
+    def _compact(self):
+        """Drops cancelled entries once they dominate the heap"""
+        self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+        heapq.heapify(self._heap)
+
+    def _type_stats(self, type_name):
+        stats = self._stats.get(type_name)
+        if stats is None:
+            stats = self._stats[type_name] = _TimerStats()
+        return stats
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    continue  # timers changed, look at the heap again
+                except asyncio.TimeoutError:
+                    pass
+
+            now = loop.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now + self.coalesce:
+                _, _, handle = heapq.heappop(self._heap)
+                if not handle.cancelled:
+                    due.append(handle)
+            for handle in due:
+                self._fire(handle, now)
+                handle.due += handle.interval
+                if handle.due <= now:
+                    handle.due = now + handle.interval  # fell behind, skip the missed ticks
+                heapq.heappush(self._heap, (handle.due, next(self._seq), handle))
+
+    def _fire(self, handle, now):
+        component = handle.component
+        stats = self._type_stats(component.type())
+        if component.id in self._running_refresh:
+            stats.overruns += 1
+            return
+        late = max(0.0, now - handle.due)
+        stats.fired += 1
+        stats.late_total += late
+        stats.late_max = max(stats.late_max, late)
+        self._running_refresh.add(component.id)
+        asyncio.get_running_loop().create_task(self._refresh(component, stats))
+
+    async def _refresh(self, component, stats):
+        try:
+            if self.executor:
+                changed = await self.executor.refresh(component)
+            else:
+                changed = await asyncio.to_thread(component.refresh)
+                if changed is not False:
+                    component.touch()
+            dash_id = self._owners.get(component.id)
+            if self.on_refresh is not None and dash_id is not None and changed is not False:
+                await self.on_refresh(dash_id, component)
+        except Exception as e:
+            stats.failed += 1
+            print(f"Error refreshing component: {e}")
+        finally:
+            self._running_refresh.discard(component.id)
+
+    def stats(self):
+        return {
+            "timers": len(self._handles),
+            "watched_dashboards": len(self._watchers),
+            "types": {name: stats.as_dict() for name, stats in self._stats.items()},
+        }
@@ -1,13 +1,20 @@
 import os
 import sys
+import time
 import asyncio
 import websockets
 import json
 from backend.server.persistence import DashboardPersistence
-from backend.server.timerthread import TimerThread
+from backend.server.scheduler import Scheduler
 import sqlite3
 from threading import Lock
 from backend.server.notificationmanager import NotificationManager
+from backend.server.lockmanager import LockManager
+from backend.server.executor import ComponentExecutor
+from backend.widgets.dbwrite import writer
+from backend.server.transfer import transfers
+from backend.server.cluster import HashRing, run_cluster
+from backend.server.oplog import OperationLog, replay
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from backend.core.repo import repo
@@ -16,36 +23,125 @@ from backend.core.repo import repo
 class DashboardServer:
     """Enhanced dashboard server with WebSocket support"""
 
-    def __init__(self, port, db_path="dashboards.db"):
+    def __init__(self, port, db_path="dashboards.db", max_workers=8, type_limits=None, autosave_interval=5.0,
+                 evict_after=600.0, transfer_port=None, socket_path=None, shard=None, oplog_dir="oplog",
+                 compact_interval=60.0, compact_bytes=16 * 1024 * 1024):
         self.port = port
+        if transfer_port is None and port is not None:
+            transfer_port = port + 1
+        self.transfer_port = transfer_port  # FileShare uploads and downloads, None disables them
+        self.socket_path = socket_path  # cluster workers listen on a unix socket behind the router
+        self.shard = shard  # (index, count) of a cluster worker, it only serves the dashboards hashed to it
+        self.ring = HashRing(range(shard[1])) if shard else None
+        self.autosave_interval = autosave_interval
+        self.evict_after = evict_after  # seconds without attached users before a dashboard goes back to disk
         self.persistence = DashboardPersistence(db_path)
+        self.oplog_dir = oplog_dir  # operation log making each mutation durable, None falls back to autosave
+        self.compact_interval = compact_interval  # seconds between checkpoints of the operation log
+        self.compact_bytes = compact_bytes  # or as soon as the log grows past this size
+        self.oplog = None
         self.notification_manager = NotificationManager()
-        self.timer_thread = TimerThread()
+        self.executor = ComponentExecutor(max_workers=max_workers, type_limits=type_limits)
+        self.scheduler = Scheduler(self.executor)
+        self.scheduler.on_refresh = self.notification_manager.component_changed  # push refreshed state
         self._running = False
-        self.lock = asyncio.Lock()
+        self.locks = LockManager()
 
     def _load_saved_dashboards(self):
-        """Load all saved dashboards"""
+        """Register saved dashboards as stubs, they are loaded on first attach"""
+        repo.set_loader(self.persistence.load_dashboard)
+        if self.shard:  # component ids stay unique across the workers sharing the database
+            repo.components.partition_ids(*self.shard)
         try:
-            with sqlite3.connect(self.persistence.db_path) as conn:
-                cursor = conn.execute("SELECT id FROM dashboards")
-                for (dash_id,) in cursor:
-                    try:
-                        self.persistence.load_dashboard(dash_id)
-                    except Exception as e:
-                        print(f"Error loading dashboard {dash_id}: {e}")
+            repo.components._id_counter = max(repo.components._id_counter, self.persistence.max_component_id())
+            for dash_id, name in self.persistence.list_dashboards():
+                if self.owns(dash_id):
+                    repo.add_stub(dash_id, name)
         except Exception as e:
             print(f"Error loading saved dashboards: {e}")
 
+    def _recover(self):
+        """Opens the operation log and replays what the stored snapshots do not include yet"""
+        checkpoints = self.persistence.checkpoints()
+        self.oplog = OperationLog(self.oplog_dir, start_lsn=max(checkpoints.values(), default=0))
+        changed = replay(repo, self.oplog.records_after(0), checkpoints)
+        self.oplog.pending.update(changed)  # snapshotted by the first checkpoint
+        if changed:
+            print(f"Recovered {len(changed)} dashboards from the operation log")
+
+    async def _checkpoint(self):
+        """Snapshots the dashboards changed by logged operations and drops the log segments they cover"""
+        through = await self.oplog.roll()
+        complete = True
+        for dash_id, dash in self.oplog.take_pending().items():
+            async with self.locks.dashboard(dash_id):  # no mutation between the state and its lsn
+                try:
+                    await asyncio.to_thread(self.persistence.save_dashboard, dash)
+                except Exception as e:
+                    print(f"Error saving dashboard {dash_id} at checkpoint: {e}")
+                    self.oplog.pending.setdefault(dash_id, dash)
+                    complete = False
+        if complete:
+            self.oplog.drop_through(through)
+
+    async def _compact_oplog(self):
+        """Checkpoints every compact_interval seconds, or earlier when the log grows past compact_bytes"""
+        last = time.monotonic()
+        while self._running:
+            await asyncio.sleep(1)
+            if time.monotonic() - last < self.compact_interval and self.oplog.size() < self.compact_bytes:
+                continue
+            last = time.monotonic()
+            await self._checkpoint()
+
+    def owns(self, dash_id):
+        """True if the dashboard is served by this process"""
+        return self.ring is None or self.ring.owner(str(dash_id)) == self.shard[0]
+
+    async def _evict_idle_dashboards(self):
+        """Saves and unloads dashboards nobody has attached to for evict_after seconds"""
+        while self._running:
+            await asyncio.sleep(min(self.evict_after, 60))
+            for dash_id in repo.idle(self.evict_after):
+                async with self.locks.dashboard(dash_id):
+                    dash = repo.get_objects().get(dash_id)
+                    if dash is None or dash_id not in repo.idle(self.evict_after):
+                        continue
+                    try:
+                        await asyncio.to_thread(self.persistence.save_dashboard, dash)
+                    except Exception as e:
+                        print(f"Error saving dashboard {dash_id} before eviction: {e}")
+                        continue
+                    async with self.locks.repo_lock:
+                        evicted = repo.evict(dash_id)
+                    if evicted is not None:
+                        for component in evicted.components():
+                            component.close()  # file watches would outlive the dashboard
+                        self.persistence.forget(dash_id)
+                        if self.oplog is not None and self.oplog.pending.get(dash_id) is evicted:
+                            del self.oplog.pending[dash_id]  # the save above covers its records
+                self.locks.discard(dash_id)
+
+    async def _transfer_complete(self, dash_id, component, user):
+        """Lists an uploaded file and tells the dashboard about it"""
+        async with self.locks.dashboard(dash_id):
+            await self.executor.run(component, component.files_changed)
+            component.touch()
+            await self.notification_manager.notify(dash_id, component, f"{user} uploaded a file on {component.name} !",
+                                                   actor=user)
+            await self.notification_manager.component_changed(dash_id, component)
+
     async def handle_client(self, websocket):
         """Handle WebSocket connection"""
         from backend.server.clienthandler import WebSocketClientHandler
         handler = WebSocketClientHandler(
             websocket,
             self.notification_manager,
-            self.timer_thread,
+            self.scheduler,
             self.persistence,
-            self.lock
+            self.locks,
+            self.executor,
+            self.oplog
         )
         try:
             await handler.run()
@@ -56,12 +152,33 @@ class DashboardServer:
         except Exception as e:
             print(f"Error handling client: {e}")
 
-    async def start_server(self):
-        """Start WebSocket server asynchronously"""
+    async def prepare(self):
+        """Loads the dashboards and starts the background work, everything but the listening socket"""
         self._running = True
+        self.executor.bind(asyncio.get_running_loop())
         self._load_saved_dashboards()
-        self.timer_thread.start()
+        if self.oplog_dir:
+            self._recover()
+            await self._checkpoint()
+            asyncio.get_running_loop().create_task(self._compact_oplog())
+        else:
+            # saving in the background could write a mutation the log also replays, so only without it
+            self.persistence.start_autosave(self.autosave_interval)
+        self.scheduler.start()
+        if self.evict_after:
+            asyncio.get_running_loop().create_task(self._evict_idle_dashboards())
+        if self.transfer_port is not None:
+            transfers.port = self.transfer_port
+            transfers.on_complete = self._transfer_complete
+            await transfers.start()
 
+    async def start_server(self):
+        """Start WebSocket server asynchronously"""
+        await self.prepare()
+        if self.socket_path:
+            async with websockets.unix_serve(self.handle_client, self.socket_path):
+                print(f"Worker {self.shard[0] if self.shard else 0} listening on {self.socket_path}")
+                await asyncio.Future()  # run forever
         async with websockets.serve(self.handle_client, "0.0.0.0", self.port):
             print(f"WebSocket server listening on port {self.port}")
             # Keep the server running
@@ -79,19 +196,30 @@ class DashboardServer:
     def stop(self):
         """Stop server"""
         self._running = False
-        self.timer_thread.stop()
-        self._save_all_dashboards()
+        self.scheduler.stop()
+        self.executor.shutdown(wait=False)
+        self.persistence.stop_autosave()
+        writer.stop()
+        saved = self._save_all_dashboards()
+        if self.oplog is not None:
+            self.oplog.close()
+            if saved:
+                self.oplog.drop_through(self.oplog.lsn)  # every dashboard is stored, the log is redundant
 
     def _save_all_dashboards(self):
-        """Save all active dashboards"""
+        """Save all active dashboards, True if none failed"""
+        saved = True
         try:
             for dash_id, dash in repo.get_objects().items():
                 try:
                     self.persistence.save_dashboard(dash)
                 except Exception as e:
                     print(f"Error saving dashboard {dash_id}: {e}")
+                    saved = False
         except Exception as e:
             print(f"Error saving dashboards: {e}")
+            saved = False
+        return saved
 
 
 def main():
@@ -100,9 +228,43 @@ def main():
     parser = argparse.ArgumentParser(description="Dashboard WebSocket Server")
     parser.add_argument("--port", type=int, default=1234,
                         help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Threads for blocking component work")
+    parser.add_argument("--type-limit", action="append", default=[], metavar="TYPE=N",
+                        help="Concurrency limit for one component type, e.g. DBQuery=2")
+    parser.add_argument("--write-batch", type=int, default=100,
+                        help="Most DBUpdate statements committed in one transaction")
+    parser.add_argument("--write-interval", type=float, default=0.05,
+                        help="Seconds a DBUpdate statement may wait for others to share its transaction")
+    parser.add_argument("--transfer-port", type=int, default=None,
+                        help="Port of the FileShare transfer channel (default: port + 1)")
+    parser.add_argument("--evict-after", type=float, default=600.0,
+                        help="Seconds a dashboard stays loaded without attached users (0 keeps them loaded)")
+    parser.add_argument("--oplog-dir", default="oplog",
+                        help="Directory of the operation log, an empty value saves in the background instead")
+    parser.add_argument("--compact-interval", type=float, default=60.0,
+                        help="Seconds between checkpoints that fold the operation log into the database")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes sharing the dashboards behind a router (1 runs a single server)")
+    parser.add_argument("--socket-dir", default=None,
+                        help="Directory of the worker unix sockets (default: a directory in the system temp dir)")
     args = parser.parse_args()
 
-    server = DashboardServer(args.port)
+    type_limits = {}
+    for item in args.type_limit:
+        type_name, limit = item.split("=", 1)
+        type_limits[type_name] = int(limit)
+    if args.processes > 1:  # worker i serves FileShare transfers on transfer port + i
+        run_cluster(args.port, args.processes, {
+            "db_path": "dashboards.db", "max_workers": args.workers, "type_limits": type_limits,
+            "evict_after": args.evict_after, "transfer_port": args.transfer_port or args.port + 1,
+            "write_batch": args.write_batch, "write_interval": args.write_interval,
+            "oplog_dir": args.oplog_dir, "compact_interval": args.compact_interval}, args.socket_dir)
+        return
+    writer.configure(batch_size=args.write_batch, flush_interval=args.write_interval)
+    server = DashboardServer(args.port, max_workers=args.workers, type_limits=type_limits,
+                             evict_after=args.evict_after, transfer_port=args.transfer_port,
+                             oplog_dir=args.oplog_dir or None, compact_interval=args.compact_interval)
     server.start()
 
 
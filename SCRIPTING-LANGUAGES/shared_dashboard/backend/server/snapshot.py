@@ -0,0 +1,175 @@
+"""Compact, schema-versioned binary encoding for persisted dashboard state.
+
+A snapshot is MAGIC, one schema version byte and a single tagged value. Values are limited to what
+dashboards, tab grids and component state hold: None, bool, int, float, str, bytes, list, tuple and
+dict. Lists of strings (chat history, message rotations) get a dedicated packed layout.
+"""
+import sqlite3
+import struct
+
+MAGIC = b"DSNP"
+SCHEMA_VERSION = 1
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _BYTES, _LIST, _TUPLE, _DICT, _STRLIST = range(11)
+_DOUBLE = struct.Struct("<d")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def is_snapshot(blob):
+    return bytes(blob[:len(MAGIC)]) == MAGIC
+
+
+def _varint(value, out):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _encode(value, out):
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        if not -2 ** 63 <= value < 2 ** 63:
+            raise SnapshotError(f"Integer out of range: {value}")
+        out.append(_INT)
+        _varint((value << 1) ^ (value >> 63), out)  # zigzag keeps small negatives short
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out.append(_STR)
+        _varint(len(data), out)
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(_BYTES)
+        _varint(len(value), out)
+        out += value
+    elif isinstance(value, list) and value and all(type(item) is str for item in value):
+        # character lengths followed by one utf-8 blob, decoded in a single call
+        data = "".join(value).encode("utf-8")
+        out.append(_STRLIST)
+        _varint(len(value), out)
+        for item in value:
+            _varint(len(item), out)
+        _varint(len(data), out)
+        out += data
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST if isinstance(value, list) else _TUPLE)
+        _varint(len(value), out)
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _varint(len(value), out)
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise SnapshotError(f"Cannot encode {type(value).__name__}")
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def varint(self):
+        result, shift = 0, 0
+        while True:
+            byte = self.data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def take(self, size):
+        chunk = self.data[self.pos:self.pos + size]
+        if len(chunk) != size:
+            raise SnapshotError("Truncated snapshot")
+        self.pos += size
+        return chunk
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _INT:
+            raw = self.varint()
+            return (raw >> 1) ^ -(raw & 1)
+        if tag == _FLOAT:
+            return _DOUBLE.unpack(self.take(8))[0]
+        if tag == _STR:
+            return str(self.take(self.varint()), "utf-8")
+        if tag == _BYTES:
+            return bytes(self.take(self.varint()))
+        if tag == _STRLIST:
+            lengths = [self.varint() for _ in range(self.varint())]
+            text = str(self.take(self.varint()), "utf-8")
+            items, offset = [], 0
+            for length in lengths:
+                items.append(text[offset:offset + length])
+                offset += length
+            return items
+        if tag == _LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == _TUPLE:
+            return tuple(self.value() for _ in range(self.varint()))
+        if tag == _DICT:
+            result = {}
+            for _ in range(self.varint()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        raise SnapshotError(f"Unknown tag {tag}")
+
+
+def dumps(value):
+    out = bytearray(MAGIC)
+    out.append(SCHEMA_VERSION)
+    _encode(value, out)
+    return bytes(out)
+
+
+def loads(blob):
+    if not is_snapshot(blob):
+        raise SnapshotError("Not a snapshot")
+    version = blob[len(MAGIC)]
+    if version > SCHEMA_VERSION:
+        raise SnapshotError(f"Snapshot schema {version} is newer than supported {SCHEMA_VERSION}")
+    reader = _Reader(blob)
+    reader.pos = len(MAGIC) + 1
+    return reader.value()
+
+
+class LazyField:
+    """A large component field left in the database until first access"""
+
+    def __init__(self, db_path, dashboard_id, component_id, field, default=None):
+        self.db_path = db_path
+        self.dashboard_id = dashboard_id
+        self.component_id = component_id
+        self.field = field
+        self.default = default
+
+    def load(self):
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT data FROM component_fields WHERE dashboard_id = ? AND component_id = ? AND field = ?",
+                (self.dashboard_id, self.component_id, self.field)
+            ).fetchone()
+        return loads(row[0]) if row else self.default
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import secrets
+import time
+
+
+class _Ticket:
+    def __init__(self, direction, path, dash_id, component, user, expires):
+        self.direction = direction  # "upload" or "download"
+        self.path = path
+        self.dash_id = dash_id
+        self.component = component
+        self.user = user
+        self.expires = expires
+
+
+class _TransferStats:
+    def __init__(self):
+        self.uploads = 0  # completed files
+        self.downloads = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.resumed = 0  # transfers starting past offset 0
+        self.failed = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def partial_path(path):
+    """Where an upload is written until its last chunk arrives, hidden from the directory index"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.part")
+
+
+class TransferServer:
+    """File transfers of FileShare widgets over their own TCP port, outside the command websocket.
+
+    A connection sends one JSON header line {"ticket", "offset", "length", "total"} and then streams:
+    a download answers a header line with the file size and sends the bytes from offset on, an upload
+    sends length bytes that are written at offset of a partial file, renamed into place once it
+    reaches total bytes. Tickets are issued on the command connection by attached users, are good for
+    one transfer and report the offset to resume from, so an interrupted transfer continues where it
+    stopped. Data moves chunk_size bytes at a time, a transfer never holds a file in memory.
+    """
+
+    def __init__(self, port=None, chunk_size=64 * 1024, ticket_ttl=60.0):
+        self.port = port
+        self.chunk_size = chunk_size
+        self.ticket_ttl = ticket_ttl
+        self.on_complete = None  # awaited with (dash_id, component, user) after an upload finished
+        self._tickets = {}
+        self._server = None
+        self.stats = _TransferStats()
+
+    async def start(self, host="0.0.0.0"):
+        self._server = await asyncio.start_server(self._handle, host, self.port, limit=64 * 1024)
+        print(f"Transfer server listening on port {self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def issue(self, direction, path, dash_id, component, user, restart=False):
+        """Ticket for one transfer of path and the offset it starts from, restart drops a partial upload"""
+        if self._server is None:
+            raise ValueError("File transfers are disabled on this server")
+        if direction not in ("upload", "download"):
+            raise ValueError(f"Unknown transfer direction: {direction}")
+        now = time.monotonic()
+        for ticket in [t for t, entry in self._tickets.items() if entry.expires < now]:
+            del self._tickets[ticket]
+        if direction == "download":
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"No such file: {os.path.basename(path)}")
+            offset = 0  # the size comes with the download header
+        else:
+            if restart and os.path.exists(partial_path(path)):
+                os.remove(partial_path(path))
+            try:
+                offset = os.path.getsize(partial_path(path))
+            except FileNotFoundError:
+                offset = 0
+        ticket = secrets.token_urlsafe(24)
+        self._tickets[ticket] = _Ticket(direction, path, dash_id, component, user, now + self.ticket_ttl)
+        return ticket, offset
+
+    async def _handle(self, reader, writer):
+        try:
+            header = json.loads(await reader.readline())
+            ticket = self._tickets.pop(header.get("ticket"), None)
+            if ticket is None or ticket.expires < time.monotonic():
+                await self._reply(writer, {"status": "error", "message": "Invalid or expired ticket"})
+                return
+            offset = int(header.get("offset", 0))
+            if offset:
+                self.stats.resumed += 1
+            if ticket.direction == "download":
+                await self._download(writer, ticket, offset)
+            else:
+                await self._upload(reader, writer, ticket, offset, int(header["length"]), header.get("total"))
+        except (ValueError, KeyError, OSError, asyncio.IncompleteReadError) as e:
+            self.stats.failed += 1
+            try:
+                await self._reply(writer, {"status": "error", "message": str(e)})
+            except OSError:
+                pass
+        finally:
+            writer.close()
+
+    async def _reply(self, writer, message):
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+
+    async def _download(self, writer, ticket, offset):
+        with open(ticket.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if not 0 <= offset <= size:
+                self.stats.failed += 1
+                await self._reply(writer, {"status": "error", "message": f"Offset {offset} outside of the "
+                                                                         f"{size} byte file", "size": size})
+                return
+            await self._reply(writer, {"status": "success", "size": size, "offset": offset})
+            sent = 0
+            if offset < size:  # sendfile refuses a zero count
+                # sendfile where the transport allows it, chunked reads otherwise
+                sent = await asyncio.get_running_loop().sendfile(writer.transport, f, offset, size - offset)
+        await writer.drain()
+        self.stats.bytes_out += sent
+        self.stats.downloads += 1
+
+    async def _upload(self, reader, writer, ticket, offset, length, total):
+        part = partial_path(ticket.path)
+        current = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset != current:
+            await self._reply(writer, {"status": "error", "message": "Offset mismatch", "offset": current})
+            return
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            received = 0
+            while received < length:
+                chunk = await reader.readexactly(min(self.chunk_size, length - received))
+                await asyncio.to_thread(os.pwrite, fd, chunk, offset + received)
+                received += len(chunk)
+                self.stats.bytes_in += len(chunk)
+        finally:
+            os.close(fd)
+        offset += received
+        complete = total is None or offset >= int(total)
+        if complete:
+            os.replace(part, ticket.path)
+            self.stats.uploads += 1
+        await self._reply(writer, {"status": "success", "offset": offset, "complete": complete})
+        if complete and self.on_complete is not None:
+            try:
+                await self.on_complete(ticket.dash_id, ticket.component, ticket.user)
+            except Exception as e:
+                print(f"Error after upload of {ticket.path}: {e}")
+
+
+transfers = TransferServer()
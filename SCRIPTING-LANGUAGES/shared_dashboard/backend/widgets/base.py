@@ -14,6 +14,7 @@ class BaseWidget(Component):
         self.param = {}  # User parameters
         self.events = ["refresh"]  # Default event is refresh at phase1
         self.refresh_interval = 1
+        self.cache_view = True  # view() only depends on the component state, see RenderCache
 
     def type(self):
         return self.name
@@ -24,7 +25,7 @@ class BaseWidget(Component):
             ("title", "string"),
             ("height", "int"),
             ("width", "int"),
-            ("refresh_interval", "int")
+            ("refresh_interval", "float")
         ]
         return base_attrs + self._get_specific_attrs()  # adds the base attributes than specific attributes based on
         # the widget definition
@@ -39,6 +40,14 @@ class BaseWidget(Component):
     def refresh(self):  # all widgets override that method
         pass
 
+    def replay(self, event, params):
+        """Applies an event again from the operation log, widgets stamping their params use the logged values"""
+        return self.trigger(event, params)
+
+    def close(self):
+        """Releases what the widget holds on the backend (file watches), called when its dashboard is unloaded"""
+        pass
+
     def trigger(self, event, params):
         if event not in self.events:
             raise ValueError(f"Unknown event: {event}")
@@ -1,48 +1,88 @@
 from .base import BaseWidget
+from .chatstore import ChatArchive, ChatHistory, format_message
+from .render import Template
 import time
 
+CHAT_BUBBLE = Template("""
+<g transform="translate(0,{{ y }})">
+    <rect x="10" y="0" width="200" height="50" rx="10" ry="10" fill="{{ fill }}"/>
+    <text x="20" y="20" font-size="12" fill="#6b7280">{{ username }}</text>
+    <text x="20" y="40" font-size="14">{{ content }}</text>
+    <text x="210" y="48" text-anchor="start" font-size="10" fill="#6b7280">{{ timestamp }}</text>
+</g>
+""")
+CHAT_SVG = Template("""
+<svg viewBox="0 0 600 {{ height }}" width="600" height="{{ height }}">
+    <rect x="0" y="0" width="100%" height="100%" fill="white"/>
+    {{ bubbles | raw }}
+</svg>
+""")
+
 
 class Chat(BaseWidget):
+    history_cap = 200  # messages kept in memory, env "history_cap" overrides it per chat
+    view_window = 20  # messages drawn by view()
+
     def __init__(self):
         super().__init__("Chat", "Chat Widget")
-        self.events = ["refresh", "submit"]
-        self.messages = []
+        self.events = ["refresh", "submit", "history", "since"]
+        self.read_events = {"history", "since"}  # answer with messages, the chat state does not change
+        self.stamped_params = {"ts"}  # message time set here, logged so a replay keeps it
+        self._history = ChatHistory(self.history_cap)  # or a snapshot.LazyField until first needed
         self.param = {"mess": "", "username": ""}  # FIXME: değişiklik yaptım şu satırdan itibaren.
 
     @classmethod
     def desc(cls):
         return "Simple chat program"
 
+    @property
+    def history(self):
+        if hasattr(self._history, "load"):  # LazyField of the persisted recent messages
+            lazy = self._history
+            self._history = ChatHistory.from_state(lazy.load(), self.history_cap)
+            self._history.archive = ChatArchive(lazy.db_path, lazy.dashboard_id, lazy.component_id)
+        return self._history
+
+    @property
+    def messages(self):
+        """The messages in memory as "HH:MM|user: text" strings"""
+        return [format_message(entry) for entry in self.history.recent(len(self.history))]
+
+    @messages.setter
+    def messages(self, value):
+        self._history = ChatHistory.from_lines(value, self.history_cap)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_history"] = self.history  # ship the messages, not a database handle
+        return state
+
     def view(self, user=None):
-        if not self.messages:
+        entries = self.history.recent(self.view_window)
+        if not entries:
             return '<div class="text-gray-500 text-center">No messages yet</div>'
 
-        current_user, svg_messages, y = user, [], 10
-        for msg in self.messages:
-            username, content = msg.split(": ", 1)
-            username = username.split("|")[1]
-            is_current_user = username == current_user
-            text_anchor, x, timestamp = "start", 10, msg.split("|")[0]
-            bubble_fill = "#c5e1ff" if is_current_user else "#e5e7eb"
-            svg_messages.append(f"""
-                <g transform="translate(0,{y})">
-                    <rect x="{x}" y="0" width="200" height="50" rx="10" ry="10" fill="{bubble_fill}"/>
-                    <text x="{x + 10}" y="20" font-size="12" fill="#6b7280">{username}</text>
-                    <text x="{x + 10}" y="40" font-size="14">{content}</text>
-                    <text x="{210}" y="48" text-anchor="{text_anchor}" font-size="10" fill="#6b7280">{timestamp}</text>
-                </g>
-            """)
-            y += 60
-
-        return f"""
-                <svg viewBox="0 0 600 {y + 10}" width="600" height="{y + 10}">
-                    <rect x="0" y="0" width="100%" height="100%" fill="white"/>
-                    {''.join(svg_messages)}
-                </svg>
-            """
-
-    def trigger(self, event, param):
+        bubbles = CHAT_BUBBLE.render_rows(
+            (60 * i + 10, "#c5e1ff" if username == user else "#e5e7eb", username, content,
+             time.strftime('%H:%M', time.localtime(ts)))
+            for i, (seq, ts, username, content) in enumerate(entries))
+        height = 60 * len(entries) + 20
+        return CHAT_SVG.render(height=height, bubbles=bubbles)
+
+    def replay(self, event, param):
+        return self.trigger(event, param, ts=float(param["ts"]) if param.get("ts") is not None else None)
+
+    def trigger(self, event, param, ts=None):
         super().trigger(event, param)
         if event == "submit" and param["mess"]:
-            self.messages.append(f"{time.strftime('%H:%M')}|{param['username']}: {param['mess']}")
+            ts = param["ts"] = time.time() if ts is None else ts  # never the time a client sent
+            self.history.append(param['username'], param['mess'], ts=ts,
+                                cap=int(self.env.get("history_cap", self.history_cap)))
             param["mess"] = ""
+        elif event == "since":  # messages after a cursor, e.g. {"since": 42}
+            entries = self.history.since(int(param.get("since", 0)))
+            return {"cursor": self.history.last_seq(), "messages": [list(entry) for entry in entries]}
+        elif event == "history":  # an older page, e.g. {"before": 42, "limit": 20}
+            before = int(param["before"]) if param.get("before") else None
+            entries = self.history.page(before, int(param.get("limit", self.view_window)))
+            return {"messages": [list(entry) for entry in entries]}
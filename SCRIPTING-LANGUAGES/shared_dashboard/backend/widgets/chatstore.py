@@ -0,0 +1,142 @@
+import itertools
+import sqlite3
+import time
+from collections import deque
+from threading import Lock
+
+
+class ChatHistory:
+    """Recent chat messages as (seq, timestamp, user, text) in a ring buffer.
+
+    Messages pushed out of the ring are kept in a spill list until DashboardPersistence moves them
+    to the chat_messages table; older pages are then read back through the archive.
+    """
+
+    def __init__(self, cap=200):
+        self.cap = cap
+        self._entries = deque()
+        self._next_seq = 1
+        self._spilled = []
+        self._lock = Lock()  # appends run on worker threads while the autosave thread takes the spill
+        self.archive = None  # ChatArchive, set by the persistence layer
+
+    def append(self, user, text, ts=None, cap=None):
+        with self._lock:
+            if cap:
+                self.cap = cap
+            seq = self._next_seq
+            self._next_seq += 1
+            self._entries.append((seq, time.time() if ts is None else ts, user, text))
+            while len(self._entries) > self.cap:
+                self._spilled.append(self._entries.popleft())
+            return seq
+
+    def __len__(self):
+        return len(self._entries)
+
+    def last_seq(self):
+        return self._next_seq - 1
+
+    def recent(self, count):
+        """The newest count messages, oldest first"""
+        with self._lock:
+            start = max(0, len(self._entries) - count)
+            return [self._entries[i] for i in range(start, len(self._entries))]
+
+    def since(self, seq):
+        """Messages after the given cursor, oldest first"""
+        with self._lock:
+            if not self._entries or seq >= self._entries[-1][0]:
+                return []
+            start = max(0, seq - self._entries[0][0] + 1)  # seq numbers are consecutive
+            return [self._entries[i] for i in range(start, len(self._entries))]
+
+    def page(self, before=None, limit=20):
+        """Up to limit messages older than before (newest when None), oldest first"""
+        with self._lock:  # spilled messages stay here until the persistence layer archived them
+            entries = [entry for entry in itertools.chain(self._spilled, self._entries)
+                       if before is None or entry[0] < before]
+        entries = entries[-limit:]
+        first = entries[0][0] if entries else before
+        missing = limit - len(entries)
+        if missing > 0 and self.archive is not None and (first is None or first > 1):
+            entries = self.archive.page(first, missing) + entries
+        return entries
+
+    def take_spilled(self):
+        with self._lock:
+            spilled, self._spilled = self._spilled, []
+            return spilled
+
+    def to_state(self):
+        """Column layout for the snapshot format, strings of a column are packed together"""
+        with self._lock:
+            entries = list(self._entries)
+        return {
+            "next_seq": self._next_seq,
+            "cap": self.cap,
+            "seq": [entry[0] for entry in entries],
+            "ts": [entry[1] for entry in entries],
+            "user": [entry[2] for entry in entries],
+            "text": [entry[3] for entry in entries],
+        }
+
+    @classmethod
+    def from_state(cls, state, cap=200):
+        if isinstance(state, list):  # legacy list of "HH:MM|user: text" strings
+            return cls.from_lines(state, cap)
+        history = cls(state.get("cap", cap))
+        history._entries = deque(zip(state["seq"], state["ts"], state["user"], state["text"]))
+        history._next_seq = state["next_seq"]
+        return history
+
+    @classmethod
+    def from_lines(cls, lines, cap=200):
+        history = cls(cap)
+        today = time.localtime()
+        for line in lines:
+            stamp, _, rest = line.partition("|")
+            user, _, text = rest.partition(": ")
+            try:
+                hour, minute = (int(part) for part in stamp.split(":"))
+                ts = time.mktime(today[:3] + (hour, minute, 0) + today[6:])
+            except ValueError:
+                ts = 0.0
+            history.append(user, text, ts)
+        return history
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["archive"] = None  # the database is only reachable from the backend
+        state["_spilled"] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+
+class ChatArchive:
+    """Reads messages spilled out of a ChatHistory from the chat_messages table"""
+
+    def __init__(self, db_path, dashboard_id, component_id):
+        self.db_path = db_path
+        self.dashboard_id = dashboard_id
+        self.component_id = component_id
+
+    def page(self, before, limit):
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT seq, ts, user, text FROM chat_messages "
+                "WHERE dashboard_id = ? AND component_id = ? AND (? IS NULL OR seq < ?) "
+                "ORDER BY seq DESC LIMIT ?",
+                (self.dashboard_id, self.component_id, before, before, limit)
+            ).fetchall()
+        return [tuple(row) for row in reversed(rows)]
+
+
+def format_message(entry):
+    """The legacy "HH:MM|user: text" form of a message"""
+    seq, ts, user, text = entry
+    return f"{time.strftime('%H:%M', time.localtime(ts))}|{user}: {text}"
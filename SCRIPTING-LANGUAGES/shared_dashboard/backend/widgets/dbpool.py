@@ -0,0 +1,154 @@
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class QueryResult:
+    """Columns and the first rows of a query; truncated when the query had more than the row limit"""
+
+    def __init__(self, columns, rows, truncated, elapsed):
+        self.columns = columns
+        self.rows = rows
+        self.truncated = truncated
+        self.elapsed = elapsed
+        self.created = time.monotonic()
+
+
+# a quoted string or literal (kept as is) or a run of whitespace
+_TOKEN = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|\s+""")
+
+
+def normalize(query):
+    """Cache key form of a query: whitespace collapsed outside quotes, no trailing semicolon"""
+    return _TOKEN.sub(lambda m: m.group(1) or " ", query).strip().rstrip(";").strip()
+
+
+class ReadPool:
+    """Idle read-only connections per database file, reused across queries and worker threads"""
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self._idle = {}  # db path -> [connection]
+        self._lock = Lock()
+
+    def _open(self, db):
+        conn = sqlite3.connect(f"file:{db}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def connection(self, db):
+        with self._lock:
+            idle = self._idle.get(db)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = self._open(db)
+        try:
+            yield conn
+        except Exception:
+            conn.close()  # do not hand out a connection in an unknown state
+            raise
+        else:
+            with self._lock:
+                idle = self._idle.setdefault(db, [])
+                if len(idle) < self.max_idle:
+                    idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def idle(self):
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+
+class QueryEngine:
+    """Read-only query execution with pooled connections and a TTL result cache.
+
+    Results are cached by (database, normalized query) and dropped when DBUpdate writes to the
+    database. Rows are fetched in batches up to row_limit, and a progress handler interrupts any
+    query running past its timeout so it cannot hold a worker thread.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=256, row_limit=1000, timeout=5.0, batch=200):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.row_limit = row_limit
+        self.timeout = timeout
+        self.batch = batch
+        self.pool = ReadPool()
+        self._cache = OrderedDict()  # (db, normalized query) -> QueryResult
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def execute(self, db, query, row_limit=None, timeout=None):
+        key = (db, normalize(query))
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None and time.monotonic() - result.created < self.ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = self._run(db, query, row_limit or self.row_limit, timeout or self.timeout)
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def _run(self, db, query, row_limit, timeout):
+        started = time.monotonic()
+        deadline = started + timeout
+        with self.pool.connection(db) as conn:
+            conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+            try:
+                cursor = conn.execute(query)
+                columns = [desc[0] for desc in cursor.description or ()]
+                rows = []
+                while len(rows) <= row_limit:
+                    chunk = cursor.fetchmany(min(self.batch, row_limit + 1 - len(rows)))
+                    if not chunk:
+                        break
+                    rows.extend(chunk)
+                cursor.close()
+            except sqlite3.OperationalError as e:
+                if time.monotonic() > deadline:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise QueryTimeout(f"Query exceeded {timeout:g}s") from e
+                raise
+            finally:
+                conn.set_progress_handler(None, 0)
+        truncated = len(rows) > row_limit
+        return QueryResult(columns, rows[:row_limit], truncated, time.monotonic() - started)
+
+    def invalidate(self, db):
+        """Drops the cached results of a database after a write"""
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == db]:
+                del self._cache[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "timeouts": self.timeouts,
+                "idle_connections": self.pool.idle(),
+            }
+
+
+engine = QueryEngine()
@@ -1,17 +1,25 @@
 import sqlite3
 from .base import BaseWidget
+from .dbpool import engine, QueryTimeout
+from .render import TABLE_CELL, TABLE_HEADER, TABLE_SVG
 
 path = "/Users/ahmetyigitturhan/Documents/script_web_dashboard/backend/widgets/dbs/"
 
 
 class DBQuery(BaseWidget):
+    page_size = 20  # rows drawn per page
+
     def __init__(self):
         super().__init__("DBQuery", "Database Query Viewer")
         self.env = {
             "database": "",
             "query": ""
         }
-        self._results = {}
+        self.events = ["refresh", "execute", "page"]
+        self.external_events = {"execute", "page"}  # results come from the database, never replayed from the log
+        self.refresh_interval = 0  # results only change on execute
+        self._results = {}  # username -> {"columns", "rows", "truncated"} or {"error"}
+        self._pages = {}  # username -> page number shown
 
     @classmethod
     def desc(cls):
@@ -27,43 +35,46 @@ class DBQuery(BaseWidget):
             return "Not executed yet"
 
     def view(self, user=None):
-        if user not in self._results.keys():
-            return f"<p>[DBQuery: No results for {user}]</p>"
-
-        results = self._results[user]
-        if not results:
+        result = self._results.get(user)
+        if not result:
             return f"<p>[DBQuery: No results for {user}]</p>"
+        if "error" in result:
+            return f"<p>[DBQuery: {result['error']}]</p>"
 
-        svg_content = '<svg xmlns="http://www.w3.org/2000/svg" font-family="Arial" font-size="18">'
-        x, y, col_width, row_height = 20, 40, 150, 20
-
-        if "description" in self._results:
-            headers = [desc[0] for desc in self._results["description"]]
-            for i, header in enumerate(headers):
-                svg_content += f'<text x="{x + i * col_width}" y="{y}" font-weight="bold">{header}</text>'
-            y += row_height
-
-        for row in results:
-            for i, cell in enumerate(row):
-                svg_content += f'<text x="{x + i * col_width}" y="{y}">{cell}</text>'
-            y += row_height
-
-        svg_content += '</svg>'
-
-        return svg_content
+        rows = result["rows"]
+        page = self._pages.get(user, 0)
+        pages = max(1, -(-len(rows) // self.page_size))
+        x, col_width, row_height = 20, 150, 20
+        shown = rows[page * self.page_size:(page + 1) * self.page_size]
+        header = TABLE_HEADER.render_rows((x + i * col_width, column) for i, column in enumerate(result["columns"]))
+        cells = TABLE_CELL.render_rows((x + i * col_width, 60 + r * row_height, cell)
+                                       for r, row in enumerate(shown) for i, cell in enumerate(row))
+        more = "+" if result["truncated"] else ""
+        return TABLE_SVG.render(header=header, cells=cells, footer_y=60 + (len(shown) + 1) * row_height,
+                                footer=f"Page {page + 1}/{pages} ({len(rows)}{more} rows)")
 
     def trigger(self, event, params):
         if event == "execute":
             if not params["db"] or not params["query"]:
                 return
+            username = params.get("username")
             try:
-                with sqlite3.connect(path + params["db"]) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(params["query"])  # executing the query
-                    self._results["description"] = cursor.description  # save column headers
-                    self._results[params["username"]] = cursor.fetchall()  # save query results
-            except sqlite3.Error as e:
-                self._results["error"] = str(e)  # save error if query fails
+                result = engine.execute(path + params["db"], params["query"])
+                self._results[username] = {"columns": result.columns, "rows": result.rows,
+                                           "truncated": result.truncated}
+            except (sqlite3.Error, QueryTimeout) as e:
+                self._results[username] = {"error": str(e)}  # save error if query fails
+            self._pages[username] = 0
+        elif event == "page":  # {"page": n} or {"page": "next"/"prev"}
+            username = params.get("username")
+            result = self._results.get(username)
+            if not result or "error" in result:
+                return
+            pages = max(1, -(-len(result["rows"]) // self.page_size))
+            page = params.get("page", "next")
+            current = self._pages.get(username, 0)
+            page = current + 1 if page == "next" else current - 1 if page == "prev" else int(page)
+            self._pages[username] = min(max(page, 0), pages - 1)
 
     def refresh(self):
         return
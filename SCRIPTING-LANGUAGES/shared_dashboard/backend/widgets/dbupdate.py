@@ -1,5 +1,6 @@
-import sqlite3
 from backend.widgets.base import BaseWidget
+from backend.widgets.dbwrite import bind, writer
+from backend.widgets.render import TABLE_CELL, TABLE_HEADER, TABLE_SVG
 
 path = "/Users/ahmetyigitturhan/Documents/script_web_dashboard/backend/widgets/dbs/"
 
@@ -14,7 +15,10 @@ class DBUpdate(BaseWidget):
             "query": query
         }
         self.param = {}
-        self.events = ["submit"]
+        self.events = ["submit", "execute"]
+        self.external_events = {"submit", "execute"}  # the write lives in the database, never replayed from the log
+        self.refresh_interval = 0  # nothing to refresh, results only change on execute
+        self.write_timeout = 10.0  # seconds to wait for the batch holding our statement
         self._last_result = None
 
     @classmethod
@@ -27,32 +31,23 @@ class DBUpdate(BaseWidget):
     def view(self, user=None):
         if self._last_result is None:
             return f"<p>[DBUpdate: No updates yet for {user}]</p>"
-        svg_content = '<svg xmlns="http://www.w3.org/2000/svg" font-family="Arial" font-size="18">'
-        x, y, col_width, row_height = 20, 40, 150, 20
-        if isinstance(self._last_result, list) and self._last_result:
-            headers = [str(i) for i in range(len(self._last_result[0]))]
-            for i, header in enumerate(headers):
-                svg_content += f'<text x="{x + i * col_width}" y="{y}" font-weight="bold">{header}</text>'
-            y += row_height
-            for row in self._last_result:
-                for i, cell in enumerate(row):
-                    svg_content += f'<text x="{x + i * col_width}" y="{y}">{str(cell)}</text>'
-                y += row_height
-        else:
-            svg_content += '<text x="20" y="40">No data available</text>'
-
-        svg_content += '</svg>'
-        return svg_content
+        if not isinstance(self._last_result, list) or not self._last_result:
+            return TABLE_SVG.render(header="", cells=TABLE_CELL.render(x=20, y=40, text="No data available"),
+                                    footer_y=40, footer="")
+        x, col_width, row_height = 20, 150, 20
+        header = TABLE_HEADER.render_rows((x + i * col_width, str(i)) for i in range(len(self._last_result[0])))
+        cells = TABLE_CELL.render_rows((x + i * col_width, 60 + r * row_height, str(cell))
+                                       for r, row in enumerate(self._last_result) for i, cell in enumerate(row))
+        return TABLE_SVG.render(header=header, cells=cells, footer_y=60 + len(self._last_result) * row_height,
+                                footer="")
 
     def trigger(self, event, params=None):
         if event == "execute" and params:
             try:
-                formatted_query = self.env["query"].format(params["query"])
-                with sqlite3.connect(path + params["db"]) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute(formatted_query)
-                    self._last_result = cursor.fetchall()
-                    conn.commit()
+                # values are bound, never formatted into the SQL text
+                sql, values = bind(self.env["query"], params["query"])
+                future = writer.submit(path + params["db"], sql, values)  # committed with other queued writes
+                self._last_result = future.result(self.write_timeout)
                 return "Success"
             except Exception as e:
                 self._last_result = f"Error: {str(e)}"
@@ -0,0 +1,188 @@
+import queue
+import re
+import sqlite3
+import time
+from concurrent.futures import Future
+from threading import Lock, Thread
+from .dbpool import engine
+
+# "{}" or "{0}" in a DBUpdate query template, quotes around it are part of the placeholder
+_PLACEHOLDER = re.compile(r"""(['"]?)\{(\d*)\}\1""")
+_LIST_START = re.compile(r"\b(?:VALUES|IN)\s*\(\s*$", re.IGNORECASE)
+_LIST_END = re.compile(r"^\s*\)")
+
+
+def bind(template, raw):
+    """Turns a str.format style template and a comma separated value string into (sql, values).
+
+    A lone placeholder alone in a VALUES (...) or IN (...) list takes all the values (VALUES ({}) with
+    "1, 'a'"), anywhere else it is one value, the whole string when it is quoted ('{}' with "Hello,
+    world"). Numbered placeholders pick their value by index and plain ones take the values in order.
+    """
+    values = [value.strip() for value in raw.split(",")] if raw else []
+    values = [value[1:-1] if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"" else value
+              for value in values]
+    placeholders = _PLACEHOLDER.findall(template)
+    if len(placeholders) == 1 and not placeholders[0][1]:
+        match = _PLACEHOLDER.search(template)
+        before, after = template[:match.start()], template[match.end():]
+        if not match.group(1) and _LIST_START.search(before) and _LIST_END.match(after):
+            return before + ", ".join("?" * max(len(values), 1)) + after, values or [raw]
+        return before + "?" + after, [raw if match.group(1) or len(values) != 1 else values[0]]
+
+    bound, position = [], 0
+    for _, index in placeholders:
+        if index:
+            bound.append(values[int(index)] if len(values) > 1 else raw)
+        else:
+            if position >= len(values):
+                raise ValueError(f"Query expects {len(placeholders)} values, got {len(values)}")
+            bound.append(values[position])
+            position += 1
+    return _PLACEHOLDER.sub("?", template), bound
+
+
+class _WriteStats:
+    def __init__(self):
+        self.batches = 0
+        self.statements = 0
+        self.failed = 0
+        self.latency_total = 0.0  # seconds from the first queued statement to the commit
+        self.latency_max = 0.0
+        self.busy = 0.0  # seconds spent executing and committing
+
+    def as_dict(self):
+        return {
+            "batches": self.batches,
+            "statements": self.statements,
+            "failed": self.failed,
+            "avg_batch_size": self.statements / self.batches if self.batches else 0.0,
+            "avg_batch_latency_ms": self.latency_total / self.batches * 1000 if self.batches else 0.0,
+            "max_batch_latency_ms": self.latency_max * 1000,
+            "statements_per_s": self.statements / self.busy if self.busy else 0.0,
+        }
+
+
+class WriteQueue(Thread):
+    """Single writer of one database, committing queued statements in groups.
+
+    A group is written once batch_size statements are waiting or flush_interval seconds after its
+    first statement arrived. Each statement runs in its own savepoint, so a failing one is rolled
+    back alone and reported to its submitter while the rest of the group commits.
+    """
+
+    def __init__(self, db, batch_size=100, flush_interval=0.05):
+        super().__init__(daemon=True, name=f"dbwrite:{db}")
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = _WriteStats()
+        self._queue = queue.Queue()
+        self._running = True
+
+    def submit(self, sql, values):
+        future = Future()
+        self._queue.put((time.monotonic(), sql, values, future))
+        return future
+
+    def run(self):
+        conn = sqlite3.connect(self.db, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while self._running or not self._queue.empty():
+                try:
+                    first = self._queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                batch = [first]
+                deadline = first[0] + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                                     else self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._write(conn, batch)
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        started = time.monotonic()
+        results = []
+        try:
+            conn.execute("BEGIN")
+            for _, sql, values, _ in batch:
+                conn.execute("SAVEPOINT statement")
+                try:
+                    rows = conn.execute(sql, values).fetchall()
+                    conn.execute("RELEASE statement")
+                    results.append((rows, None))
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO statement")
+                    conn.execute("RELEASE statement")
+                    results.append((None, e))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(None, e)] * len(batch)
+        engine.invalidate(self.db)  # cached DBQuery results are stale now
+
+        done = time.monotonic()
+        self.stats.batches += 1
+        self.stats.statements += len(batch)
+        self.stats.busy += done - started
+        latency = done - batch[0][0]
+        self.stats.latency_total += latency
+        self.stats.latency_max = max(self.stats.latency_max, latency)
+        for (_, _, _, future), (rows, error) in zip(batch, results):
+            if error is None:
+                future.set_result(rows)
+            else:
+                self.stats.failed += 1
+                future.set_exception(error)
+
+    def stop(self, timeout=5):
+        self._running = False
+        self.join(timeout)
+
+
+class DatabaseWriter:
+    """One WriteQueue per target database, created on first write"""
+
+    def __init__(self, batch_size=100, flush_interval=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queues = {}
+        self._lock = Lock()
+
+    def configure(self, batch_size=None, flush_interval=None):
+        """Applies to the queues created afterwards"""
+        if batch_size:
+            self.batch_size = batch_size
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+    def submit(self, db, sql, values=()):
+        """Queues a statement for db, the Future resolves to its rows once the group is committed"""
+        with self._lock:
+            write_queue = self._queues.get(db)
+            if write_queue is None:
+                write_queue = self._queues[db] = WriteQueue(db, self.batch_size, self.flush_interval)
+                write_queue.start()
+        return write_queue.submit(sql, values)
+
+    def stats(self):
+        with self._lock:
+            return {db: write_queue.stats.as_dict() for db, write_queue in self._queues.items()}
+
+    def stop(self):
+        with self._lock:
+            queues, self._queues = list(self._queues.values()), {}
+        for write_queue in queues:
+            write_queue.stop()
+
+
+writer = DatabaseWriter()
@@ -0,0 +1,52 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class DirectoryWatch:
+    """inotify watch of a directory, read without blocking through ctypes.
+
+    Raises OSError (or AttributeError without inotify in libc) where inotify is not available, callers
+    fall back to polling then.
+    """
+
+    _libc = None
+
+    def __init__(self, directory, name=None):
+        if DirectoryWatch._libc is None:
+            DirectoryWatch._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.name = os.fsencode(name) if name else None  # only events of this entry count
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = _IN_MODIFY | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(directory or "."), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def changed(self):
+        """True if there were events since the last call"""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                changed = changed or self.name is None or name == self.name
+                offset += _EVENT.size + length
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,112 @@
+import os
+import time
+from threading import Lock
+from .dirwatch import DirectoryWatch
+
+
+class DirectoryIndex:
+    """Cached listing of the regular files of a directory, rescanned only after it changed.
+
+    Changes are seen through inotify where available. Elsewhere a rescan happens when the directory
+    mtime moved (files added, removed or renamed) or the listing is older than ttl seconds (sizes of
+    files written in place).
+    """
+
+    def __init__(self, path, ttl=5.0, use_inotify=True):
+        self.path = path
+        self.ttl = ttl
+        self._files = None  # [{"name", "size", "modified"}] sorted by name
+        self._mtime = None
+        self._scanned = 0.0
+        self._lock = Lock()
+        self._watch = None
+        if use_inotify:
+            try:
+                self._watch = DirectoryWatch(path)
+            except (OSError, AttributeError, TypeError):
+                self._watch = None
+        self.scans = 0
+        self.hits = 0
+        self.users = 0  # widgets holding the index, see acquire_index
+
+    def files(self):
+        with self._lock:
+            if self._stale():
+                self._scan()
+            else:
+                self.hits += 1
+            return self._files
+
+    def invalidate(self):
+        """Forces a rescan, for changes made through the widget itself"""
+        with self._lock:
+            self._files = None
+
+    def close(self):
+        """Drops the inotify watch, the index falls back to mtime checks"""
+        with self._lock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
+
+    def _stale(self):
+        if self._files is None:
+            return True
+        if self._watch is not None:
+            return self._watch.changed()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return bool(self._files)
+        return mtime != self._mtime or time.monotonic() - self._scanned > self.ttl
+
+    def _scan(self):
+        files = []
+        try:
+            self._mtime = os.stat(self.path).st_mtime_ns
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.name.startswith(".") or not entry.is_file():
+                        continue  # hidden names include partial uploads
+                    stats = entry.stat()
+                    files.append({"name": entry.name, "size": stats.st_size, "modified": stats.st_mtime})
+        except FileNotFoundError:
+            self._mtime = None
+        files.sort(key=lambda f: f["name"])
+        self._files = files
+        self._scanned = time.monotonic()
+        self.scans += 1
+
+
+_indexes = {}
+_indexes_lock = Lock()
+
+
+def index_for(path):
+    """The DirectoryIndex of a directory, shared by every widget listing it"""
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            os.makedirs(path, exist_ok=True)
+            index = _indexes[path] = DirectoryIndex(path)
+        return index
+
+
+def acquire_index(path):
+    """index_for a widget that keeps the index, give it back with release_index"""
+    index = index_for(path)
+    with _indexes_lock:
+        index.users += 1
+    return index
+
+
+def release_index(index):
+    """Closes and forgets an index once the last widget holding it let go"""
+    with _indexes_lock:
+        index.users -= 1
+        if index.users > 0:
+            return
+        if _indexes.get(index.path) is index:
+            del _indexes[index.path]
+    index.close()
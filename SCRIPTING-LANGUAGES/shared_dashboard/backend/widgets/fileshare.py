@@ -1,24 +1,40 @@
 import os
 from backend.widgets.base import BaseWidget
+from backend.widgets.fileindex import acquire_index, release_index
 
 path_of_files = "/Users/ahmetyigitturhan/Documents/script_web_dashboard/backend/widgets/shared"
 
 
 class FileShare(BaseWidget):
-    """Component for sharing files in a directory"""
+    """Component for sharing files in a directory.
+
+    The file listing is component state refreshed from a cached DirectoryIndex. File contents go
+    through the transfer channel (backend/server/transfer.py) in chunks, the upload and download
+    events only carry small text files.
+    """
+
+    inline_limit = 1024 * 1024  # largest file the download event returns in its result
 
     def __init__(self):
         super().__init__("FileShare", "File Sharing Widget")
         self.env = {"path": ""}
         self.param = {"filename": "", "content": ""}
         self.events = ["refresh", "upload", "download", "delete"]
+        self.external_events = {"upload", "download", "delete"}  # files live on disk, never replayed from the log
         self._file_list = []
-        self.refresh_interval = 0
+        self._index = None  # DirectoryIndex held on the backend, never shipped
+        self._closed = False  # unloaded with its dashboard, must not take the index again
+        self.refresh_interval = 2  # picks up files changed outside the widget, a no-op while nothing changed
 
     @classmethod
     def desc(cls):
         return "Manages shared files in a directory"
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_index"] = None  # holds an inotify descriptor
+        return state
+
     def _get_specific_attrs(self):
         return [("path", "string")]
 
@@ -28,64 +44,77 @@ class FileShare(BaseWidget):
         if not os.path.exists(path_of_files):
             os.makedirs(path_of_files)
 
+    @classmethod
+    def resolve(cls, filename):
+        """Path of a shared file, rejects names that would leave the shared directory"""
+        if not filename or filename != os.path.basename(filename) or filename.startswith("."):
+            raise ValueError(f"Invalid file name: {filename!r}")
+        return os.path.join(path_of_files, filename)
+
     def _get_file_info(self):
-        global path_of_files
-        """Get information about files in shared directory"""
-        self._ensure_dir()
-        self._file_list = []
-        for filename in os.listdir(path_of_files):
-            path = os.path.join(path_of_files, filename)
-            if os.path.isfile(path):
-                stats = os.stat(path)
-                self._file_list.append({
-                    "name": filename,
-                    "size": stats.st_size,
-                    "modified": stats.st_mtime
-                })
+        """Files of the shared directory as of the last refresh"""
         return self._file_list
 
     def view(self, user=None):
         """Display file listing"""
-        res = ""
-        for f in self._get_file_info():
-            res += f["name"] + " "
-        return res
+        return " ".join(f["name"] for f in self._file_list)
 
     def trigger(self, event, params=None):
         """Handle file operations"""
+        if event == "refresh":
+            self.refresh()
+            return None
         if not params:
             return "Params is not set"
-        self._ensure_dir()
         filename = params.get("filename", "")
         if not filename:
             return "File name is not set"
-        filepath = os.path.join(path_of_files, filename)
         try:
+            filepath = self.resolve(filename)
+            self._ensure_dir()
             if event == "upload":
                 content = params.get("content", "")
                 with open(filepath, "w") as f:
                     f.write(content)
-                self.refresh()
+                self.files_changed()
                 return "successfully uploaded"
 
             elif event == "download":
-                if os.path.exists(filepath):
-                    self.param["filename"] = filename
-                    with open(filepath, "r") as f:
-                        self.param["content"] = f.read()
-                else:
-                    params["content"] = ""
-                self.refresh()
-                return "successfully downloaded"
+                if not os.path.exists(filepath):
+                    return ""
+                if os.path.getsize(filepath) > self.inline_limit:
+                    return "File is too large for the download event, use a transfer"
+                with open(filepath, "r") as f:
+                    return f.read()
 
             elif event == "delete":
                 if os.path.exists(filepath):
                     os.remove(filepath)
-                self.refresh()
+                self.files_changed()
                 return "successfully deleted"
 
         except Exception as e:
             return f"Error in FileShare {event}: {str(e)}"
 
+    def files_changed(self):
+        """Rescans after the widget itself changed the directory"""
+        if self._index is not None:
+            self._index.invalidate()
+        self.refresh()
+
     def refresh(self):
-        print(f"refresh fileshare: {self._get_file_info()}")
+        if self._closed:
+            return False
+        if self._index is None:
+            self._index = acquire_index(path_of_files)
+        files = self._index.files()
+        if files == self._file_list:
+            return False
+        self._file_list = files
+        return True
+
+    def close(self):
+        self._closed = True
+        if self._index is not None:
+            release_index(self._index)
+            self._index = None
@@ -1,6 +1,9 @@
 # widgets/filewatch.py
+import html
 import os
+from collections import deque
 from .base import BaseWidget
+from .tailer import Tailer
 
 path_of_files = "/Users/ahmetyigitturhan/Documents/script_web_dashboard/backend/widgets/shared/"
 class FileWatch(BaseWidget):
@@ -11,32 +14,49 @@ class FileWatch(BaseWidget):
             "filename": "",
             "numberoflines": 10
         }
-        self._last_size = 0
-        self._lines = []
+        self._lines = deque(maxlen=10)
+        self._tailer = None  # follows the file on the backend, never shipped
 
     @classmethod
     def desc(cls):
         return "Watches the interface of the file"
 
-    def view(self, user=None):
-        result = ""
-        with open(path_of_files + self.env["filename"], "r") as file:
-            line = file.readline()
-            while line:
-                result += line + "\n"
-                line = file.readline()
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tailer"] = None  # holds an inotify descriptor
+        return state
+
+    def _path(self):
+        return os.path.join(path_of_files, self.env["filename"])
 
-        return result
+    def view(self, user=None):
+        if not self._lines:
+            return '<div class="text-gray-500 text-center">No lines yet</div>'
+        lines = "\n".join(html.escape(line) for line in self._lines)
+        return f'<pre class="text-sm whitespace-pre-wrap">{lines}</pre>'
 
-    def refresh(self):  # it does what is should do again in order to create new data
+    def refresh(self):  # reads what was appended since the last refresh, False when nothing changed
         if not self.env["filename"]:
-            return
+            return False
+        path = self._path()
+        max_lines = max(1, int(self.env.get("numberoflines") or 10))
+        if self._tailer is None or self._tailer.path != path or self._tailer.max_lines != max_lines:
+            if self._tailer is not None:
+                self._tailer.close()
+            self._tailer = Tailer(path, max_lines)
         try:
-            current_size = os.path.getsize(self.env["filename"])
-            if current_size > self._last_size:
-                with open(self.env["filename"], 'r') as f:
-                    content = f.readlines()
-                    self._lines = content[-self.env["numberoflines"]:]
-                self._last_size = current_size
-        except:
-            self._lines = []
+            changed = self._tailer.poll()
+        except OSError as e:
+            print(f"Error reading {path}: {e}")
+            self._tailer.close()
+            self._tailer = None
+            self._lines = deque(maxlen=max_lines)
+            return True
+        if changed:
+            self._lines = deque(self._tailer.visible_lines(), maxlen=max_lines)
+        return changed
+
+    def close(self):
+        if self._tailer is not None:
+            self._tailer.close()
+            self._tailer = None
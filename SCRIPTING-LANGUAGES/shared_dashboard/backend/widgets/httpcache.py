@@ -0,0 +1,224 @@
+import gzip
+import http.client
+import re
+import ssl
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock
+from urllib.parse import urljoin, urlsplit
+
+_MAX_AGE = re.compile(r"(?:^|,)\s*max-age\s*=\s*\"?(\d+)", re.I)
+_STALE_WHILE_REVALIDATE = re.compile(r"(?:^|,)\s*stale-while-revalidate\s*=\s*\"?(\d+)", re.I)
+_CHARSET = re.compile(r"charset=([\w-]+)", re.I)
+_REDIRECTS = {301, 302, 303, 307, 308}
+
+
+class CachedResponse:
+    """Body and validators of a fetched URL, fresh for max_age seconds after it was fetched"""
+
+    def __init__(self, url, status, body, etag=None, last_modified=None, max_age=0.0, stale_window=0.0,
+                 fetched=0.0, store=True):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.max_age = max_age
+        self.stale_window = stale_window  # seconds past max_age the body is served while revalidating
+        self.fetched = fetched
+        self.store = store
+
+    def fresh(self, now):
+        return now - self.fetched < self.max_age
+
+    def servable_stale(self, now):
+        return now - self.fetched < self.max_age + self.stale_window
+
+
+class ConnectionPool:
+    """Idle keep-alive HTTP(S) connections per (scheme, host, port), shared by all worker threads"""
+
+    def __init__(self, max_idle=4, timeout=5.0):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}  # (scheme, host, port) -> [connection]
+        self._lock = Lock()
+        self._context = ssl.create_default_context()
+        self._context.check_hostname = False  # as before: certificates are not checked
+        self._context.verify_mode = ssl.CERT_NONE
+        self.opened = 0
+        self.reused = 0
+
+    @contextmanager
+    def connection(self, scheme, host, port):
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+            if conn is not None:
+                self.reused += 1
+            else:
+                self.opened += 1
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._context)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        try:
+            yield conn
+        except Exception:
+            conn.close()  # a half-read response leaves the connection unusable
+            raise
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if conn.sock is not None and len(idle) < self.max_idle:
+                idle.append(conn)
+                conn = None
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class HTTPCache:
+    """GET cache shared by URLGetter widgets.
+
+    A fresh entry (Cache-Control max-age, default_ttl without one) is returned without a request.
+    Past that, an entry is still returned for stale_window seconds (the response's
+    stale-while-revalidate, or default_stale) while one background request revalidates it. Otherwise
+    the caller fetches. Revalidation is conditional on ETag/Last-Modified, so an unchanged resource
+    costs a 304. Concurrent fetches of one URL share a single request. A failed request keeps a
+    stale entry in use.
+    """
+
+    def __init__(self, pool=None, max_entries=256, default_ttl=5.0, default_stale=30.0, max_body=1024 * 1024,
+                 clock=time.monotonic):
+        self.pool = pool or ConnectionPool()
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.default_stale = default_stale
+        self.max_body = max_body
+        self.clock = clock
+        self._entries = {}  # url -> CachedResponse
+        self._inflight = {}  # url -> Future of the request in progress
+        self._lock = Lock()
+        self._revalidator = ThreadPoolExecutor(max_workers=2, thread_name_prefix="http-revalidate")
+        self._counts = {"hits": 0, "stale": 0, "fetches": 0, "not_modified": 0, "coalesced": 0, "errors": 0}
+
+    def get(self, url):
+        """The cached response of url, fetching or revalidating it as needed"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and entry.fresh(now):
+                self._counts["hits"] += 1
+                return entry
+            if entry is not None and entry.servable_stale(now):
+                self._counts["stale"] += 1
+                if url not in self._inflight:
+                    self._inflight[url] = future = Future()
+                    self._revalidator.submit(self._fetch, url, entry, future)
+                return entry
+            future = self._inflight.get(url)
+            leader = future is None
+            if leader:
+                self._inflight[url] = future = Future()
+            else:
+                self._counts["coalesced"] += 1
+        if leader:
+            self._fetch(url, entry, future)
+        return future.result()
+
+    def cached(self, url):
+        """The cached response of url without any request, None if there is none"""
+        with self._lock:
+            return self._entries.get(url)
+
+    def _fetch(self, url, entry, future):
+        try:
+            result = self._request(url, entry)
+        except Exception as e:
+            with self._lock:
+                self._counts["errors"] += 1
+            result = entry if entry is not None else CachedResponse(url, None, f"Error fetching URL: {e}", store=False)
+        with self._lock:
+            if result.store:
+                self._entries.pop(url, None)
+                self._entries[url] = result  # newest last, the oldest entries go first
+                while len(self._entries) > self.max_entries:
+                    del self._entries[next(iter(self._entries))]
+            self._inflight.pop(url, None)
+        future.set_result(result)
+
+    def _request(self, url, entry):
+        headers = {"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip, deflate"}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        location = url
+        for _ in range(5):
+            parts = urlsplit(location)
+            scheme = parts.scheme or "http"
+            port = parts.port or (443 if scheme == "https" else 80)
+            path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            with self.pool.connection(scheme, parts.hostname, port) as conn:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                body = response.read(self.max_body + 1)
+                if not response.isclosed():
+                    conn.close()  # the rest of an oversized body is not read
+            if response.status in _REDIRECTS and response.getheader("Location"):
+                location = urljoin(location, response.getheader("Location"))
+                continue
+            break
+        now = self.clock()
+        with self._lock:
+            self._counts["fetches"] += 1
+        max_age, stale_window, store = self._freshness(response.getheader("Cache-Control", ""))
+        if response.status == 304 and entry is not None:
+            with self._lock:
+                self._counts["not_modified"] += 1
+            return CachedResponse(url, entry.status, entry.body, response.getheader("ETag", entry.etag),
+                                  response.getheader("Last-Modified", entry.last_modified),
+                                  max_age, stale_window, now, store)
+        return CachedResponse(url, response.status, self._decode(response, body[:self.max_body]),
+                              response.getheader("ETag"), response.getheader("Last-Modified"),
+                              max_age, stale_window, now, store and response.status == 200)
+
+    def _freshness(self, cache_control):
+        """(max_age, stale_window, store) of a Cache-Control header"""
+        directives = cache_control.lower()
+        if "no-store" in directives:
+            return 0.0, 0.0, False
+        max_age = _MAX_AGE.search(directives)
+        stale = _STALE_WHILE_REVALIDATE.search(directives)
+        if "no-cache" in directives:
+            max_age_value = 0.0
+        else:
+            max_age_value = float(max_age.group(1)) if max_age else self.default_ttl
+        return max_age_value, float(stale.group(1)) if stale else self.default_stale, True
+
+    def _decode(self, response, body):
+        encoding = (response.getheader("Content-Encoding") or "").lower()
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "deflate":
+            body = zlib.decompress(body)
+        charset = _CHARSET.search(response.getheader("Content-Type") or "")
+        return body.decode(charset.group(1) if charset else "utf-8", "replace")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, cached=len(self._entries), inflight=len(self._inflight),
+                        connections_opened=self.pool.opened, connections_reused=self.pool.reused)
+
+
+http_cache = HTTPCache()
@@ -1,4 +1,32 @@
+import time
 from .base import BaseWidget
+from .render import Template
+
+ROTATE_SVG = Template("""
+<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 100" width="400" height="100">
+    <defs>
+        <linearGradient id="gradient" x1="0%" y1="0%" x2="100%" y2="100%">
+            <stop offset="0%" style="stop-color:#56CCF2;stop-opacity:1" />
+            <stop offset="100%" style="stop-color:#2F80ED;stop-opacity:1" />
+        </linearGradient>
+    </defs>
+    <style>
+        @keyframes fadeIn {
+            0% { opacity: 0; transform: scale(0.9); }
+            50% { opacity: 1; transform: scale(1); }
+            100% { opacity: 1; }
+        }
+        .message-box {
+            animation: fadeIn 1s ease-out;
+        }
+    </style>
+    <!-- Background -->
+    <rect x="0" y="0" width="400" height="100" fill="url(#gradient)" rx="15" />
+    <!-- Message Text -->
+    <text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" font-size="20" fill="{{ fill }}"
+          font-family="Arial, sans-serif" class="message-box rotate-message">{{ message }}</text>
+</svg>
+""")
 
 
 class MessageRotate(BaseWidget):
@@ -9,6 +37,7 @@ class MessageRotate(BaseWidget):
         self.params = {}
         self.refresh_interval = 3
         self._current_index = 0
+        self._epoch = time.monotonic()  # rotation starts here, every refresh_interval shows the next message
 
     @classmethod
     def desc(cls):
@@ -23,50 +52,24 @@ class MessageRotate(BaseWidget):
             ("current_index", "int")
         ]
 
+    def _message(self):
+        return self.env["messages"][self._current_index % len(self.env["messages"])].strip()
+
     def view(self, user=None):
         if not self.env["messages"]:
-            return """
-            <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 100" width="400" height="100">
-                <rect x="0" y="0" width="400" height="100" fill="url(#gradient)" rx="15" />
-                <text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" font-size="20" fill="#ccc" font-family="Arial, sans-serif">
-                    No messages
-                </text>
-            </svg>
-            """
-        print(self.env["messages"])
-        self._current_index = self._current_index % len(self.env["messages"])
-        current_message = self.env["messages"][self._current_index]
-        current_message = current_message.strip()
+            return ROTATE_SVG.render(message="No messages", fill="#ccc")
+        return ROTATE_SVG.render(message=self._message(), fill="#ffffff")
 
-        return f"""
-        <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 100" width="400" height="100">
-            <defs>
-                <linearGradient id="gradient" x1="0%" y1="0%" x2="100%" y2="100%">
-                    <stop offset="0%" style="stop-color:#56CCF2;stop-opacity:1" />
-                    <stop offset="100%" style="stop-color:#2F80ED;stop-opacity:1" />
-                </linearGradient>
-            </defs>
-            <style>
-                @keyframes fadeIn {{
-                    0% {{ opacity: 0; transform: scale(0.9); }}
-                    50% {{ opacity: 1; transform: scale(1); }}
-                    100% {{ opacity: 1; }}
-                }}
-                .message-box {{
-                    animation: fadeIn 1s ease-out;
-                }}
-            </style>
-            <!-- Background -->
-            <rect x="0" y="0" width="400" height="100" fill="url(#gradient)" rx="15" />
-            <!-- Message Text -->
-            <text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" font-size="20" fill="#ffffff" font-family="Arial, sans-serif" class="message-box">
-                {current_message}
-            </text>
-        </svg>
-        """
+    def live_state(self):
+        """What browsers need to show the rotation without fetching the component"""
+        return {"index": self._current_index, "message": self._message() if self.env["messages"] else ""}
 
-    def refresh(self):
-        print("refreşlendi")
-        return
-        if self.env["messages"]:
-            self._current_index = (self._current_index + 1) % len(self.env["messages"])
+    def refresh(self):  # the index follows the backend clock, False until it moves on
+        if not self.env["messages"]:
+            return False
+        period = max(float(self.refresh_interval or 3), 0.1)
+        index = int((time.monotonic() - self._epoch) / period) % len(self.env["messages"])
+        if index == self._current_index:
+            return False
+        self._current_index = index
+        return True
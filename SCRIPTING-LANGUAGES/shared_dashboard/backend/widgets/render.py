@@ -0,0 +1,64 @@
+import re
+from html import escape
+
+_SLOT = re.compile(r"\{\{\s*(\w+)\s*(\|\s*raw\s*)?\}\}")
+
+
+def _minify(source):
+    """Joins lines, drops comments and the whitespace between tags, text inside tags is kept"""
+    source = re.sub(r"<!--.*?-->", "", source, flags=re.S)
+    return re.sub(r">\s+<", "><", re.sub(r"\s*\n\s*", " ", source)).strip()
+
+
+def _text(value):
+    return escape(value) if isinstance(value, str) else str(value)
+
+
+class Template:
+    """An SVG/HTML skeleton compiled once into static chunks and named slots.
+
+    {{ name }} slots are escaped, {{ name | raw }} slots take markup such as an already rendered
+    fragment. Rendering copies a prebuilt list buffer, drops the slot values into their positions
+    and joins once, so the static text is never formatted again.
+    """
+
+    def __init__(self, source, minify=True):
+        parts = _SLOT.split(_minify(source) if minify else source)
+        self._buffer = []
+        self._slots = []  # (buffer position, name, raw)
+        for i in range(0, len(parts), 3):
+            if parts[i]:
+                self._buffer.append(parts[i])
+            if i + 1 < len(parts):
+                self._slots.append((len(self._buffer), parts[i + 1], bool(parts[i + 2])))
+                self._buffer.append("")
+        self.names = tuple(name for _, name, _ in self._slots)
+
+    def render(self, **values):
+        buffer = self._buffer.copy()
+        for position, name, raw in self._slots:
+            value = values[name]
+            buffer[position] = value if raw else _text(value)
+        return "".join(buffer)
+
+    def render_rows(self, rows):
+        """Renders the template once per row, a row holds the slot values in slot order"""
+        out = []
+        buffer, slots = self._buffer, self._slots
+        for row in rows:
+            filled = buffer.copy()
+            for (position, _, raw), value in zip(slots, row):
+                filled[position] = value if raw else _text(value)
+            out.extend(filled)
+        return "".join(out)
+
+
+# result tables of DBQuery and DBUpdate
+TABLE_HEADER = Template('<text x="{{ x }}" y="40" font-weight="bold">{{ text }}</text>')
+TABLE_CELL = Template('<text x="{{ x }}" y="{{ y }}">{{ text }}</text>')
+TABLE_SVG = Template("""
+<svg xmlns="http://www.w3.org/2000/svg" font-family="Arial" font-size="18">
+    {{ header | raw }}{{ cells | raw }}
+    <text x="20" y="{{ footer_y }}" font-size="12" fill="#6b7280">{{ footer }}</text>
+</svg>
+""")
@@ -0,0 +1,139 @@
+import time
+from array import array
+from threading import Event, Lock, Thread
+
+import psutil
+
+
+class Series:
+    """Fixed size ring of float32 samples"""
+
+    def __init__(self, capacity):
+        self._values = array("f", bytes(4 * capacity))
+        self._next = 0
+        self.count = 0
+
+    @property
+    def capacity(self):
+        return len(self._values)
+
+    def append(self, value):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % len(self._values)
+        self.count = min(self.count + 1, len(self._values))
+
+    def last(self, n):
+        """The newest n samples, oldest first"""
+        n = min(n, self.count)
+        start = (self._next - n) % len(self._values)
+        if start + n <= len(self._values):
+            return self._values[start:start + n].tolist()
+        return self._values[start:].tolist() + self._values[:self._next].tolist()
+
+    def latest(self, default=0.0):
+        return self._values[self._next - 1] if self.count else default
+
+
+class SystemSampler:
+    """Samples host metrics once per interval for every SysStat widget of the process.
+
+    Widgets hold leases renewed on each of their refreshes, the sampling thread runs only while a
+    lease is live and stops by itself once the last one expires. Per-core usage and the busiest
+    processes are sampled only while a lease asks for the breakdown.
+    """
+
+    metrics = ("cpu", "mem", "load")
+
+    def __init__(self, interval=1.0, capacity=3600, lease=10.0, process_every=5, top_processes=5):
+        self.interval = interval
+        self.capacity = capacity  # samples kept per metric, an hour at one per second
+        self.lease = lease
+        self.process_every = process_every  # process scans are costly, one every few samples
+        self.top_processes = top_processes
+        self.series = {metric: Series(capacity) for metric in self.metrics}
+        self.cores = []  # Series per core while a breakdown is requested
+        self.processes = []  # [(name, cpu %, mem %)] of the last process scan
+        self.version = 0  # number of samples taken
+        self._leases = {}  # key -> (expires, breakdown)
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self._cpu_count = psutil.cpu_count() or 1
+
+    def subscribe(self, key, breakdown=False):
+        """Takes or renews the lease of key, starting the sampler if it was idle"""
+        with self._lock:
+            self._leases[key] = (time.monotonic() + self.lease, breakdown)
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = Thread(target=self._run, name="system-sampler", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, key):
+        with self._lock:
+            self._leases.pop(key, None)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        due = time.monotonic()
+        while not self._stop.is_set():
+            with self._lock:
+                now = time.monotonic()
+                self._leases = {key: lease for key, lease in self._leases.items() if lease[0] > now}
+                if not self._leases:
+                    self._thread = None
+                    return
+                breakdown = any(lease[1] for lease in self._leases.values())
+            self._sample(breakdown)
+            due += self.interval
+            delay = due - time.monotonic()
+            if delay < 0:  # fell behind, keep the cadence from now on instead of catching up
+                due, delay = time.monotonic(), 0
+            self._stop.wait(delay)
+
+    def _sample(self, breakdown):
+        per_core = psutil.cpu_percent(percpu=True) if breakdown else None
+        cpu = sum(per_core) / len(per_core) if per_core else psutil.cpu_percent()
+        mem = psutil.virtual_memory().percent
+        load = psutil.getloadavg()[0] / self._cpu_count * 100
+        processes = self._scan_processes() if breakdown and self.version % self.process_every == 0 else None
+        with self._lock:
+            for metric, value in zip(self.metrics, (cpu, mem, load)):
+                self.series[metric].append(value)
+            if per_core:
+                if len(self.cores) != len(per_core):
+                    self.cores = [Series(self.capacity) for _ in per_core]
+                for series, value in zip(self.cores, per_core):
+                    series.append(value)
+            elif self.cores:
+                self.cores, self.processes = [], []  # nobody looks at the breakdown anymore
+            if processes is not None:
+                self.processes = processes
+            self.version += 1
+
+    def _scan_processes(self):
+        rows = []
+        for process in psutil.process_iter(["name", "cpu_percent", "memory_percent"]):
+            info = process.info
+            rows.append((info["name"] or str(process.pid), info["cpu_percent"] or 0.0, info["memory_percent"] or 0.0))
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:self.top_processes]
+
+    def window(self, seconds):
+        """{metric: samples of the last seconds}, with "cores" while the breakdown is sampled"""
+        n = max(1, int(seconds / self.interval))
+        with self._lock:
+            result = {metric: series.last(n) for metric, series in self.series.items()}
+            if self.cores:
+                result["cores"] = [series.last(n) for series in self.cores]
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {"samples": self.version, "subscribers": len(self._leases),
+                    "running": self._thread is not None, "breakdown": bool(self.cores)}
+
+
+sampler = SystemSampler()
@@ -1,58 +1,144 @@
-import time
-
-import psutil
 from .base import BaseWidget
+from .render import Template
+from .sampler import sampler
+
+WINDOWS = (60, 300, 900, 3600)  # seconds of history a SysStat can show
+SPARK_POINTS = 120  # samples of a window are averaged down to this many points
+
+SPARKLINE = Template("<polyline points='{{ points }}' class='spark' />")
+CORE_ROW = Template("""
+<text x='10' y='{{ y }}' class='small'>{{ label }}</text>
+<rect x='60' y='{{ bar_y }}' width='150' height='10' class='bar-bg' />
+<rect x='60' y='{{ bar_y }}' width='{{ width }}' height='10' class='bar' />
+""")
+PROCESS_ROW = Template("""
+<text x='10' y='{{ y }}' class='small'>{{ name }}</text>
+<text x='210' y='{{ y }}' class='small' text-anchor='end'>{{ usage }}</text>
+""")
+SYSSTAT_SVG = Template("""
+<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 220 {{ height }}' width='300'>
+    <style>
+        .label { font: bold 12px sans-serif; fill: #444; }
+        .value { font: bold 14px sans-serif; fill: #555; }
+        .small { font: 10px sans-serif; fill: #666; }
+        .bar-bg { fill: #f1f1f1; stroke: #ddd; stroke-width: 0.5; rx: 5; ry: 5; }
+        .bar { fill: url(#gradient); rx: 5; ry: 5; }
+        .spark { fill: none; stroke: #2196F3; stroke-width: 1; }
+    </style>
+    <defs>
+        <linearGradient id="gradient" x1="0%" y1="0%" x2="100%" y2="0%">
+            <stop offset="0%" style="stop-color:#4CAF50;stop-opacity:1" />
+            <stop offset="100%" style="stop-color:#2196F3;stop-opacity:1" />
+        </linearGradient>
+    </defs>
+
+    <!-- CPU Usage -->
+    <rect x='10' y='20' width='200' height='15' class='bar-bg' />
+    <rect x='10' y='20' width='{{ cpu_width }}' height='15' class='bar' />
+    <text x='10' y='15' class='label'>CPU Usage</text>
+    <text x='210' y='15' class='value' text-anchor='end'>{{ cpu_value }}</text>
+    {{ cpu_spark | raw }}
+
+    <!-- Memory Usage -->
+    <rect x='10' y='90' width='200' height='15' class='bar-bg' />
+    <rect x='10' y='90' width='{{ mem_width }}' height='15' class='bar' />
+    <text x='10' y='85' class='label'>Memory Usage</text>
+    <text x='210' y='85' class='value' text-anchor='end'>{{ mem_value }}</text>
+    {{ mem_spark | raw }}
+
+    <!-- Load -->
+    <text x='10' y='155' class='label'>Load</text>
+    <text x='210' y='155' class='value' text-anchor='end'>{{ load_value }}</text>
+    {{ load_spark | raw }}
+    <text x='210' y='198' class='small' text-anchor='end'>{{ window }}</text>
+    {{ cores | raw }}{{ processes | raw }}
+</svg>
+""")
+
+
+def downsample(values, points=SPARK_POINTS):
+    """Averages consecutive samples so a long window still draws points points"""
+    if len(values) <= points:
+        return values
+    step = len(values) / points
+    buckets = (values[int(i * step):int((i + 1) * step)] for i in range(points))
+    return [sum(bucket) / len(bucket) for bucket in buckets]
+
+
+def sparkline(values, x, y, width=200, height=24, ceiling=100.0):
+    """SVG polyline of percentages, the newest sample at the right edge"""
+    if len(values) < 2:
+        return ""
+    step = width / (len(values) - 1)
+    points = " ".join(f"{x + i * step:.1f},{y + height - min(value, ceiling) / ceiling * height:.1f}"
+                      for i, value in enumerate(values))
+    return SPARKLINE.render(points=points)
 
 
 class SysStat(BaseWidget):
     def __init__(self):
         super().__init__("SysStat", "System Statistics")
+        self.env = {"window": 60}  # seconds of history in the sparklines
+        self.events = ["refresh", "window", "breakdown"]
         self._stats = {
             "cpu_usage": 0,
             "mem_usage": 0,
             "load_avg": []
         }
+        self._history = {}  # metric -> downsampled samples of the window
+        self._cores = []  # latest usage per core while the breakdown is on
+        self._processes = []
+        self._breakdown = False
+        self._seen = None  # (sampler version, window, breakdown) of the last refresh
 
     @classmethod
     def desc(cls):
         return "A widget to check the health of the system"
 
+    def _get_specific_attrs(self):
+        return [("window", "int")]
+
     def view(self, user=None):
         cpu_usage = self._stats["cpu_usage"]
         mem_usage = self._stats["mem_usage"]
+        load = (self._stats["load_avg"] or [0])[0]
+        top = 220 + 20 * len(self._cores)
+        return SYSSTAT_SVG.render(
+            height=200 + 20 * len(self._cores) + 16 * len(self._processes),
+            cpu_width=f"{cpu_usage * 2:.1f}", cpu_value=f"{cpu_usage:.1f}%",
+            cpu_spark=sparkline(self._history.get("cpu", []), 10, 40),
+            mem_width=f"{mem_usage * 2:.1f}", mem_value=f"{mem_usage:.1f}%",
+            mem_spark=sparkline(self._history.get("mem", []), 10, 110),
+            load_value=f"{load:.1f}%", load_spark=sparkline(self._history.get("load", []), 10, 160),
+            window=f"last {int(self.env.get('window', 60)) // 60} min",
+            cores=CORE_ROW.render_rows((222 + 20 * i, f"core {i}", 212 + 20 * i, f"{usage * 1.5:.1f}")
+                                       for i, usage in enumerate(self._cores)),
+            processes=PROCESS_ROW.render_rows((top + 16 * i, name[:24], f"{cpu:.1f}% / {mem:.1f}%")
+                                              for i, (name, cpu, mem) in enumerate(self._processes)))
+
+    def trigger(self, event, params):
+        if event == "window":
+            window = int(params.get("window", 60))
+            self.env["window"] = min(WINDOWS, key=lambda w: abs(w - window))
+            self.refresh()
+        elif event == "breakdown":  # per-core and per-process usage, sampled only while someone shows it
+            self._breakdown = str(params.get("breakdown", not self._breakdown)).lower() in ("1", "true", "on")
+            self.refresh()
+        else:
+            super().trigger(event, params)
 
-        svg_template = f"""
-        <svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 220 120' width='300'>
-            <style>
-                .label {{ font: bold 12px sans-serif; fill: #444; }}
-                .value {{ font: bold 14px sans-serif; fill: #555; }}
-                .bar-bg {{ fill: #f1f1f1; stroke: #ddd; stroke-width: 0.5; rx: 5; ry: 5; }}
-                .bar {{ fill: url(#gradient); rx: 5; ry: 5; }}
-            </style>
-            <defs>
-                <linearGradient id="gradient" x1="0%" y1="0%" x2="100%" y2="0%">
-                    <stop offset="0%" style="stop-color:#4CAF50;stop-opacity:1" />
-                    <stop offset="100%" style="stop-color:#2196F3;stop-opacity:1" />
-                </linearGradient>
-            </defs>
-
-            <!-- CPU Usage -->
-            <rect x='10' y='20' width='200' height='15' class='bar-bg' />
-            <rect x='10' y='20' width='{cpu_usage * 2}' height='15' class='bar' />
-            <text x='10' y='15' class='label'>CPU Usage</text>
-            <text x='210' y='15' class='value' text-anchor='end'>{cpu_usage:.1f}%</text>
-
-            <!-- Memory Usage -->
-            <rect x='10' y='60' width='200' height='15' class='bar-bg' />
-            <rect x='10' y='60' width='{mem_usage * 2}' height='15' class='bar' />
-            <text x='10' y='55' class='label'>Memory Usage</text>
-            <text x='210' y='55' class='value' text-anchor='end'>{mem_usage:.1f}%</text>
-        </svg>
-        """
-
-        return svg_template
-
-    def refresh(self):
-        self._stats["cpu_usage"] = psutil.cpu_percent()
-        self._stats["mem_usage"] = psutil.virtual_memory().percent
-        self._stats["load_avg"] = [x / psutil.cpu_count() * 100 for x in psutil.getloadavg()]
+    def refresh(self):  # reads the shared sampler, False when it has no new sample
+        sampler.subscribe(self.id, self._breakdown)
+        window = int(self.env.get("window", 60))
+        seen = (sampler.version, window, self._breakdown)
+        if seen == self._seen:
+            return False
+        self._seen = seen
+        samples = sampler.window(window)
+        self._history = {metric: downsample(samples[metric]) for metric in sampler.metrics}
+        self._stats["cpu_usage"] = samples["cpu"][-1] if samples["cpu"] else 0
+        self._stats["mem_usage"] = samples["mem"][-1] if samples["mem"] else 0
+        self._stats["load_avg"] = samples["load"][-1:]
+        self._cores = [series[-1] for series in samples.get("cores", []) if series] if self._breakdown else []
+        self._processes = list(sampler.processes) if self._breakdown else []
+        return True
@@ -0,0 +1,101 @@
+import os
+from collections import deque
+from threading import Lock
+from .dirwatch import DirectoryWatch
+
+
+class Tailer:
+    """Keeps the last max_lines lines of a growing file, reading only what was appended.
+
+    The first read, and any read after rotation (new inode) or truncation (file shrank), scans
+    backwards from the end of the file. With inotify, poll() returns at once while the file has
+    no events; elsewhere it compares sizes on every call. A last line without a newline yet is
+    shown as it is and completed by the next read.
+    """
+
+    block_size = 8192
+    max_append = 4 * 1024 * 1024  # appended bytes past this are skipped with a fresh tail scan
+
+    def __init__(self, path, max_lines=10, use_inotify=True):
+        self.path = path
+        self.lines = deque(maxlen=max_lines)
+        self._offset = 0
+        self._inode = None
+        self._partial = b""  # last line while it has no newline yet
+        self._lock = Lock()  # a triggered refresh and the scheduled one may poll at the same time
+        self._watch = None
+        if use_inotify:
+            try:
+                self._watch = DirectoryWatch(os.path.dirname(path), os.path.basename(path))
+            except (OSError, AttributeError, TypeError):
+                self._watch = None  # no inotify on this platform, poll instead
+
+    @property
+    def max_lines(self):
+        return self.lines.maxlen
+
+    def visible_lines(self):
+        """The last max_lines lines, including one still missing its newline"""
+        with self._lock:
+            lines = list(self.lines)
+            if self._partial:
+                lines.append(self._partial.decode("utf-8", "replace"))
+            return lines[-self.max_lines:]
+
+    def poll(self):
+        """Reads new data, returns True if the visible lines changed"""
+        with self._lock:
+            return self._poll()
+
+    def _poll(self):
+        if self._watch is not None and self._inode is not None and not self._watch.changed():
+            return False
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            had_lines = bool(self.lines)
+            self.lines.clear()
+            self._inode, self._offset, self._partial = None, 0, b""
+            return had_lines
+        if st.st_ino != self._inode or st.st_size < self._offset \
+                or st.st_size - self._offset > self.max_append:
+            self._tail(st)
+            return True
+        if st.st_size == self._offset:
+            return False
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        self._offset += len(data)
+        return self._feed(data)
+
+    def _feed(self, data):
+        partial = self._partial
+        *complete, self._partial = (partial + data).split(b"\n")
+        for line in complete:
+            self.lines.append(line.decode("utf-8", "replace"))
+        return bool(complete) or self._partial != partial
+
+    def _tail(self, st):
+        """Reads blocks backwards from EOF until max_lines full lines are in hand"""
+        self._inode, self._offset, self._partial = st.st_ino, st.st_size, b""
+        self.lines.clear()
+        blocks, newlines, position = [], 0, st.st_size
+        with open(self.path, "rb") as f:
+            while position > 0 and newlines <= self.max_lines:
+                size = min(self.block_size, position)
+                position -= size
+                f.seek(position)
+                block = f.read(size)
+                newlines += block.count(b"\n")
+                blocks.append(block)
+        data = b"".join(reversed(blocks))
+        if position > 0:
+            data = data[data.index(b"\n") + 1:]  # drop the cut first line
+        self._feed(data)
+
+    def close(self):
+        with self._lock:
+            if self._watch is not None:
+                self._watch.close()
+                self._watch = None
@@ -1,70 +1,101 @@
 # widgets/timer.py
 from .base import BaseWidget
+from .render import Template
 import time
 
+TIMER_SVG = Template('''<svg viewBox="0 0 100 100" class="w-32 h-32 timer-widget"
+     data-running="{{ running }}" data-elapsed="{{ elapsed }}" data-started-at="{{ started_at }}">
+    <circle cx="50" cy="50" r="45" fill="none" stroke="#eee" stroke-width="6"/>
+    <path d="M50 5 A45 45 0 1 1 49.99 5" class="timer-arc"
+          fill="none"
+          stroke="#3b82f6"
+          stroke-width="6"
+          stroke-dasharray="282.743"
+          stroke-dashoffset="{{ offset }}"/>
+    <text x="50" y="25" text-anchor="middle" font-size="20" fill="#333" class="timer-clock">{{ clock }}</text>
+    <text x="50" y="57" text-anchor="middle" font-size="12" fill="#666" class="timer-state">{{ state }}</text>
+</svg>''')
+
 
 class Timer(BaseWidget):
     def __init__(self):
         super().__init__("Timer", "Timer Widget")
         self.env = {"value": 0}
         self.events = ["refresh", "pause", "play", "reset", "start", "stop"]
+        self.refresh_interval = 0  # only events change the state, browsers advance the clock themselves
         self._running = False
-        self._start_time = None
-        self._elapsed = 0
+        self._start_time = None  # time.monotonic() of the last start, backend only
+        self._started_at = None  # time.time() of the same moment, for views rendered in other processes
+        self._elapsed = 0  # seconds accumulated before the last start
+        self.cache_view = False  # view depends on the wall clock while running
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_start_time"] = None  # monotonic time means nothing in another process
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._running and self._started_at is not None:  # e.g. a component restored from the operation log
+            self._start_time = time.monotonic() - max(0.0, time.time() - self._started_at)
+
+    def current(self):
+        """Elapsed seconds, from the monotonic clock on the backend and the wall clock elsewhere"""
+        if not self._running:
+            return self._elapsed
+        if self._start_time is not None:
+            return self._elapsed + time.monotonic() - self._start_time
+        return self._elapsed + max(0.0, time.time() - self._started_at)
 
     def view(self, user=None):
-        current = self._elapsed
-        if self._running and self._start_time:
-            current += time.time() - self._start_time
-        seconds = int(current)
+        seconds = int(self.current())
         minutes = seconds // 60
         remaining_seconds = seconds % 60
 
-        svg = f'''<svg viewBox="0 0 100 100" class="w-32 h-32">
-            <circle cx="50" cy="50" r="45" fill="none" stroke="#eee" stroke-width="6"/>
-            <path d="M50 5 A45 45 0 1 1 49.99 5" 
-                  fill="none" 
-                  stroke="#3b82f6" 
-                  stroke-width="6"
-                  stroke-dasharray="282.743"
-                  stroke-dashoffset="{282.743 * (1 - (seconds % 60) / 60)}"/>
-            <text x="50" y="25" text-anchor="middle" font-size="20" fill="#333">
-                {minutes:02d}:{remaining_seconds:02d}
-            </text>
-            <text x="50" y="57" text-anchor="middle" font-size="12" fill="#666">
-                {self._running and "Running" or "Stopped"}
-            </text>
-        </svg>'''
-        return svg
+        return TIMER_SVG.render(offset=f"{282.743 * (1 - (seconds % 60) / 60):.3f}",
+                                clock=f"{minutes:02d}:{remaining_seconds:02d}",
+                                state=self._running and "Running" or "Stopped",
+                                running=int(self._running), elapsed=f"{self._elapsed:.3f}",
+                                started_at=f"{self._started_at or 0:.3f}")
+
+    def live_state(self):
+        """Enough for browsers to run the clock locally until the next event"""
+        return {"running": self._running, "elapsed": self._elapsed, "started_at": self._started_at}
 
     @classmethod
     def desc(cls):
         return "A timer that supports start/stop/play/pause/reset/refresh."
 
+    def _start(self):
+        if not self._running:
+            self._running = True
+            self._start_time = time.monotonic()
+            self._started_at = time.time()
+
+    def _pause(self):
+        if self._running:
+            self._elapsed = self.current()
+            self._running = False
+            self._start_time = self._started_at = None
+
     def trigger(self, event, params=None):  # simple logic in order to handle timer
         if event == "start":
-            self._running = True
-            self._start_time = time.time()
+            self._start()
             return "timer started"
         elif event == "stop":
-            if self._running and self._start_time:
-                self._elapsed += time.time() - self._start_time
-            self._running = False
+            self._pause()
         elif event == "play":
-            self._running = True
-            self._start_time = time.time()
+            self._start()
         elif event == "pause":
-            if self._running and self._start_time:
-                self._elapsed += time.time() - self._start_time
-            self._running = False
+            self._pause()
         elif event == "reset":
             self._running = False
-            self._start_time = None
+            self._start_time = self._started_at = None
             self._elapsed = 0
         elif event == "refresh":
             pass
         else:
             raise ValueError(f"Unknown event: {event}")
 
-
-
+    def refresh(self):
+        return False  # nothing changes between events
@@ -1,7 +1,6 @@
 from .base import BaseWidget
-import urllib.request
+from .httpcache import http_cache
 import json
-import ssl
 
 
 class URLGetter(BaseWidget):
@@ -13,8 +12,9 @@ class URLGetter(BaseWidget):
         }
         self.param = {}  # No user parameters needed
         self.events = ["refresh"]
-        self.refresh_interval = 0  # No auto refresh in Phase 1
+        self.refresh_interval = 10  # cheap while the cached response is fresh
         self._content = "No content fetched yet"
+        self._body = None  # cached body the content was made from
 
     @classmethod
     def desc(cls):
@@ -29,37 +29,29 @@ class URLGetter(BaseWidget):
             ("content", "string")
         ]
 
-    def view(self, user=None):
-        self.refresh()
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_body"] = None  # content already holds it
+        return state
+
+    def view(self, user=None):  # only the content of the last refresh, never a request
         if not self.env["url"]:
             return "[URLGetter: No URL set]"
-        return f"{self._content}"  # Show first 50 chars
+        return f"{self._content}"
 
-    def refresh(self):
+    def refresh(self):  # runs on an executor thread, False when the content did not change
         if not self.env["url"]:
-            self._content = "No URL set"
-            return
-
-        try:
-            context = ssl.create_default_context()  # creates a ssl context
-            context.check_hostname = False  # currently not checking hostname (may be changed later)
-            context.verify_mode = ssl.CERT_NONE  # no certificate is required
-
-            request = urllib.request.Request(
-                self.env["url"],
-                headers={'User-Agent': 'Mozilla/5.0'}
-            )
-
-            with urllib.request.urlopen(request, context=context, timeout=5) as response:  # try to open the url
-                content = response.read().decode('utf-8')  # then get the data
-
-                try:
-                    json_content = json.loads(content)
-                    self._content = json.dumps(json_content, indent=2)  # return it at json format
-                except json.JSONDecodeError:
-                    self._content = content
-
-        except Exception as e:
-            self._content = f"Error fetching URL: {str(e)}"
-
-
+            content = "No URL set"
+        else:
+            response = http_cache.get(self.env["url"])
+            if response.body is self._body:
+                return False  # served from the cache or not modified
+            self._body = response.body
+            try:
+                content = json.dumps(json.loads(response.body), indent=2)  # return it at json format
+            except json.JSONDecodeError:
+                content = response.body
+        if content == self._content:
+            return False
+        self._content = content
+        return True
@@ -0,0 +1,107 @@
+"""Lock contention benchmark: N concurrent websocket clients against M dashboards.
+
+Usage: python benchmarks/lock_contention.py --clients 200 --dashboards 20 --ops 20 [--global-lock]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import websockets
+from backend.server.server import DashboardServer
+from backend.server.lockmanager import LockManager
+
+
+class GlobalLockManager(LockManager):
+    """Reproduces the old behaviour where every dashboard shares one lock"""
+
+    def __init__(self):
+        super().__init__()
+        self._global = asyncio.Lock()
+
+    def dashboard(self, dash_id):
+        return self._global
+
+
+async def request(ws, method, data=None, ids=itertools.count(1)):
+    request_id = next(ids)
+    await ws.send(json.dumps({"id": request_id, "method": method, "data": data or {}}))
+    while True:
+        response = json.loads(await ws.recv())
+        if response.get("id") == request_id:  # skips the pushed notifications and updates
+            return response
+
+
+async def client(url, username, dash_id, ops, save_every, latencies):
+    async with websockets.connect(url, ping_interval=None) as ws:
+        await request(ws, "USER", {"username": username})
+        await request(ws, "attach", {"id": dash_id})
+        created = await request(ws, "component", {"action": "create", "type": "Chat", "env": {}})
+        comp_id = created["data"]["id"]
+        for i in range(ops):
+            start = time.perf_counter()
+            if save_every and i % save_every == save_every - 1:
+                await request(ws, "save")
+            else:
+                await request(ws, "component", {
+                    "action": "trigger", "id": comp_id, "event": "submit",
+                    "params": {"mess": f"message {i}", "username": username}
+                })
+            latencies.append(time.perf_counter() - start)
+
+
+async def run(args):
+    from backend.core.repo import repo
+    data_dir = tempfile.mkdtemp()
+    server = DashboardServer(args.port, db_path=os.path.join(data_dir, "bench.db"),
+                             oplog_dir=os.path.join(data_dir, "oplog"))
+    if args.global_lock:
+        server.locks = GlobalLockManager()
+    await server.prepare()  # executor, scheduler and log as in start_server
+
+    dash_ids = []
+    for i in range(args.dashboards):
+        dash_id = repo.create(name=f"bench-{i}")
+        repo.get_objects()[dash_id].create("main")
+        dash_ids.append(dash_id)
+
+    url = f"ws://127.0.0.1:{args.port}"
+    latencies = []
+    try:
+        async with websockets.serve(server.handle_client, "127.0.0.1", args.port):
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                client(url, f"user{i}", dash_ids[i % len(dash_ids)], args.ops, args.save_every, latencies)
+                for i in range(args.clients)
+            ))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    latencies.sort()
+    mode = "global lock" if args.global_lock else "per-dashboard locks"
+    print(f"{mode}: {args.clients} clients, {args.dashboards} dashboards, {len(latencies)} commands")
+    print(f"  throughput  {len(latencies) / elapsed:10.1f} cmd/s")
+    print(f"  p50 latency {statistics.median(latencies) * 1000:10.2f} ms")
+    print(f"  p99 latency {latencies[int(len(latencies) * 0.99) - 1] * 1000:10.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard lock contention benchmark")
+    parser.add_argument("--clients", type=int, default=100, help="Number of concurrent websocket clients (N)")
+    parser.add_argument("--dashboards", type=int, default=10, help="Number of dashboards (M)")
+    parser.add_argument("--ops", type=int, default=20, help="Commands per client")
+    parser.add_argument("--save-every", type=int, default=5, help="Send a save every n-th command, 0 disables")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--global-lock", action="store_true", help="Serialize all dashboards behind one lock")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
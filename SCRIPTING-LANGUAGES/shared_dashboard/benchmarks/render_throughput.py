@@ -0,0 +1,75 @@
+"""Renders per second and output size of the widget views built on backend/widgets/render.py.
+
+Usage: python benchmarks/render_throughput.py --seconds 1
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.core.repo import repo
+
+
+def build_widgets():
+    """One widget per converted type, filled like a busy dashboard"""
+    widgets = {}
+
+    timer = repo.components.create("Timer")
+    timer.trigger("start")
+    widgets["Timer"] = timer
+
+    rotate = repo.components.create("MessageRotate")
+    rotate.env["messages"] = [f"announcement {i}: the build is green" for i in range(5)]
+    widgets["MessageRotate"] = rotate
+
+    chat = repo.components.create("Chat")
+    for n in range(chat.view_window):
+        chat.history.append(f"user{n % 4}", f"message {n} with <markup> & text")
+    widgets["Chat"] = chat
+
+    query = repo.components.create("DBQuery")
+    query._results["bench"] = {"columns": ["id", "name", "email", "created", "score"],
+                               "rows": [(i, f"name {i}", f"user{i}@example.com", "2024-01-01", random.random())
+                                        for i in range(200)],
+                               "truncated": False}
+    widgets["DBQuery"] = query
+
+    update = repo.components.create("DBUpdate")
+    update._last_result = [(i, f"row {i}", i * 2) for i in range(10)]
+    widgets["DBUpdate"] = update
+
+    stat = repo.components.create("SysStat")
+    stat._stats.update(cpu_usage=42.5, mem_usage=63.1, load_avg=[12.0])
+    stat._history = {metric: [random.uniform(0, 100) for _ in range(120)] for metric in ("cpu", "mem", "load")}
+    stat._cores = [random.uniform(0, 100) for _ in range(8)]
+    stat._processes = [(f"process-{i}", random.uniform(0, 50), random.uniform(0, 5)) for i in range(5)]
+    widgets["SysStat"] = stat
+    return widgets
+
+
+def measure(widget, seconds):
+    renders, size = 0, 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            size = len(widget.view("bench"))
+        renders += 100
+    return renders / (time.perf_counter() - start), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Widget view render throughput")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Time spent rendering each widget")
+    args = parser.parse_args()
+
+    print(f"{'widget':15} {'renders/s':>12} {'us/render':>10} {'bytes':>8}")
+    for name, widget in build_widgets().items():
+        rate, size = measure(widget, args.seconds)
+        print(f"{name:15} {rate:12.0f} {1e6 / rate:10.1f} {size:8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Save/load time and size of the snapshot persistence format against the legacy pickle layout.
+
+Usage: python benchmarks/snapshot_format.py --dashboards 50 --chats 4 --messages 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from backend.core.repo import repo
+from backend.server.persistence import DashboardPersistence
+
+
+def build_dashboards(count, chats, messages):
+    dashboards = []
+    for i in range(count):
+        dash = repo.get_objects()[repo.create(name=f"bench-{i}")]
+        tab = dash.create("main")
+        for col in range(chats):
+            chat = repo.components.create("Chat")
+            chat.messages = [f"12:{n % 60:02d}|user{n % 7}: message number {n} in chat {col}"
+                             for n in range(messages)]
+            tab.place(chat, 0, col)
+        timer = repo.components.create("Timer")
+        tab.place(timer, 1, 0)
+        dashboards.append(dash)
+    return dashboards
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def measure(fmt, dashboards):
+    db_path = os.path.join(tempfile.mkdtemp(), f"{fmt}.db")
+    persistence = DashboardPersistence(db_path, fmt=fmt)
+    save = timed(lambda: [persistence.save_dashboard(dash) for dash in dashboards])
+
+    loaded = []
+    load = timed(lambda: loaded.extend(persistence.load_dashboard(dash.get_id()) for dash in dashboards))
+    history = timed(lambda: [len(comp.messages) for dash in loaded for comp in dash.components()
+                             if hasattr(comp, "messages")])
+    return save, load, history, os.path.getsize(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot vs pickle persistence benchmark")
+    parser.add_argument("--dashboards", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=4, help="Chat widgets per dashboard")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages per chat")
+    args = parser.parse_args()
+
+    dashboards = build_dashboards(args.dashboards, args.chats, args.messages)
+    print(f"{args.dashboards} dashboards x {args.chats} chats x {args.messages} messages")
+    print(f"{'format':10} {'save s':>9} {'load s':>9} {'history s':>10} {'size KiB':>10}")
+    for fmt in ("pickle", "snapshot"):
+        save, load, history, size = measure(fmt, dashboards)
+        print(f"{fmt:10} {save:9.3f} {load:9.3f} {history:10.3f} {size / 1024:10.1f}")
+    print("load excludes chat history for snapshot (lazy); 'history' is the cost of first access")
+
+
+if __name__ == "__main__":
+    main()
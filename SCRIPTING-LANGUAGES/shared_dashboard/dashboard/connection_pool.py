@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+from django.conf import settings
+from .tcp_client import DashboardClient
+from .live import hub
+
+
+class PooledSession:
+    """An authenticated DashboardClient, optionally attached to one dashboard"""
+
+    def __init__(self, username, dash_id, host, port):
+        self.username = username
+        self.dash_id = dash_id
+        self.client = DashboardClient(username, host, port)
+        self.client.set_notification_handler(self._on_push)
+        self.last_used = time.monotonic()
+        self.in_use = 0
+        self.watchers = 0  # open browser streams keeping this session alive
+
+    async def _on_push(self, event):
+        if self.dash_id is None or event.get('actor') == self.username:
+            return  # users are not notified of their own changes
+        hub.publish(self.dash_id, self.username, event)
+
+    async def open(self):
+        response = await self.client.send_command('USER', {'username': self.username})
+        if response.get('status') != 'success':
+            raise ConnectionError(response.get('message', 'USER command failed'))
+        if self.dash_id is not None:
+            response = await self.client.send_command('attach', {'id': self.dash_id, 'snapshot': False})
+            if response.get('status') != 'success':
+                raise ConnectionError(response.get('message', 'attach failed'))
+
+    def healthy(self):
+        return self.client._connected and self.client.wsock is not None
+
+    async def close(self):
+        await self.client.disconnect()
+
+
+class ConnectionPool:
+    """Process-wide pool of backend sessions keyed by username (and the dashboard they are attached to).
+
+    Django may run every request in its own event loop, so the sessions live on a private loop thread
+    and views reach them through run_coroutine_threadsafe. Requests of the same user share a connection
+    and are multiplexed by request id.
+    """
+
+    def __init__(self, host='localhost', port=1234, idle_timeout=300, health_interval=30):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self._sessions = {}  # username -> {dash_id or None -> PooledSession}
+        self._opening = {}  # (username, dash_id) -> lock, avoids opening the same session twice
+        self._loop = None
+        self._thread_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._thread_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._run_loop, name="dashboard-pool", daemon=True).start()
+        return self._loop
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.create_task(self._maintain())
+        self._loop.run_forever()
+
+    def _call(self, coro):
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()))
+
+    async def send(self, username, command, args=None, dash_id=None):
+        """Sends one command over the pooled session of the user, attached to dash_id if given"""
+        return await self._call(self._send(username, command, args, dash_id))
+
+    async def batch(self, username, commands, dash_id=None):
+        """Sends [(command, args), ...] in a single exchange, returns their responses in order"""
+        return await self._call(self._batch(username, commands, dash_id))
+
+    async def release(self, username, dash_id=None):
+        """Closes a session, which detaches it from its dashboard on the backend"""
+        return await self._call(self._release(username, dash_id))
+
+    def send_sync(self, username, command, args=None, dash_id=None, timeout=10):
+        """Blocking send for plain (streaming) views"""
+        coro = self._send(username, command, args, dash_id)
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result(timeout)
+
+    def watch(self, username, dash_id, timeout=10):
+        """Blocking: opens the user's dashboard session and keeps it open for a browser stream"""
+        asyncio.run_coroutine_threadsafe(self._watch(username, dash_id, 1), self._ensure_loop()).result(timeout)
+
+    def unwatch(self, username, dash_id):
+        asyncio.run_coroutine_threadsafe(self._watch(username, dash_id, -1), self._ensure_loop())
+
+    def alive(self, username, dash_id):
+        session = self._sessions.get(username, {}).get(str(dash_id))
+        return session is not None and session.healthy()
+
+    async def _watch(self, username, dash_id, delta):
+        if delta > 0:
+            session = await self._session(username, dash_id)
+        else:
+            session = self._sessions.get(username, {}).get(str(dash_id))
+            if session is None:
+                return
+        session.watchers = max(0, session.watchers + delta)
+        session.last_used = time.monotonic()
+
+    async def _send(self, username, command, args, dash_id):
+        session = await self._session(username, dash_id)
+        session.in_use += 1
+        try:
+            return await session.client.send_command(command, args)
+        finally:
+            session.in_use -= 1
+            session.last_used = time.monotonic()
+
+    async def _batch(self, username, commands, dash_id):
+        session = await self._session(username, dash_id)
+        session.in_use += 1
+        try:
+            return await session.client.send_batch(commands)
+        finally:
+            session.in_use -= 1
+            session.last_used = time.monotonic()
+
+    async def _session(self, username, dash_id):
+        key = None if dash_id is None else str(dash_id)
+        session = self._sessions.get(username, {}).get(key)
+        if session is not None and session.healthy():
+            return session
+
+        lock = self._opening.setdefault((username, key), asyncio.Lock())
+        async with lock:
+            session = self._sessions.get(username, {}).get(key)
+            if session is not None and session.healthy():
+                return session
+            if session is not None:
+                await session.close()
+            session = PooledSession(username, key, self.host, self.port)
+            await session.open()
+            self._sessions.setdefault(username, {})[key] = session
+            return session
+
+    async def _release(self, username, dash_id, session=None):
+        key = None if dash_id is None else str(dash_id)
+        sessions = self._sessions.get(username, {})
+        if session is not None and sessions.get(key) is not session:
+            return  # already replaced by a fresh session
+        session = sessions.pop(key, None)
+        if session is not None:
+            await session.close()
+        if username in self._sessions and not self._sessions[username]:
+            del self._sessions[username]
+
+    async def _maintain(self):
+        """Closes idle sessions and drops the ones failing a health check"""
+        while True:
+            await asyncio.sleep(min(self.health_interval, self.idle_timeout / 2))
+            now = time.monotonic()
+            for username, sessions in list(self._sessions.items()):
+                for key, session in list(sessions.items()):
+                    idle = now - session.last_used
+                    if not session.in_use and idle > self.health_interval and session.healthy():
+                        await session.client.ping()  # marks the client disconnected on failure
+                    if session.watchers and session.healthy():
+                        continue  # streamed to a browser, pushes arrive without any traffic from us
+                    if not session.in_use and (idle > self.idle_timeout or not session.healthy()):
+                        await self._release(username, key, session)
+
+    def stats(self):
+        return {
+            "users": len(self._sessions),
+            "sessions": sum(len(sessions) for sessions in self._sessions.values()),
+        }
+
+
+pool = ConnectionPool(port=getattr(settings, 'DASHBOARD_SERVER_PORT', 1234))
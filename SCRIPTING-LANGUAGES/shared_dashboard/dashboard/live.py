@@ -0,0 +1,129 @@
+import json
+import threading
+from collections import deque
+
+
+class Subscriber:
+    """Send queue of one browser stream.
+
+    Updates coalesce into a single pending event (component id -> latest version, plus the live state
+    of components whose every change came with one), so a slow reader never holds more than one of
+    them. Notifications are kept up to queue_size, the oldest are dropped and counted when the
+    browser does not keep up.
+    """
+
+    def __init__(self, dash_id, username, queue_size=32):
+        self.dash_id = dash_id
+        self.username = username
+        self.dropped = 0
+        self.closed = False
+        self._notifications = deque(maxlen=queue_size)
+        self._components = {}
+        self._live = {}
+        self._layout = False
+        self._pending_update = False
+        self._cond = threading.Condition()
+
+    def put(self, event):
+        with self._cond:
+            if event.get('type') == 'update':
+                live = event.get('live', {})
+                for component_id, version in event.get('components', {}).items():
+                    if component_id in live and (component_id not in self._components or component_id in self._live):
+                        self._live[component_id] = live[component_id]
+                    else:
+                        self._live.pop(component_id, None)  # the browser has to fetch it anyway
+                    self._components[component_id] = version
+                self._layout = self._layout or event.get('layout', False)
+                self._pending_update = True
+            else:
+                if len(self._notifications) == self._notifications.maxlen:
+                    self.dropped += 1
+                self._notifications.append(event)
+            self._cond.notify()
+
+    def get(self, timeout):
+        """Waits for queued events and returns them all, [] on timeout"""
+        with self._cond:
+            if not self._notifications and not self._pending_update and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._notifications)
+            self._notifications.clear()
+            if self._pending_update:
+                events.append({'type': 'update', 'dashboard_id': self.dash_id,
+                               'components': self._components, 'live': self._live, 'layout': self._layout})
+                self._components, self._live, self._layout, self._pending_update = {}, {}, False, False
+            return events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class LiveHub:
+    """Routes events pushed by the backend to the browsers streaming a dashboard.
+
+    Each pooled backend session belongs to one user, so events are routed per (dashboard, user) and
+    every browser gets each event once. Notifications for users without an open stream are kept in
+    a small mailbox that the polling fallback drains.
+    """
+
+    def __init__(self, queue_size=32, mailbox_size=20, keepalive=15):
+        self.queue_size = queue_size
+        self.mailbox_size = mailbox_size
+        self.keepalive = keepalive  # seconds between comment lines on an idle stream
+        self._subscribers = {}  # (dash_id, username) -> set of Subscriber
+        self._mailboxes = {}  # (dash_id, username) -> deque of notification messages
+        self._lock = threading.Lock()
+
+    def subscribe(self, dash_id, username):
+        key = (str(dash_id), username)
+        subscriber = Subscriber(key[0], username, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscriber)
+            for event in self._mailboxes.pop(key, ()):
+                subscriber.put(event)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        key = (subscriber.dash_id, subscriber.username)
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[key]
+
+    def publish(self, dash_id, username, event):
+        """Called from the connection pool thread for every event a user's session receives"""
+        key = (str(dash_id), username)
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+            if not subscribers and event.get('type') == 'notification':
+                self._mailboxes.setdefault(key, deque(maxlen=self.mailbox_size)).append(event)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def drain(self, dash_id, username):
+        """Notification messages queued for a user without an open stream"""
+        with self._lock:
+            return [event.get('message') for event in self._mailboxes.pop((str(dash_id), username), ())]
+
+    def stats(self):
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+            return {
+                'streams': len(subscribers),
+                'dropped': sum(s.dropped for s in subscribers),
+                'mailboxes': len(self._mailboxes),
+            }
+
+
+def format_event(event):
+    """Server-sent event frame for one event dict"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+hub = LiveHub()
@@ -1,6 +1,8 @@
 import websockets
 import json
 import asyncio
+import itertools
+from collections import OrderedDict
 from websockets.exceptions import WebSocketException
 from typing import Callable, Optional
 from django.http import HttpRequest
@@ -16,7 +18,9 @@ class DashboardClient:
         self._lock = asyncio.Lock()
         self._notification_handler: Optional[Callable] = None
         self._listener_task = None
-        self._command_response_queue = asyncio.Queue()
+        # request id -> future of the reply; replies without an id resolve the oldest request
+        self._command_response_queue = OrderedDict()
+        self._request_ids = itertools.count(1)
 
     async def ensure_connection(self):
         async with self._lock:
@@ -29,7 +33,7 @@ class DashboardClient:
                     )
                     self._connected = True
                     # Start the notification listener when connection is established
-                    if not self._listener_task:
+                    if not self._listener_task or self._listener_task.done():
                         self._listener_task = asyncio.create_task(self._listen_for_messages())
                 except Exception as e:
                     self._connected = False
@@ -39,14 +43,21 @@ class DashboardClient:
     async def send_command(self, command, args=None):
         try:
             await self.ensure_connection()
+            request_id = next(self._request_ids)
             cmd = {
+                'id': request_id,
                 'method': command,
                 'data': args or {}
             }
 
-            await self.wsock.send(json.dumps(cmd))
-            # Wait for the response from the queue instead of directly from websocket
-            response = await self._command_response_queue.get()
+            future = asyncio.get_running_loop().create_future()
+            self._command_response_queue[request_id] = future
+            try:
+                await self.wsock.send(json.dumps(cmd))
+                # The listener resolves the future when the reply carrying our id arrives
+                response = await future
+            finally:
+                self._command_response_queue.pop(request_id, None)
 
             try:
                 return json.loads(response) if isinstance(response, str) else response
@@ -66,6 +77,41 @@ class DashboardClient:
                 'message': str(e)
             }
 
+    async def send_batch(self, commands):
+        """Sends [(command, args), ...] in one message, returns the list of responses in order"""
+        response = await self.send_command('batch', {
+            'commands': [{'method': command, 'data': args or {}} for command, args in commands]
+        })
+        if response.get('status') != 'success':
+            return [response] * len(commands)
+        return response['data']
+
+    async def ping(self, timeout=5):
+        """Health check: True if the server answers a websocket ping in time"""
+        if not self.wsock or not self._connected:
+            return False
+        try:
+            pong = await self.wsock.ping()
+            await asyncio.wait_for(pong, timeout)
+            return True
+        except Exception:
+            self._connected = False
+            return False
+
+    def _resolve(self, data, message):
+        """Hands a command reply to the request waiting for it"""
+        request_id = data.get('id') if isinstance(data, dict) else None
+        future = self._command_response_queue.get(request_id)
+        if future is None and self._command_response_queue:
+            future = next(iter(self._command_response_queue.values()))  # server without request ids
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    def _fail_pending(self, error):
+        for future in self._command_response_queue.values():
+            if not future.done():
+                future.set_exception(error)
+
     def set_notification_handler(self, handler: Callable):
         """Set the callback function to handle notifications"""
         self._notification_handler = handler
@@ -78,26 +124,20 @@ class DashboardClient:
                     message = await self.wsock.recv()
                     try:
                         data = json.loads(message)
-                        # If it's a notification, send it to the notification handler
-                        if isinstance(data, dict) and data.get('type') == 'notification':
-                            from .views import notifications
-                            global notifications
-                            for key, val in notifications.items():
-                                if data.get("user") != key:
-                                    notifications[key].append(data.get("message"))
-
-                            print("çalıştı")
+                        # Notifications and state updates pushed by the server go to the handler
+                        if isinstance(data, dict) and data.get('type') in ('notification', 'update'):
                             if self._notification_handler:
                                 await self._notification_handler(data)
                         else:
                             # If it's not a notification, it's a command response
-                            await self._command_response_queue.put(message)
+                            self._resolve(data, message)
                     except json.JSONDecodeError:
                         # If JSON parsing fails, treat it as a command response
-                        await self._command_response_queue.put(message)
-            except WebSocketException:
+                        self._resolve(None, message)
+            except WebSocketException as e:
                 self._connected = False
                 self.wsock = None
+                self._fail_pending(e)
                 break
             except Exception as e:
                 print(f"Error in message listener: {str(e)}")
@@ -0,0 +1,70 @@
+import json
+import socket
+
+
+class TransferError(Exception):
+    def __init__(self, message, reply=None):
+        super().__init__(message)
+        self.reply = reply or {}  # error reply of the transfer server, e.g. the file size
+
+
+def _open(host, port, header, timeout):
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.sendall(json.dumps(header).encode() + b"\n")
+    return sock
+
+
+def _read_header(stream):
+    line = stream.readline(64 * 1024)
+    if not line:
+        raise TransferError("Transfer server closed the connection")
+    reply = json.loads(line)
+    if reply.get("status") != "success":
+        raise TransferError(reply.get("message", "Transfer failed"), reply)
+    return reply
+
+
+class Download:
+    """A file streamed from the backend transfer port, starting at offset"""
+
+    def __init__(self, host, port, ticket, offset=0, chunk_size=64 * 1024, timeout=30):
+        self.chunk_size = chunk_size
+        self._sock = _open(host, port, {"ticket": ticket, "offset": offset}, timeout)
+        self._stream = self._sock.makefile("rb")
+        try:
+            reply = _read_header(self._stream)
+        except Exception:
+            self.close()
+            raise
+        self.size = reply["size"]
+        self.offset = reply["offset"]
+
+    def chunks(self):
+        try:
+            remaining = self.size - self.offset
+            while remaining > 0:
+                chunk = self._stream.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise TransferError("Download ended early")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self._stream.close()
+        self._sock.close()
+
+
+def upload(host, port, ticket, fileobj, offset, length, total=None, chunk_size=64 * 1024, timeout=30):
+    """Streams length bytes of fileobj (from its current position) to be written at offset"""
+    with _open(host, port, {"ticket": ticket, "offset": offset, "length": length, "total": total}, timeout) as sock:
+        sent = 0
+        while sent < length:
+            chunk = fileobj.read(min(chunk_size, length - sent))
+            if not chunk:
+                raise TransferError("Upload source ended early")
+            sock.sendall(chunk)
+            sent += len(chunk)
+        with sock.makefile("rb") as stream:
+            return _read_header(stream)
@@ -8,9 +8,16 @@ urlpatterns = [
     path('dashboard/<str:dash_id>/create-tab/', views.create_tab, name='create_tab'),
     path('dashboard/<str:dash_id>/component/<int:component_id>/trigger/',
          views.trigger_component, name='trigger_component'),
+    path('dashboard/<str:dash_id>/component/<int:component_id>/download/',
+         views.fileshare_download, name='fileshare_download'),
+    path('dashboard/<str:dash_id>/component/<int:component_id>/upload/',
+         views.fileshare_upload, name='fileshare_upload'),
     path('dashboard/<str:dash_id>/detach/', views.detach_dashboard, name='detach_dashboard'),
     path('dashboard/<str:dash_id>/tab/<str:tab_name>/component/create/',
          views.create_component, name='create_component'),
     path('dashboard/<int:dash_id>/data/', views.get_dashboard_data, name='get_dashboard_data'),
+    path('dashboard/<str:dash_id>/events/', views.dashboard_events, name='dashboard_events'),
+    path('stats/render/', views.render_stats, name='render_stats'),
+    path('stats/live/', views.live_stats, name='live_stats'),
     path('logout/', views.logout_view, name='logout'),
 ]
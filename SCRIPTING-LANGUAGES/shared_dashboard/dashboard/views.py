@@ -1,10 +1,17 @@
+import copy
 import pickle
 import json
+from collections import OrderedDict
+from threading import Lock
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from .forms import LoginForm
-from .tcp_client import DashboardClient
-from django.http import JsonResponse
+from .connection_pool import pool
+from .live import hub, format_event
+from .transfer_client import Download, TransferError, upload
+from backend.core.dash import Dash
+from backend.core.rendercache import render_cache
+from django.http import JsonResponse, StreamingHttpResponse
 import asyncio
 from asgiref.sync import sync_to_async
 from django.contrib.sessions.backends.db import SessionStore
@@ -31,212 +38,185 @@ def async_view(view_func):
     return wrapper
 
 
-notifications = {}
-download = False
-current_indexes = {}
+MAX_MIRRORS = 256  # local dashboard copies kept, least recently synced ones go first
+mirrors = OrderedDict()  # dash_id -> (epoch, synced version, local Dash copy)
+mirrors_lock = Lock()
+
+
+async def sync_dashboard(username, dash_id):
+    """Brings the local copy of a dashboard up to date with a 'sync' delta and returns it"""
+    with mirrors_lock:
+        epoch, version, dash = mirrors.get(str(dash_id), (None, 0, None))
+    response = await pool.send(username, 'sync', {'id': dash_id, 'since': version, 'epoch': epoch}, dash_id=dash_id)
+    json_response = response if isinstance(response, dict) else json.loads(response)
+    if json_response.get('status') != 'success':
+        return None
+
+    delta = json_response['data']
+    if delta['epoch'] != epoch or dash is None:
+        if epoch is not None and delta['epoch'] != epoch:
+            render_cache.clear()  # the backend restarted, versions start over
+        dash = Dash(delta['id'], delta.get('name', ''))
+    else:  # other requests may be reading the stored mirror, the delta goes to a copy sharing the components
+        dash = copy.deepcopy(dash, {id(component): component for component in dash.components()})
+    if 'components' in delta:
+        delta['components'] = pickle.loads(delta['components'].encode('latin1'))
+    dash.apply_delta(delta)
+    with mirrors_lock:
+        stored = mirrors.get(str(dash_id))
+        if stored is not None and stored[0] == delta['epoch'] and stored[1] > delta['version']:
+            return stored[2]  # a concurrent request already stored a newer state
+        mirrors[str(dash_id)] = (delta['epoch'], delta['version'], dash)
+        mirrors.move_to_end(str(dash_id))
+        while len(mirrors) > MAX_MIRRORS:
+            mirrors.popitem(last=False)
+    return dash
+
 
 @async_view
 async def create_dashboard(request):
     if request.method == 'POST':
         name = request.POST.get('name')
         username = await sync_to_async(request.session.get)('username', 'default_user')
-        client = DashboardClient(username)
-        try:
-            await client.send_command('USER', {'username': username})
-            await client.send_command('create', {'name': name})
-            return redirect('dashboard_list')
-        finally:
-            await client.disconnect()
+        await pool.send(username, 'create', {'name': name})
     return redirect('dashboard_list')
 
 
 @async_view
 async def dashboard_list(request):
     username = await sync_to_async(request.session.get)('username', 'default_user')
-    client = DashboardClient(username)
-    try:
-        await client.send_command('USER', {'username': username})
-        dashboards_response = await client.send_command('dash', {'action': 'list'})
+    dashboards_response = await pool.send(username, 'dash', {'action': 'list'})
 
-        if isinstance(dashboards_response, dict):
-            dashboards = dashboards_response.get('data', {}).get('dashboards', [])
-        else:
-            try:
-                dashboards_data = json.loads(dashboards_response)
-                dashboards = dashboards_data.get('data', {}).get('dashboards', [])
-            except json.JSONDecodeError:
-                dashboards = []
+    if isinstance(dashboards_response, dict):
+        dashboards = dashboards_response.get('data', {}).get('dashboards', [])
+    else:
+        try:
+            dashboards_data = json.loads(dashboards_response)
+            dashboards = dashboards_data.get('data', {}).get('dashboards', [])
+        except json.JSONDecodeError:
+            dashboards = []
 
-        return await sync_to_async(render)(request, 'dashboard/list.html', {'dashboards': dashboards})
-    finally:
-        await client.disconnect()
+    return await sync_to_async(render)(request, 'dashboard/list.html', {'dashboards': dashboards})
 
 
 @async_view
 async def get_dashboard_data(request, dash_id):
     username = await sync_to_async(request.session.get)('username', 'default_user')
-    client = DashboardClient(username)
-    try:
-        await client.send_command('USER', {'username': username})
-        dashboard_data = await client.send_command('attach', {'id': dash_id})
-
-        json_response = dashboard_data if isinstance(dashboard_data, dict) else json.loads(dashboard_data)
-        dashboard_data = pickle.loads(json_response.get('data').encode('latin1'))
-
-        tabs = []
-        for tab_name, tab in dashboard_data.get_tabs().items():
-            components = []
-            for cols in tab.get_rows():
-                tm = []
-                for component in cols:
-                    if not component:
-                        continue
-                    elif component.name == "FileShare":
-                        tm.append({
-                            'title': component.name,
-                            'views': component.view(),
-                            'id': component.id,
-                            'files': component._get_file_info()
-                        })
-                        global download
-                        if download:
-                            await sync_to_async(save_file)(
-                                component.env["path"] + "/" + component.param["filename"],
-                                component.param["content"]
-                            )
-                            download = False
-                    elif component.name == "DBUpdate":
-                        tm.append({
-                            'title': component.name,
-                            'views': component.view(username),
-                            'id': component.id,
-                            'qry': component.env["query"]
-                        })
-                    elif component.name == "MessageRotate":
-                        if component.id not in current_indexes.keys():
-                            current_indexes[component.id] = 0
-                        else:
-                            component._current_index = current_indexes[component.id]
-                            current_indexes[component.id] += 1
-                        tm.append({
-                            'title': component.name,
-                            'views': component.view(username),
-                            'id': component.id
-                        })
-                    else:
-                        tm.append({
-                            'title': component.name,
-                            'views': component.view(username),
-                            'id': component.id
-                        })
-                components.append(tm)
-            tabs.append({'name': tab_name, 'components': components})
-        global notifications
-        if username not in notifications.keys():
-            notifications[username] = []
-        if len(notifications[username]) != 0:
-            notif = notifications[username][0]
-            notifications[username] = notifications[username][1:]
-            return JsonResponse({
-                'dashboard_id': dash_id,
-                'dashboard_data': {
-                    'name': dashboard_data.name
-                },
-                'tabs': tabs,
-                'notifications': notif
-            })
+    dashboard_data = await sync_dashboard(username, dash_id)
+    if dashboard_data is None:  # a JSON poll, the browser gets an answer it can read instead of a redirect
+        return JsonResponse({'status': 'error', 'message': 'Dashboard could not be synced'}, status=404)
+
+    tabs = []
+    for tab_name, tab in dashboard_data.get_tabs().items():
+        components = []
+        for cols in tab.get_rows():
+            tm = []
+            for component in cols:
+                if not component:
+                    continue
+                elif component.name == "FileShare":
+                    tm.append({
+                        'title': component.name,
+                        'views': render_cache.render(component),
+                        'id': component.id,
+                        'files': component._get_file_info()
+                    })
+                elif component.name == "DBUpdate":
+                    tm.append({
+                        'title': component.name,
+                        'views': render_cache.render(component, username),
+                        'id': component.id,
+                        'qry': component.env["query"]
+                    })
+                else:
+                    tm.append({
+                        'title': component.name,
+                        'views': render_cache.render(component, username),
+                        'id': component.id
+                    })
+            components.append(tm)
+        tabs.append({'name': tab_name, 'components': components})
+    pending = hub.drain(dash_id, username)  # only filled while the browser has no event stream
+    if pending:
         return JsonResponse({
             'dashboard_id': dash_id,
             'dashboard_data': {
                 'name': dashboard_data.name
             },
-            'tabs': tabs
+            'tabs': tabs,
+            'notifications': pending
         })
-    finally:
-        await client.disconnect()
+    return JsonResponse({
+        'dashboard_id': dash_id,
+        'dashboard_data': {
+            'name': dashboard_data.name
+        },
+        'tabs': tabs
+    })
 
 
 @async_view
 async def attach_dashboard(request, dash_id, mess=None):
-    global notifications
     if not hasattr(request, 'session'):
         session_middleware = SessionMiddleware(get_response=request)
         session_middleware.process_request(request)
 
     username = await sync_to_async(request.session.get)('username', 'default_user')
 
-    client = DashboardClient(username)
     try:
-        await client.send_command('USER', {'username': username})
-        dashboard_data = await client.send_command('attach', {'id': dash_id})
-
-        json_response = dashboard_data if isinstance(dashboard_data, dict) else json.loads(dashboard_data)
-        if json_response.get('status') == 'error':
-            return redirect('dashboard_list')
-
-        try:
-            dashboard_data = pickle.loads(json_response.get('data').encode('latin1'))
-        except Exception as e:
-            print("Error at attach_dashboard: ", str(e))
-            return redirect('dashboard_list')
-
-        tabs = []
-        for tab_name, tab in dashboard_data.get_tabs().items():
-            components = []
-            for cols in tab.get_rows():
-                tm = []
-                for component in cols:
-                    if not component:
-                        continue
-                    elif component.name == "FileShare":
-                        tm.append({
-                            'title': component.name,
-                            'views': component.view(username),
-                            'id': component.id,
-                            'files': component._get_file_info()
-                        })
-                        global download
-                        if download:
-                            await sync_to_async(save_file)(
-                                component.env["path"] + "/" + component.param["filename"],
-                                component.param["content"]
-                            )
-                            download = False
-                    elif component.name == "DBUpdate":
-                        tm.append({
-                            'title': component.name,
-                            'views': component.view(username),
-                            'id': component.id,
-                            'qry': component.env["query"]
-                        })
-                    else:
-                        tm.append({
-                            'title': component.name,
-                            'views': component.view(username),
-                            'id': component.id
-                        })
-                components.append(tm)
-            tabs.append({'name': tab_name, 'components': components})
-
-        components_response = await client.send_command('component', {'action': 'list'})
-        json_response = components_response if isinstance(components_response, dict) else json.loads(
-            components_response)
-        components = json_response.get('data', {}).get('components', [])
-
-        context = {
-            'dashboard_id': dash_id,
-            'dashboard_data': dashboard_data,
-            'tabs': tabs,
-            'components': components,
-        }
-        if username not in notifications.keys():
-            notifications[username] = []
-        if len(notifications[username]) != 0:
-            context['notification'] = notifications[username][0]
-            notifications[username] = notifications[username][1:]
-        return await sync_to_async(render)(request, 'dashboard/view.html', context)
-    finally:
-        await client.disconnect()
+        # both commands are pipelined on the dashboard session and answered concurrently
+        dashboard_data, components_response = await asyncio.gather(
+            sync_dashboard(username, dash_id),
+            pool.send(username, 'component', {'action': 'list'}, dash_id=dash_id)
+        )
+    except Exception as e:
+        print("Error at attach_dashboard: ", str(e))
+        return redirect('dashboard_list')
+    if dashboard_data is None:
+        return redirect('dashboard_list')
+
+    tabs = []
+    for tab_name, tab in dashboard_data.get_tabs().items():
+        components = []
+        for cols in tab.get_rows():
+            tm = []
+            for component in cols:
+                if not component:
+                    continue
+                elif component.name == "FileShare":
+                    tm.append({
+                        'title': component.name,
+                        'views': render_cache.render(component, username),
+                        'id': component.id,
+                        'files': component._get_file_info()
+                    })
+                elif component.name == "DBUpdate":
+                    tm.append({
+                        'title': component.name,
+                        'views': render_cache.render(component, username),
+                        'id': component.id,
+                        'qry': component.env["query"]
+                    })
+                else:
+                    tm.append({
+                        'title': component.name,
+                        'views': render_cache.render(component, username),
+                        'id': component.id
+                    })
+            components.append(tm)
+        tabs.append({'name': tab_name, 'components': components})
+
+    json_response = components_response if isinstance(components_response, dict) else json.loads(
+        components_response)
+    components = json_response.get('data', {}).get('components', [])
+
+    context = {
+        'dashboard_id': dash_id,
+        'dashboard_data': dashboard_data,
+        'tabs': tabs,
+        'components': components,
+    }
+    return await sync_to_async(render)(request, 'dashboard/view.html', context)
 
 
 @async_view
@@ -244,139 +224,218 @@ async def create_tab(request, dash_id):
     if request.method == 'POST':
         tab_name = request.POST.get('tab_name')
         username = await sync_to_async(request.session.get)('username', 'default_user')
-        client = DashboardClient(username)
-        try:
-            await client.send_command('USER', {'username': username})
-            await client.send_command('attach', {'id': dash_id})
-            await client.send_command('dash', {'action': 'create tab', 'name': tab_name})
-            return redirect('attach_dashboard', dash_id=dash_id)
-        finally:
-            await client.disconnect()
+        await pool.send(username, 'dash', {'action': 'create tab', 'name': tab_name}, dash_id=dash_id)
     return redirect('attach_dashboard', dash_id=dash_id)
 
 
 @async_view
 async def trigger_component(request, dash_id, component_id):
-    global download
     if request.method == 'POST':
         username = await sync_to_async(request.session.get)('username', 'default_user')
-        client = DashboardClient(username)
-        try:
-            await client.send_command('USER', {'username': username})
-            await client.send_command('attach', {'id': dash_id})
-
-            params = {k: v for k, v in request.POST.items() if k != 'csrfmiddlewaretoken'}
-            await client.send_command('component', {
-                'action': 'trigger',
-                'id': component_id,
-                'event': params.get('event'),
-                'params': params
-            })
-
-            if params.get('event') == "download":
-                download = True
-            return redirect('attach_dashboard', dash_id=dash_id)
-        finally:
-            await client.disconnect()
-
-
-def save_file(path, content):
-    with open(path, 'w') as file:
-        file.write(content)
+        params = {k: v for k, v in request.POST.items() if k != 'csrfmiddlewaretoken'}
+        await pool.send(username, 'component', {
+            'action': 'trigger',
+            'id': component_id,
+            'event': params.get('event'),
+            'params': params
+        }, dash_id=dash_id)
+        return redirect('attach_dashboard', dash_id=dash_id)
 
 
 @async_view
 async def detach_dashboard(request, dash_id):
     if request.method == 'POST':
         username = await sync_to_async(request.session.get)('username', 'default_user')
-        client = DashboardClient(username)
-        try:
-            await client.send_command('detach', {'id': dash_id})
-            return redirect('dashboard_list')
-        finally:
-            await client.disconnect()
+        await pool.release(username, dash_id)  # closing the pooled session detaches it
+        return redirect('dashboard_list')
 
 
 @async_view
 async def create_component(request, dash_id, tab_name):
     username = await sync_to_async(request.session.get)('username', 'default_user')
-    client = DashboardClient(username)
 
     if request.method == 'POST':
+        component_type = request.POST.get('type')
+        env_vars = {}
+
+        for key, value in request.POST.items():
+            if key.startswith('env_vars[') and key.endswith('[key]'):
+                index = key.split('[')[1].split(']')[0]
+                if value == "messages":
+                    message_value = request.POST.get(f'env_vars[{index}][value]')
+                    if message_value:
+                        try:
+                            message_value = message_value.split(",")
+                            for m in message_value:
+                                env_vars["messages"].append(m)
+                        except KeyError:
+                            env_vars["messages"] = message_value
+                elif value == "filename":
+                    path_value = request.POST.get(f'env_vars[{index}][value]')
+                    env_vars["filename"] = path_value
+                elif value == "url":
+                    val = request.POST.get(f'env_vars[{index}][value]')
+                    env_vars["url"] = val if val else ""
+                elif value == "path":
+                    path_value = request.POST.get(f'env_vars[{index}][value]')
+                    env_vars["path"] = path_value if path_value else ""
+                elif value == "query":
+                    query_value = request.POST.get(f'env_vars[{index}][value]')
+                    env_vars["query"] = query_value if query_value else ""
+
+        # creating with a position places the component in the same round trip
+        await pool.send(username, 'component', {
+            'action': 'create',
+            'type': component_type,
+            'env': env_vars,
+            'tab_name': tab_name,
+            'row': int(request.POST.get('row', 0)),
+            'col': int(request.POST.get('col', -1))
+        }, dash_id=dash_id)
+
+        return redirect('attach_dashboard', dash_id=dash_id)
+
+    response = await pool.send(username, 'component', {'action': 'list'})
+
+    json_response = response if isinstance(response, dict) else json.loads(response)
+    components = json_response.get('data', {}).get('components', [])
+
+    return await sync_to_async(render)(request, 'dashboard/create_component.html', {
+        'dash_id': dash_id,
+        'tab_name': tab_name,
+        'components': components
+    })
+
+
+def dashboard_events(request, dash_id):
+    """Server-sent event stream of the updates and notifications of a dashboard.
+
+    A plain generator so it also streams under WSGI. The pooled backend session stays attached while
+    the stream is open and the backend pushes to it; nothing is sent to the backend while idle.
+    """
+    username = request.session.get('username', 'default_user')
+    try:
+        pool.watch(username, dash_id)
+    except Exception as e:
+        print("Error at dashboard_events: ", str(e))
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=503)
+
+    def stream():
+        subscriber = hub.subscribe(dash_id, username)
         try:
-            await client.send_command('USER', {'username': username})
-            await client.send_command('attach', {'id': dash_id})
-
-            component_type = request.POST.get('type')
-            env_vars = {}
-
-            for key, value in request.POST.items():
-                if key.startswith('env_vars[') and key.endswith('[key]'):
-                    index = key.split('[')[1].split(']')[0]
-                    if value == "messages":
-                        message_value = request.POST.get(f'env_vars[{index}][value]')
-                        if message_value:
-                            try:
-                                message_value = message_value.split(",")
-                                for m in message_value:
-                                    env_vars["messages"].append(m)
-                            except KeyError:
-                                env_vars["messages"] = message_value
-                    elif value == "filename":
-                        path_value = request.POST.get(f'env_vars[{index}][value]')
-                        env_vars["filename"] = path_value
-                    elif value == "url":
-                        val = request.POST.get(f'env_vars[{index}][value]')
-                        env_vars["url"] = val if val else ""
-                    elif value == "path":
-                        path_value = request.POST.get(f'env_vars[{index}][value]')
-                        env_vars["path"] = path_value if path_value else ""
-                    elif value == "query":
-                        query_value = request.POST.get(f'env_vars[{index}][value]')
-                        env_vars["query"] = query_value if query_value else ""
-
-            response = await client.send_command('component', {
-                'action': 'create',
-                'type': component_type,
-                'env': env_vars
-            })
-
-            json_response = response if isinstance(response, dict) else json.loads(response)
-            comp_id = json_response.get('data', {}).get('id')
-
-            if not comp_id:
-                return redirect('attach_dashboard', dash_id=dash_id)
-
-            row = int(request.POST.get('row', 0))
-            col = int(request.POST.get('col', -1))
-
-            await client.send_command('tab', {
-                'action': 'place',
-                'tab_name': tab_name,
-                'row': row,
-                'col': col,
-                'comp_id': comp_id
-            })
-
-            return redirect('attach_dashboard', dash_id=dash_id)
+            yield "retry: 3000\n\n"
+            while not subscriber.closed:
+                events = subscriber.get(hub.keepalive)
+                if not events:
+                    if not pool.alive(username, dash_id):
+                        break  # the browser reconnects and gets a fresh session
+                    yield ": keepalive\n\n"
+                for event in events:
+                    yield format_event(event)
         finally:
-            await client.disconnect()
-
+            hub.unsubscribe(subscriber)
+            pool.unwatch(username, dash_id)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _transfer_ticket(username, dash_id, component_id, direction, filename, restart=False):
+    response = pool.send_sync(username, 'component', {
+        'action': 'transfer',
+        'id': component_id,
+        'direction': direction,
+        'filename': filename,
+        'restart': restart
+    }, dash_id=dash_id)
+    response = response if isinstance(response, dict) else json.loads(response)
+    if response.get('status') != 'success':
+        raise TransferError(response.get('message', 'Transfer refused'))
+    return response['data']
+
+
+def _range_not_satisfiable(size):
+    response = JsonResponse({'status': 'error', 'message': 'Requested range not satisfiable'}, status=416)
+    response['Content-Range'] = f'bytes */{size}'
+    return response
+
+
+def fileshare_download(request, dash_id, component_id):
+    """Streams a shared file from the backend transfer port, resumable with a Range header"""
+    username = request.session.get('username', 'default_user')
+    filename = request.GET.get('filename', '')
+    offset = 0
+    byte_range = request.headers.get('Range', '')
+    if byte_range.startswith('bytes=') and byte_range[6:].split('-')[0].isdigit():
+        offset = int(byte_range[6:].split('-')[0])
     try:
-        await client.send_command('USER', {'username': username})
-        await client.send_command('attach', {'id': dash_id})
-        response = await client.send_command('component', {'action': 'list'})
+        ticket = _transfer_ticket(username, dash_id, component_id, 'download', filename)
+        download = Download(pool.host, ticket['port'], ticket['ticket'], offset)
+    except TransferError as e:
+        if 'size' in e.reply:  # offset past the end of the file
+            return _range_not_satisfiable(e.reply['size'])
+        print("Error at fileshare_download: ", str(e))
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=404)
+    except OSError as e:
+        print("Error at fileshare_download: ", str(e))
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=404)
+    if offset and offset >= download.size:
+        download.close()
+        return _range_not_satisfiable(download.size)
+
+    response = StreamingHttpResponse(download.chunks(), status=206 if offset else 200,
+                                     content_type='application/octet-stream')
+    response['Content-Length'] = str(download.size - download.offset)
+    response['Accept-Ranges'] = 'bytes'
+    if offset:
+        response['Content-Range'] = f'bytes {offset}-{download.size - 1}/{download.size}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def fileshare_upload(request, dash_id, component_id):
+    """Streams an uploaded file to the backend transfer port.
+
+    Django spools large uploads to a temporary file, which is sent on in chunks. A broken transfer is
+    retried from the offset the backend already has. Browsers may also send a file in slices with
+    offset and total fields, a slice then continues the partial upload of the previous ones.
+    """
+    if request.method != 'POST' or 'file' not in request.FILES:
+        return redirect('attach_dashboard', dash_id=dash_id)
+    username = request.session.get('username', 'default_user')
+    uploaded = request.FILES['file']
+    filename = request.POST.get('filename') or uploaded.name
+    offset = int(request.POST.get('offset', 0))
+    total = int(request.POST.get('total', offset + uploaded.size))
+    reply = {'status': 'error', 'message': 'Upload failed'}
+    for attempt in range(3):
+        try:
+            ticket = _transfer_ticket(username, dash_id, component_id, 'upload', filename,
+                                      restart=offset == 0 and attempt == 0)
+            skip = ticket['offset'] - offset  # bytes of this request the backend already has
+            if not 0 <= skip <= uploaded.size:
+                reply = {'status': 'error', 'message': 'Offset mismatch', 'offset': ticket['offset']}
+                break
+            uploaded.seek(skip)
+            reply = upload(pool.host, ticket['port'], ticket['ticket'], uploaded, ticket['offset'],
+                           uploaded.size - skip, total)
+            break
+        except (TransferError, OSError) as e:
+            print("Error at fileshare_upload: ", str(e))
+            reply = {'status': 'error', 'message': str(e)}
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse(reply, status=200 if reply.get('status') == 'success' else 409)
+    return redirect('attach_dashboard', dash_id=dash_id)
 
-        json_response = response if isinstance(response, dict) else json.loads(response)
-        components = json_response.get('data', {}).get('components', [])
 
-        return await sync_to_async(render)(request, 'dashboard/create_component.html', {
-            'dash_id': dash_id,
-            'tab_name': tab_name,
-            'components': components
-        })
-    finally:
-        await client.disconnect()
+async def render_stats(request):
+    return JsonResponse(render_cache.stats())
+
+
+async def live_stats(request):
+    return JsonResponse({'hub': hub.stats(), 'pool': pool.stats()})
 
 
 @async_view